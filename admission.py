@@ -0,0 +1,349 @@
+"""
+Contrôle d'admission et ordonnancement équitable de l'OCR
+
+- Délestage : les OCR d'un worker passent par un nombre fixe de créneaux
+  (capacity). L'attente d'un nouvel OCR est estimée à partir du travail qui
+  passera avant lui et du temps moyen par page mesuré (moyenne mobile
+  exponentielle). Si l'attente plus le traitement dépassent le SLO de
+  latence, la requête est refusée tout de suite (503 + Retry-After) au lieu
+  de s'empiler jusqu'au timeout du client.
+- Équité : une file par tenant (get_client_identifier), servies en weighted
+  fair queueing selon le poids OCR du plan (PLAN_LIMITS). Une facture isolée
+  d'un client BASIC passe avant le millier de PDF en file d'un client ULTRA ;
+  entre tenants chargés, le débit est partagé au prorata des poids.
+
+Seuls les OCR réels passent par ici : les résultats en cache et les endpoints
+sans OCR sont toujours admis.
+"""
+
+import asyncio
+import heapq
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from monitoring import log_ocr_shed, time_stage
+from rate_limiting import PLAN_LIMITS
+
+DEFAULT_CAPACITY = os.cpu_count() or 2  # Un Tesseract par cœur
+DEFAULT_LATENCY_SLO_SECONDS = 30.0  # Aligné sur le timeout OCR annoncé aux clients
+DEFAULT_SECONDS_PER_PAGE = 2.0  # Estimation initiale, affinée par les mesures
+EWMA_ALPHA = 0.2  # Poids de la dernière mesure du temps par page
+MAX_TRACKED_TENANTS = 1000  # Tenants inactifs au-delà : statistiques évincées (les plus anciens)
+INTERNAL_TENANT = "internal"  # OCR hors requête client (prewarm)
+
+
+def get_plan_weight(plan: Optional[str]) -> float:
+    """Poids OCR du plan (1 si plan inconnu)"""
+    return PLAN_LIMITS.get(plan or "", {}).get("ocr_weight", 1)
+
+
+class OCROverloadedError(HTTPException):
+    """Erreur 503 - OCR saturé, réessayer après Retry-After secondes"""
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Service OCR saturé, réessayer dans {retry_after} s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.retry_after = retry_after
+
+
+class _Job:
+    """OCR en file : étiquettes de temps virtuel de début et de fin"""
+    __slots__ = ("seq", "tenant", "pages", "start", "finish", "enqueued_at", "future")
+
+    def __init__(self, seq: int, tenant: "_TenantQueue", pages: int, start: float, finish: float, enqueued_at: float):
+        self.seq = seq
+        self.tenant = tenant
+        self.pages = pages
+        self.start = start
+        self.finish = finish
+        self.enqueued_at = enqueued_at
+        self.future: Optional[asyncio.Future] = None
+
+
+class _TenantQueue:
+    """File d'un tenant et ses statistiques d'attente"""
+    __slots__ = ("name", "plan", "weight", "jobs", "queued_pages", "last_finish", "running",
+                 "served", "total_wait", "max_wait")
+
+    def __init__(self, name: str, plan: Optional[str], weight: float):
+        self.name = name
+        self.plan = plan
+        self.weight = weight
+        self.jobs: Deque[_Job] = deque()
+        self.queued_pages = 0
+        self.last_finish = 0.0  # Étiquette de fin du dernier OCR mis en file
+        self.running = 0
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "tenant": self.name,
+            "plan": self.plan,
+            "weight": self.weight,
+            "queued": len(self.jobs),
+            "queued_pages": self.queued_pages,
+            "running": self.running,
+            "served": self.served,
+            "avg_wait_seconds": round(self.total_wait / self.served, 3) if self.served else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+        }
+
+
+class AdmissionController:
+    """
+    Créneaux OCR d'un worker, files par tenant en weighted fair queueing
+    et estimation de l'attente pour le délestage
+
+    Chaque OCR reçoit une étiquette de fin virtuelle : début = max(temps
+    virtuel courant, fin du précédent OCR du tenant), fin = début + pages / poids.
+    Un créneau libéré va à l'OCR de plus petite étiquette de fin.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        latency_slo: float = DEFAULT_LATENCY_SLO_SECONDS,
+        seconds_per_page: float = DEFAULT_SECONDS_PER_PAGE,
+        clock=time.monotonic
+    ):
+        self.capacity = max(1, capacity)
+        self.latency_slo = latency_slo
+        self.seconds_per_page = seconds_per_page
+        self.clock = clock
+        self.virtual_time = 0.0
+        self.queued = 0
+        self.queued_pages = 0
+        self.running: Dict[int, tuple] = {}  # seq -> (début, durée estimée)
+        self.admitted = 0
+        self.rejected = 0
+        self._tenants: "OrderedDict[str, _TenantQueue]" = OrderedDict()
+        self._heads: List[tuple] = []  # (fin virtuelle, seq, tenant) de la tête de chaque file
+        self._next_seq = 0
+
+    # ---------- Estimation et délestage ----------
+
+    def estimate_wait(self, tenant: Optional[str] = None, weight: float = 1, pages: int = 0) -> float:
+        """
+        Secondes avant qu'un nouvel OCR obtienne un créneau
+
+        Sans tenant : tout le travail en file passe avant (ordre d'arrivée).
+        Avec tenant : seul le travail dont l'étiquette de fin précède celle du
+        nouvel OCR compte (par tenant, au prorata de son poids).
+        """
+        if len(self.running) + self.queued < self.capacity:
+            return 0.0
+        now = self.clock()
+        remaining = sum(max(0.0, estimate - (now - started)) for started, estimate in self.running.values())
+
+        if tenant is None:
+            pages_ahead = self.queued_pages
+        else:
+            queue = self._tenants.get(tenant)
+            finish = max(self.virtual_time, queue.last_finish if queue else 0.0) + pages / weight
+            pages_ahead = sum(
+                min(other.queued_pages, max(0.0, (finish - other.jobs[0].start) * other.weight))
+                for other in self._tenants.values() if other.jobs
+            )
+        return (remaining + pages_ahead * self.seconds_per_page) / self.capacity
+
+    def check(self, pages: int, tenant: Optional[str] = None, weight: float = 1) -> Optional[int]:
+        """Retry-After en secondes si l'OCR de pages dépasserait le SLO, sinon None"""
+        wait = self.estimate_wait(tenant, weight, pages)
+        overshoot = wait + pages * self.seconds_per_page - self.latency_slo
+        if wait == 0.0 or overshoot <= 0:
+            return None  # Créneau libre : un gros document seul est toujours accepté
+        # Le travail qui passe avant s'écoule à capacity pages-secondes par seconde
+        return max(1, math.ceil(min(overshoot, wait)))
+
+    # ---------- Ordonnancement ----------
+
+    @asynccontextmanager
+    async def slot(self, pages: int = 1, tenant: str = INTERNAL_TENANT, plan: Optional[str] = None):
+        """
+        Réserve un créneau OCR pour pages pages dans la file du tenant, ou lève OCROverloadedError
+
+        Le temps mesuré met à jour l'estimation du temps par page.
+        """
+        pages = max(1, pages)
+        weight = get_plan_weight(plan)
+        retry_after = self.check(pages, tenant, weight)
+        if retry_after is not None:
+            self.rejected += 1
+            log_ocr_shed(retry_after, self.estimate_wait(tenant, weight, pages))
+            raise OCROverloadedError(retry_after)
+
+        self.admitted += 1
+        job = self._enqueue(tenant, plan, weight, pages)
+        self._dispatch()
+        try:
+            with time_stage("ocr_queue"):
+                await job.future
+        except asyncio.CancelledError:
+            if job.future.done() and not job.future.cancelled():
+                self._finish(job)  # Créneau accordé pendant l'annulation
+            else:
+                self._cancel(job)
+            raise
+
+        started = self.running[job.seq][0]
+        try:
+            yield
+        finally:
+            self._finish(job)
+            elapsed = self.clock() - started
+            self.seconds_per_page += EWMA_ALPHA * (elapsed / pages - self.seconds_per_page)
+
+    def _tenant(self, name: str, plan: Optional[str], weight: float) -> _TenantQueue:
+        queue = self._tenants.get(name)
+        if queue is None:
+            queue = self._tenants[name] = _TenantQueue(name, plan, weight)
+            if len(self._tenants) > MAX_TRACKED_TENANTS:
+                self._evict_idle()
+        else:
+            self._tenants.move_to_end(name)
+            queue.plan, queue.weight = plan, weight
+        return queue
+
+    def _evict_idle(self):
+        for name, queue in self._tenants.items():
+            if not queue.jobs and not queue.running:
+                del self._tenants[name]
+                return
+
+    def _enqueue(self, tenant: str, plan: Optional[str], weight: float, pages: int) -> _Job:
+        queue = self._tenant(tenant, plan, weight)
+        start = max(self.virtual_time, queue.last_finish)
+        job = _Job(self._next_seq, queue, pages, start, start + pages / weight, self.clock())
+        # Créée dans la boucle en cours : le contrôleur est construit à l'import, hors boucle
+        # (une primitive asyncio créée là serait liée à la mauvaise boucle sous Python 3.9)
+        job.future = asyncio.get_running_loop().create_future()
+        self._next_seq += 1
+        queue.last_finish = job.finish
+        queue.jobs.append(job)
+        queue.queued_pages += pages
+        self.queued += 1
+        self.queued_pages += pages
+        if len(queue.jobs) == 1:
+            heapq.heappush(self._heads, (job.finish, job.seq, queue))
+        return job
+
+    def _dispatch(self):
+        """Attribue les créneaux libres aux OCR de plus petite étiquette de fin"""
+        while len(self.running) < self.capacity and self._heads:
+            _, seq, queue = heapq.heappop(self._heads)
+            if not queue.jobs or queue.jobs[0].seq != seq:
+                continue  # Tête annulée depuis
+            job = queue.jobs.popleft()
+            self._unqueue(job)
+            if queue.jobs:
+                heapq.heappush(self._heads, (queue.jobs[0].finish, queue.jobs[0].seq, queue))
+
+            now = self.clock()
+            wait = now - job.enqueued_at
+            queue.served += 1
+            queue.total_wait += wait
+            queue.max_wait = max(queue.max_wait, wait)
+            queue.running += 1
+            self.virtual_time = max(self.virtual_time, job.start)
+            self.running[job.seq] = (now, job.pages * self.seconds_per_page)
+            job.future.set_result(None)
+
+    def _unqueue(self, job: _Job):
+        job.tenant.queued_pages -= job.pages
+        self.queued -= 1
+        self.queued_pages -= job.pages
+
+    def _cancel(self, job: _Job):
+        """Retire un OCR annulé (client déconnecté) de sa file"""
+        queue = job.tenant
+        was_head = queue.jobs[0] is job
+        queue.jobs.remove(job)
+        self._unqueue(job)
+        if was_head and queue.jobs:
+            heapq.heappush(self._heads, (queue.jobs[0].finish, queue.jobs[0].seq, queue))
+
+    def _finish(self, job: _Job):
+        del self.running[job.seq]
+        job.tenant.running -= 1
+        self._dispatch()
+
+    # ---------- Métriques ----------
+
+    def tenant_stats(self, limit: int = 50) -> List[Dict]:
+        """Files par tenant, les plus chargées d'abord (pour régler les poids des plans)"""
+        queues = sorted(
+            self._tenants.values(),
+            key=lambda queue: (len(queue.jobs), queue.running, queue.total_wait),
+            reverse=True
+        )
+        return [queue.stats() for queue in queues[:limit]]
+
+    def plan_stats(self) -> Dict[str, Dict]:
+        """Profondeur de file et attente agrégées par plan"""
+        plans: Dict[str, Dict] = {}
+        for queue in self._tenants.values():
+            entry = plans.setdefault(queue.plan or "unknown", {
+                "weight": queue.weight, "tenants": 0, "queued": 0, "running": 0,
+                "served": 0, "total_wait": 0.0, "max_wait_seconds": 0.0,
+            })
+            entry["tenants"] += 1
+            entry["queued"] += len(queue.jobs)
+            entry["running"] += queue.running
+            entry["served"] += queue.served
+            entry["total_wait"] += queue.total_wait
+            entry["max_wait_seconds"] = round(max(entry["max_wait_seconds"], queue.max_wait), 3)
+        for entry in plans.values():
+            total_wait = entry.pop("total_wait")
+            entry["avg_wait_seconds"] = round(total_wait / entry["served"], 3) if entry["served"] else 0.0
+        return plans
+
+    def info(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "latency_slo_seconds": self.latency_slo,
+            "running": len(self.running),
+            "queued": self.queued,
+            "estimated_wait_seconds": round(self.estimate_wait(), 2),
+            "seconds_per_page": round(self.seconds_per_page, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "plans": self.plan_stats(),
+        }
+
+
+_controller = AdmissionController()
+
+
+def init_admission_control(
+    capacity: Optional[int] = None,
+    latency_slo: float = DEFAULT_LATENCY_SLO_SECONDS
+) -> AdmissionController:
+    """
+    Configure le contrôle d'admission de ce worker
+
+    Args:
+        capacity: OCR simultanés (défaut : nombre de cœurs)
+        latency_slo: Attente + traitement maximum avant refus (secondes)
+    """
+    global _controller
+    _controller = AdmissionController(capacity or DEFAULT_CAPACITY, latency_slo)
+    return _controller
+
+
+def get_admission_controller() -> AdmissionController:
+    return _controller
+
+
+def get_admission_info() -> Dict:
+    """État du contrôle d'admission (pour /health), agrégé par plan"""
+    return _controller.info()
@@ -0,0 +1,3 @@
+"""
+Benchmarks de performance pour l'API OCR Facture
+"""
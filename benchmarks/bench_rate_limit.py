@@ -0,0 +1,132 @@
+"""
+Benchmark du rate limiting : requêtes/s à travers rate_limit_middleware
+
+Chaque requête passe par le middleware complet (3 fenêtres IP + quotas
+mensuel et quotidien du plan) jusqu'à un handler vide. Mesure le débit, la
+latence et le nombre de commandes Redis par requête, et vérifie qu'aucun
+incrément n'est perdu sous concurrence (compteur final == requêtes acceptées).
+
+Usage:
+    python benchmarks/bench_rate_limit.py --requests 5000 --concurrency 100 --latency-ms 0.5
+    python benchmarks/bench_rate_limit.py --redis-url redis://localhost:6379  # vrai Redis
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import redis_pool
+import rate_limiting
+from benchmarks.redis_standin import RedisStandIn
+
+CLIENTS = 200  # Nombre d'IP distinctes
+
+
+def _request(i: int) -> Request:
+    client = i % CLIENTS
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/ocr/upload",
+        "query_string": b"",
+        "headers": [(b"x-rapidapi-plan", b"MEGA"), (b"x-rapidapi-proxy-secret", f"key-{client}".encode())],
+        "client": (f"10.0.{client // 250}.{client % 250}", 50000),
+        "server": ("bench", 80),
+        "scheme": "http",
+    }
+    return Request(scope)
+
+
+async def _call_next(request: Request) -> Response:
+    return Response(b"{}", media_type="application/json")
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _run(backend: str, redis_url: str, total: int, concurrency: int, standin: RedisStandIn = None) -> dict:
+    rate_limiting._memory_store.clear()
+    if backend == "redis":
+        redis_pool.init_redis_pool(redis_url, max_connections=concurrency)
+        rate_limiting.init_rate_limit_redis(redis_url)
+        await redis_pool.get_redis_client().flushdb()
+    else:
+        rate_limiting.init_rate_limit_redis(None)
+        rate_limiting._redis_enabled = False
+
+    commands_before = standin.commands_processed if standin else 0
+    latencies: List[float] = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await rate_limiting.rate_limit_middleware(_request(i), _call_next)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    # Compteur IP minute du premier client : doit égaler le nombre de requêtes acceptées pour cette IP
+    probe = rate_limiting.get_ip_windows(_request(0))[0]
+    _, [state] = await rate_limiting.consume_rate_limits([probe], cost=0)
+    accepted_first_ip = min(total // CLIENTS + (1 if total % CLIENTS else 0), probe.limit)
+
+    commands = (standin.commands_processed - commands_before) if standin else None
+    if backend == "redis":
+        await redis_pool.close_redis_pool()
+
+    return {
+        "backend": backend,
+        "rps": total / elapsed,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "commands_per_request": (commands / total) if commands is not None else None,
+        "statuses": statuses,
+        "counter_ok": state["count"] == accepted_first_ip,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Latence simulée par commande (stand-in)")
+    parser.add_argument("--redis-url", default=None, help="Utiliser un vrai Redis au lieu du stand-in")
+    args = parser.parse_args()
+
+    standin = None
+    redis_url = args.redis_url
+    if not redis_url:
+        standin = RedisStandIn(latency_ms=args.latency_ms).start()
+        redis_url = standin.url
+
+    try:
+        print(f"{'backend':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'cmd/req':>10}{'compteur':>10}  statuts")
+        for backend in ("memory", "redis"):
+            result = asyncio.run(_run(backend, redis_url, args.requests, args.concurrency, standin))
+            commands = f"{result['commands_per_request']:.2f}" if result["commands_per_request"] is not None else "-"
+            print(
+                f"{result['backend']:<10}{result['rps']:>10.0f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{commands:>10}{'ok' if result['counter_ok'] else 'PERDU':>10}  {result['statuses']}"
+            )
+    finally:
+        if standin:
+            standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Simulation : rafales admises par chaque algorithme de rate limiting (fixed, sliding, gcra)
+
+Horloge simulée sur le store mémoire (même sémantique que le script Redis) :
+aucune attente réelle. Pour chaque profil de client, mesure le nombre de
+requêtes acceptées, le pic sur 1 s et le pic sur n'importe quelle fenêtre
+glissante de 60 s, comparés à la limite par minute du plan.
+
+Profils :
+- edge : une requête en début de fenêtre, puis 2x limit juste avant et juste après sa réinitialisation
+- greedy : envoi continu (une requête toutes les 100 ms)
+- bursty : rafales aléatoires de 1 à 3x la limite
+
+Usage:
+    python benchmarks/bench_rate_limit_algorithms.py --plan PRO --minutes 10
+"""
+
+import argparse
+import os
+import random
+import sys
+from bisect import bisect_left
+from typing import Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiting import PLAN_LIMITS, RATE_LIMIT_ALGORITHMS, MemoryRateLimitStore, RateWindow
+
+STEP_MS = 100
+
+
+def _edge(duration_ms: int, limit: int, rng: random.Random) -> Iterator[int]:
+    for minute in range(0, duration_ms, 120_000):
+        yield minute
+        # 2x limit juste avant puis juste après la fin de la fenêtre ouverte à `minute`
+        yield from (minute + 59_900 for _ in range(2 * limit))
+        yield from (minute + 60_100 for _ in range(2 * limit))
+
+
+def _greedy(duration_ms: int, limit: int, rng: random.Random) -> Iterator[int]:
+    yield from range(0, duration_ms, STEP_MS)
+
+
+def _bursty(duration_ms: int, limit: int, rng: random.Random) -> Iterator[int]:
+    t = 0
+    while t < duration_ms:
+        yield from (t for _ in range(rng.randint(limit, 3 * limit)))
+        t += rng.randint(5_000, 90_000)
+
+
+PROFILES = {"edge": _edge, "greedy": _greedy, "bursty": _bursty}
+
+
+def _peak(accepted: List[int], span_ms: int) -> int:
+    """Maximum de requêtes acceptées dans une fenêtre glissante de span_ms"""
+    return max((i - bisect_left(accepted, t - span_ms + 1) + 1 for i, t in enumerate(accepted)), default=0)
+
+
+def simulate(algorithm: str, profile: str, limit: int, burst: int, duration_ms: int, seed: int = 1) -> dict:
+    now = [0]
+    store = MemoryRateLimitStore(clock=lambda: now[0])
+    window = RateWindow("client:minute", limit, 60, algorithm, burst)
+    accepted = []
+    sent = 0
+    for now[0] in PROFILES[profile](duration_ms, limit, random.Random(seed)):
+        sent += 1
+        denied, _, _, _ = store.consume([window])
+        if not denied:
+            accepted.append(now[0])
+    return {
+        "sent": sent,
+        "accepted": len(accepted),
+        "peak_1s": _peak(accepted, 1_000),
+        "peak_60s": _peak(accepted, 60_000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plan", default="PRO", choices=list(PLAN_LIMITS))
+    parser.add_argument("--minutes", type=int, default=10)
+    args = parser.parse_args()
+
+    limit = PLAN_LIMITS[args.plan]["per_minute"]
+    burst = PLAN_LIMITS[args.plan].get("burst", 0)
+    print(f"Plan {args.plan} : {limit} req/min, burst gcra {burst}, {args.minutes} min simulées\n")
+    print(f"{'profil':<8}{'algo':<9}{'envoyées':>10}{'acceptées':>11}{'pic 1 s':>9}{'pic 60 s':>10}{'pic/limite':>12}")
+    for profile in PROFILES:
+        for algorithm in RATE_LIMIT_ALGORITHMS:
+            result = simulate(algorithm, profile, limit, burst, args.minutes * 60_000)
+            print(
+                f"{profile:<8}{algorithm:<9}{result['sent']:>10}{result['accepted']:>11}"
+                f"{result['peak_1s']:>9}{result['peak_60s']:>10}{result['peak_60s'] / limit:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark de charge : client Redis synchrone vs pool asyncio partagé
+
+Simule N requêtes concurrentes qui font chacune les accès Redis du chemin
+d'une requête OCR (rate limiting IP + plan, lecture cache) contre un
+serveur Redis local de substitution (benchmarks/redis_standin.py).
+
+Usage:
+    python benchmarks/bench_redis_pool.py --requests 2000 --concurrency 50 --latency-ms 1
+    python benchmarks/bench_redis_pool.py --redis-url redis://localhost:6379  # vrai Redis
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List, Optional
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+import redis_pool
+import rate_limiting
+from cache_redis import init_cache_backend, get_cached
+from benchmarks.redis_standin import RedisStandIn
+
+ROUND_TRIPS_PER_REQUEST = 8  # 3 fenêtres IP + mensuel + quotidien (GET/SET) ~ ancien chemin
+
+
+def _fake_request(i: int) -> Mock:
+    request = Mock()
+    request.headers = {"X-RapidAPI-Plan": "MEGA"}
+    request.client = Mock()
+    request.client.host = f"10.0.{i % 250}.{i % 200}"
+    return request
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def _loop_lag_probe(samples: List[float], stop: asyncio.Event, interval: float = 0.005):
+    """Mesure le retard de la boucle asyncio (indicateur d'appels bloquants)"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def _run(mode: str, redis_url: str, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    lag_samples: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    sync_client: Optional[redis.Redis] = None
+
+    if mode == "sync":
+        sync_client = redis.from_url(redis_url, decode_responses=True)
+    else:
+        redis_pool.init_redis_pool(redis_url, max_connections=concurrency)
+        rate_limiting.init_rate_limit_redis(redis_url)
+        init_cache_backend(redis_url=redis_url)
+
+    async def one_request(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            if mode == "sync":
+                # Ancien comportement : appels synchrones dans un handler async
+                for j in range(ROUND_TRIPS_PER_REQUEST // 2):
+                    key = f"bench:{i % 500}:{j}"
+                    sync_client.get(key)
+                    sync_client.set(key, "1", ex=60)
+            else:
+                request = _fake_request(i)
+                await rate_limiting.check_ip_rate_limit(request)
+                await rate_limiting.check_rate_limit(request, limit_type="monthly")
+                await get_cached(f"ocr_result:bench{i % 500}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(lag_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+
+    if sync_client is not None:
+        sync_client.close()
+    await redis_pool.close_redis_pool()
+
+    return {
+        "mode": mode,
+        "rps": total / elapsed,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "loop_lag_max_ms": max(lag_samples) if lag_samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="Latence simulée par commande (stand-in)")
+    parser.add_argument("--redis-url", default=None, help="Utiliser un vrai Redis au lieu du stand-in")
+    args = parser.parse_args()
+
+    standin = None
+    redis_url = args.redis_url
+    if not redis_url:
+        standin = RedisStandIn(latency_ms=args.latency_ms).start()
+        redis_url = standin.url
+
+    try:
+        print(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'lag max ms':>12}")
+        for mode in ("sync", "async-pool"):
+            result = asyncio.run(_run(mode, redis_url, args.requests, args.concurrency))
+            print(
+                f"{result['mode']:<12}{result['rps']:>10.0f}{result['p50_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['loop_lag_max_ms']:>12.2f}"
+            )
+    finally:
+        if standin:
+            standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Serveur Redis minimal (protocoles RESP2/RESP3) pour les benchmarks locaux
+
+Ne remplace pas Redis : implémente seulement les commandes utilisées par
+l'API (GET, SET, SETEX, MGET, DEL, INCR, EXPIRE, TTL, SCAN, HSET, ...) avec une latence
+réseau simulée optionnelle. Tourne dans un thread dédié avec sa propre boucle
+asyncio pour ne pas être bloqué par un client synchrone.
+
+Les scripts Lua (EVAL, EVALSHA, SCRIPT LOAD) sont exécutés avec lupa s'il est
+installé (pip install lupa) ; comme dans Redis, un script s'exécute sans
+qu'aucune autre commande ne s'intercale.
+"""
+
+import asyncio
+import fnmatch
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from lupa import LuaRuntime
+    LUA_AVAILABLE = True
+except ImportError:
+    LUA_AVAILABLE = False
+
+
+class RedisStandIn:
+    """Serveur RESP en mémoire, démarré dans un thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        """
+        Args:
+            host: Adresse d'écoute
+            port: Port d'écoute (0 = port libre choisi par l'OS)
+            latency_ms: Latence ajoutée à chaque commande (simule le réseau)
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000.0
+        self.data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self.commands_processed = 0
+        self.command_counts: Dict[str, int] = {}
+        self.scripts: Dict[str, str] = {}  # SHA1 -> source Lua
+        self._lua = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}"
+
+    def start(self) -> "RedisStandIn":
+        """Démarre le serveur dans un thread et attend qu'il écoute"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self
+
+    def stop(self):
+        """Arrête le serveur"""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_client, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            # Terminer les connexions encore ouvertes avant de fermer la boucle
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+    # ---------- Protocole RESP ----------
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[str]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Commande inline (ex: "PING\r\n")
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size_line = await reader.readline()
+            size = int(size_line[1:])
+            payload = await reader.readexactly(size + 2)
+            args.append(payload[:-2].decode())
+        return args
+
+    @staticmethod
+    def _encode(value, resp3: bool = False) -> bytes:
+        if value is None:
+            return b"_\r\n" if resp3 else b"$-1\r\n"
+        if isinstance(value, bool):
+            return b":1\r\n" if value else b":0\r\n"
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, NoScriptError):
+            return f"-NOSCRIPT {value}\r\n".encode()
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode()
+        if isinstance(value, dict):
+            if not resp3:
+                return RedisStandIn._encode([item for pair in value.items() for item in pair])
+            # Map RESP3 (réponse à HELLO 3, HGETALL)
+            return f"%{len(value)}\r\n".encode() + b"".join(
+                RedisStandIn._encode(k, resp3) + RedisStandIn._encode(v, resp3) for k, v in value.items()
+            )
+        if isinstance(value, list):
+            return f"*{len(value)}\r\n".encode() + b"".join(RedisStandIn._encode(v, resp3) for v in value)
+        if value == "OK" or value == "PONG":
+            return f"+{value}\r\n".encode()
+        encoded = str(value).encode()
+        return b"$" + str(len(encoded)).encode() + b"\r\n" + encoded + b"\r\n"
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        resp3 = False  # Protocole négocié par HELLO pour cette connexion
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if args[0].upper() == "HELLO" and len(args) > 1:
+                    resp3 = args[1] == "3"
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                try:
+                    reply = self._execute(args)
+                except Exception as e:
+                    reply = e
+                self.commands_processed += 1
+                command = args[0].upper()
+                self.command_counts[command] = self.command_counts.get(command, 0) + 1
+                writer.write(self._encode(reply, resp3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Client déconnecté ou arrêt du stand-in
+        finally:
+            writer.close()
+
+    # ---------- Commandes ----------
+
+    def _get_live(self, key: str) -> Optional[str]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self.data[key]
+            return None
+        return value
+
+    def _execute(self, args: List[str]):
+        command = args[0].upper()
+        now = time.monotonic()
+
+        if command == "PING":
+            return "PONG"
+        if command in ("SELECT", "CLIENT", "AUTH"):
+            return "OK"
+        if command == "HELLO":
+            info = {"server": "redis-standin", "version": "7.0.0", "proto": int(args[1]) if len(args) > 1 else 2}
+            if info["proto"] == 3:
+                return info
+            return [item for pair in info.items() for item in pair]
+        if command == "GET":
+            return self._get_live(args[1])
+        if command == "MGET":
+            return [self._get_live(k) for k in args[1:]]
+        if command == "SET":
+            key, value = args[1], args[2]
+            options = [a.upper() for a in args[3:]]
+            expires_at = None
+            if "EX" in options:
+                expires_at = now + int(args[3 + options.index("EX") + 1])
+            if "PX" in options:
+                expires_at = now + int(args[3 + options.index("PX") + 1]) / 1000.0
+            if "NX" in options and self._get_live(key) is not None:
+                return None
+            self.data[key] = (value, expires_at)
+            return "OK"
+        if command == "SETEX":
+            self.data[args[1]] = (args[3], now + int(args[2]))
+            return "OK"
+        if command == "DEL":
+            return sum(1 for k in args[1:] if self.data.pop(k, None) is not None)
+        if command in ("INCR", "INCRBY"):
+            increment = int(args[2]) if command == "INCRBY" else 1
+            current = self._get_live(args[1])
+            expires_at = self.data[args[1]][1] if current is not None else None
+            value = int(current or 0) + increment
+            self.data[args[1]] = (str(value), expires_at)
+            return value
+        if command == "HSET":
+            current = self._get_live(args[1])
+            fields = dict(current) if isinstance(current, dict) else {}
+            pairs = dict(zip(args[2::2], args[3::2]))
+            added = sum(1 for field in pairs if field not in fields)
+            fields.update(pairs)
+            self.data[args[1]] = (fields, self.data[args[1]][1] if current is not None else None)
+            return added
+        if command == "HGETALL":
+            current = self._get_live(args[1])
+            return dict(current) if isinstance(current, dict) else {}
+        if command == "HDEL":
+            current = self._get_live(args[1])
+            if not isinstance(current, dict):
+                return 0
+            removed = sum(1 for field in args[2:] if current.pop(field, None) is not None)
+            if not current:
+                del self.data[args[1]]
+            return removed
+        if command in ("EXPIRE", "PEXPIRE"):
+            current = self._get_live(args[1])
+            if current is None:
+                return 0
+            seconds = int(args[2]) / 1000.0 if command == "PEXPIRE" else int(args[2])
+            self.data[args[1]] = (current, now + seconds)
+            return 1
+        if command in ("TTL", "PTTL"):
+            if self._get_live(args[1]) is None:
+                return -2
+            expires_at = self.data[args[1]][1]
+            if expires_at is None:
+                return -1
+            remaining = expires_at - now
+            return int(remaining * 1000) if command == "PTTL" else int(remaining)
+        if command == "SCAN":
+            # Un seul passage (curseur 0) : suffisant pour les volumes de benchmark
+            options = [a.upper() for a in args[2:]]
+            pattern = args[2 + options.index("MATCH") + 1] if "MATCH" in options else "*"
+            keys = [k for k in list(self.data) if fnmatch.fnmatchcase(k, pattern) and self._get_live(k) is not None]
+            return ["0", keys]
+        if command in ("EVAL", "EVALSHA"):
+            source = args[1] if command == "EVAL" else self.scripts.get(args[1])
+            if source is None:
+                raise NoScriptError("No matching script. Please use EVAL.")
+            num_keys = int(args[2])
+            return self._eval(source, args[3:3 + num_keys], args[3 + num_keys:])
+        if command == "SCRIPT":
+            subcommand = args[1].upper()
+            if subcommand == "LOAD":
+                sha = hashlib.sha1(args[2].encode()).hexdigest()
+                self.scripts[sha] = args[2]
+                return sha
+            if subcommand == "EXISTS":
+                return [int(sha in self.scripts) for sha in args[2:]]
+            if subcommand == "FLUSH":
+                self.scripts.clear()
+                return "OK"
+        if command == "TIME":
+            microseconds = time.time_ns() // 1000
+            return [str(microseconds // 1_000_000), str(microseconds % 1_000_000)]
+        if command == "DBSIZE":
+            return len(self.data)
+        if command == "FLUSHDB":
+            self.data.clear()
+            return "OK"
+        raise ValueError(f"unknown command '{args[0]}'")
+
+    # ---------- Scripts Lua ----------
+
+    def _eval(self, source: str, keys: List[str], argv: List[str]):
+        if not LUA_AVAILABLE:
+            raise ValueError("EVAL requires lupa (pip install lupa)")
+        self.scripts.setdefault(hashlib.sha1(source.encode()).hexdigest(), source)
+        if self._lua is None:
+            self._lua = LuaRuntime(unpack_returned_tuples=False)
+            self._lua.execute("redis = {}")
+            self._lua.globals().redis.call = lambda *call_args: self._to_lua(self._execute([str(a) for a in call_args]))
+        lua = self._lua
+        lua.globals().KEYS = lua.table(*keys)
+        lua.globals().ARGV = lua.table(*argv)
+        return self._from_lua(lua.execute(source))
+
+    def _to_lua(self, reply):
+        """Réponse Redis -> valeur Lua (nil devient false, comme dans Redis)"""
+        if reply is None:
+            return False
+        if isinstance(reply, list):
+            return self._lua.table(*[self._to_lua(item) for item in reply])
+        return reply
+
+    def _from_lua(self, value):
+        """Valeur Lua -> réponse Redis (nombres tronqués en entiers, tables en listes)"""
+        if value is None or value is False:
+            return None
+        if value is True:
+            return 1
+        if isinstance(value, float):
+            return int(value)
+        if isinstance(value, (int, str, bytes)):
+            return value.decode() if isinstance(value, bytes) else value
+        # Table Lua : partie séquentielle jusqu'au premier nil
+        items = []
+        index = 1
+        while value[index] is not None:
+            items.append(self._from_lua(value[index]))
+            index += 1
+        return items
+
+
+class NoScriptError(Exception):
+    """Script inconnu pour EVALSHA (le client renvoie alors EVAL)"""
+
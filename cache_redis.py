@@ -1,41 +1,83 @@
 """
-Cache Redis avec fallback sur cache mémoire
+Cache Redis avec fallback sur cache disque (SQLite) ou mémoire
 """
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Tuple, List
 from datetime import datetime, timedelta
+from itertools import islice
+import asyncio
 import json
+import os
+import sqlite3
+import threading
+import time
 
-# Tentative d'import Redis
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
+from monitoring import time_stage
+from redis_pool import (
+    REDIS_AVAILABLE,
+    init_redis_pool,
+    get_redis_client,
+    ping_redis_pool,
+    get_redis_pool_info
+)
 
 # Cache mémoire de fallback
 memory_cache: Dict[str, Dict[str, Any]] = {}
 CACHE_TTL_HOURS = 24
 
+DISK_CACHE_MAX_SIZE_MB = 512  # Taille max du cache disque avant éviction
+DISK_CACHE_SWEEP_INTERVAL = 60  # Secondes entre deux nettoyages (TTL + taille)
+DISK_CACHE_BUSY_TIMEOUT_MS = 5000  # Attente max d'un verrou d'écriture (autres workers)
+DISK_CACHE_SWEEP_BATCH = 500  # Entrées supprimées par transaction lors de la réduction de taille
+
 
 class CacheBackend:
     """Interface abstraite pour le cache"""
     
-    def get(self, key: str) -> Optional[Dict]:
+    async def get(self, key: str) -> Optional[Dict]:
         """Récupère une valeur depuis le cache"""
         raise NotImplementedError
     
-    def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
+    async def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
         """Stocke une valeur dans le cache"""
         raise NotImplementedError
     
-    def delete(self, key: str):
+    async def add(self, key: str, value: Dict, ttl_hours: float = CACHE_TTL_HOURS) -> bool:
+        """
+        Stocke une valeur seulement si la clé est absente (SET NX) ; True si stockée
+        
+        Par défaut get puis set : atomique pour le backend mémoire (aucune suspension entre les deux)
+        """
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl_hours)
+        return True
+    
+    async def delete(self, key: str):
         """Supprime une clé du cache"""
         raise NotImplementedError
     
-    def clear(self):
+    async def clear(self):
         """Vide tout le cache"""
         raise NotImplementedError
+    
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Récupère plusieurs valeurs (dans l'ordre des clés, None si absente) ; un seul passage par défaut"""
+        return [await self.get(key) for key in keys]
+    
+    async def set_many(self, items: Dict[str, Dict], ttl_hours: float = CACHE_TTL_HOURS):
+        """Stocke plusieurs valeurs avec le même TTL"""
+        for key, value in items.items():
+            await self.set(key, value, ttl_hours)
+    
+    def scan(self, prefix: str = "") -> AsyncIterator[Tuple[str, Dict, Optional[float]]]:
+        """
+        Parcourt les entrées du cache (export, migration)
+        
+        Yields:
+            (clé, valeur, TTL restant en secondes ou None si pas d'expiration)
+        """
+        raise NotImplementedError
 
 
 class RedisCacheBackend(CacheBackend):
@@ -43,7 +85,7 @@ class RedisCacheBackend(CacheBackend):
     
     def __init__(self, redis_url: str = "redis://localhost:6379", db: int = 0):
         """
-        Initialise le backend Redis
+        Initialise le backend Redis sur le pool asynchrone partagé
         
         Args:
             redis_url: URL Redis (ex: redis://localhost:6379)
@@ -52,17 +94,14 @@ class RedisCacheBackend(CacheBackend):
         if not REDIS_AVAILABLE:
             raise ImportError("redis package not installed. Install with: pip install redis")
         
-        try:
-            self.redis_client = redis.from_url(redis_url, db=db, decode_responses=True)
-            # Tester la connexion
-            self.redis_client.ping()
-        except Exception as e:
-            raise ConnectionError(f"Failed to connect to Redis: {e}")
+        if not init_redis_pool(redis_url, db):
+            raise ConnectionError(f"Failed to create Redis pool for {redis_url}")
+        self.redis_client = get_redis_client()
     
-    def get(self, key: str) -> Optional[Dict]:
+    async def get(self, key: str) -> Optional[Dict]:
         """Récupère une valeur depuis Redis"""
         try:
-            cached_data = self.redis_client.get(key)
+            cached_data = await self.redis_client.get(key)
             if cached_data:
                 return json.loads(cached_data)
         except Exception as e:
@@ -70,32 +109,98 @@ class RedisCacheBackend(CacheBackend):
             return None
         return None
     
-    def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
+    async def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
         """Stocke une valeur dans Redis"""
         try:
             ttl_seconds = int(ttl_hours * 3600)
-            self.redis_client.setex(
+            await self.redis_client.set(
                 key,
-                ttl_seconds,
-                json.dumps(value)
+                json.dumps(value),
+                ex=ttl_seconds
             )
         except Exception as e:
             # En cas d'erreur, ne rien faire (fallback sera utilisé)
             pass
     
-    def delete(self, key: str):
+    async def add(self, key: str, value: Dict, ttl_hours: float = CACHE_TTL_HOURS) -> bool:
+        """SET NX EX atomique (partagé entre workers)"""
+        try:
+            return bool(await self.redis_client.set(key, json.dumps(value), nx=True, ex=round(ttl_hours * 3600)))
+        except Exception:
+            # Redis indisponible : pas de coordination possible, l'appelant continue seul
+            return True
+    
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Récupère plusieurs valeurs en un seul aller-retour (MGET)"""
+        if not keys:
+            return []
+        try:
+            values = await self.redis_client.mget(keys)
+        except Exception:
+            return [None] * len(keys)
+        results = []
+        for raw in values:
+            try:
+                results.append(json.loads(raw) if raw else None)
+            except ValueError:
+                results.append(None)
+        return results
+    
+    async def set_many(self, items: Dict[str, Dict], ttl_hours: float = CACHE_TTL_HOURS):
+        """Stocke plusieurs valeurs en un seul aller-retour (pipeline de SET EX)"""
+        if not items:
+            return
+        try:
+            ttl_seconds = int(ttl_hours * 3600)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, json.dumps(value), ex=ttl_seconds)
+                await pipe.execute()
+        except Exception:
+            pass
+    
+    async def delete(self, key: str):
         """Supprime une clé de Redis"""
         try:
-            self.redis_client.delete(key)
+            await self.redis_client.delete(key)
         except Exception:
             pass
     
-    def clear(self):
+    async def clear(self):
         """Vide tout le cache Redis (dangerous!)"""
         try:
-            self.redis_client.flushdb()
+            await self.redis_client.flushdb()
         except Exception:
             pass
+    
+    async def scan(self, prefix: str = "", batch_size: int = 500) -> AsyncIterator[Tuple[str, Dict, Optional[float]]]:
+        """Parcourt les clés par SCAN (non bloquant), valeurs et TTL lus par lots en pipeline"""
+        batch = []
+        async for key in self.redis_client.scan_iter(match=f"{prefix}*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                async for entry in self._read_batch(batch):
+                    yield entry
+                batch = []
+        if batch:
+            async for entry in self._read_batch(batch):
+                yield entry
+    
+    async def _read_batch(self, keys) -> AsyncIterator[Tuple[str, Dict, Optional[float]]]:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.get(key)
+                pipe.pttl(key)
+            replies = await pipe.execute()
+        for key, raw, pttl in zip(keys, replies[0::2], replies[1::2]):
+            if raw is None or pttl == -2:
+                continue  # Expirée entre SCAN et GET
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                continue  # Pas une entrée du cache (ex: compteur de rate limiting)
+            if isinstance(value, dict):
+                yield key, value, (pttl / 1000 if pttl >= 0 else None)
 
 
 class MemoryCacheBackend(CacheBackend):
@@ -103,11 +208,24 @@ class MemoryCacheBackend(CacheBackend):
     
     def __init__(self):
         self.cache: Dict[str, Dict[str, Any]] = {}
+        # Réservations SET NX (ex: marqueurs idempotence "en cours") : hors LRU, gardées jusqu'à leur TTL
+        self.reserved: Dict[str, Dict[str, Any]] = {}
     
-    def get(self, key: str) -> Optional[Dict]:
+    async def get(self, key: str) -> Optional[Dict]:
         """Récupère une valeur depuis le cache mémoire"""
+        reserved = self.reserved.get(key)
+        if reserved is not None:
+            if time.time() < reserved["expires_at"]:
+                return reserved["result"]
+            del self.reserved[key]
         if key in self.cache:
             cached_data = self.cache[key]
+            expires_at = cached_data.get("expires_at")
+            if expires_at is not None:
+                if time.time() < expires_at:
+                    return cached_data.get("result")
+                del self.cache[key]
+                return None
             cache_time = cached_data.get("timestamp")
             if cache_time:
                 cache_dt = datetime.fromisoformat(cache_time)
@@ -118,34 +236,368 @@ class MemoryCacheBackend(CacheBackend):
                     del self.cache[key]
         return None
     
-    def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
+    async def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
         """Stocke une valeur dans le cache mémoire"""
+        self.reserved.pop(key, None)
+        # Réinsérer la clé : l'ordre du dict reste celui des écritures
+        self.cache.pop(key, None)
         self.cache[key] = {
             "result": value,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            "expires_at": time.time() + ttl_hours * 3600
         }
         
         # Limiter la taille du cache (garder seulement les 1000 derniers)
         if len(self.cache) > 1000:
-            sorted_items = sorted(self.cache.items(), key=lambda x: x[1].get("timestamp", ""))
-            for key_to_delete, _ in sorted_items[:100]:
-                del self.cache[key_to_delete]
+            self._evict_oldest(100)
+    
+    def _evict_oldest(self, count: int):
+        """Supprime les entrées les plus anciennes (début du dict, sans tri)"""
+        for key_to_delete in list(islice(self.cache, count)):
+            del self.cache[key_to_delete]
+    
+    async def set_many(self, items: Dict[str, Dict], ttl_hours: float = CACHE_TTL_HOURS):
+        """Stocke plusieurs valeurs en un seul passage"""
+        timestamp = datetime.now().isoformat()
+        expires_at = time.time() + ttl_hours * 3600
+        for key, value in items.items():
+            self.reserved.pop(key, None)
+            self.cache.pop(key, None)
+            self.cache[key] = {"result": value, "timestamp": timestamp, "expires_at": expires_at}
+        if len(self.cache) > 1000:
+            self._evict_oldest(len(self.cache) - 900)
+    
+    async def add(self, key: str, value: Dict, ttl_hours: float = CACHE_TTL_HOURS) -> bool:
+        """
+        SET NX (sans suspension, donc atomique) : la réservation n'est jamais évincée
+        par la limite de taille, seulement remplacée par set, supprimée ou expirée
+        """
+        if await self.get(key) is not None:
+            return False
+        now = time.time()
+        if len(self.reserved) > 1000:
+            # Réservations abandonnées (worker arrêté en cours de requête) : purger les expirées
+            for expired_key in [k for k, entry in self.reserved.items() if entry["expires_at"] <= now]:
+                del self.reserved[expired_key]
+        self.cache.pop(key, None)
+        self.reserved[key] = {"result": value, "expires_at": now + ttl_hours * 3600}
+        return True
     
-    def delete(self, key: str):
+    async def delete(self, key: str):
         """Supprime une clé du cache mémoire"""
+        self.reserved.pop(key, None)
         if key in self.cache:
             del self.cache[key]
     
-    def clear(self):
+    async def clear(self):
         """Vide tout le cache mémoire"""
         self.cache.clear()
+        self.reserved.clear()
+    
+    async def scan(self, prefix: str = "") -> AsyncIterator[Tuple[str, Dict, Optional[float]]]:
+        """Parcourt les entrées non expirées du cache mémoire"""
+        now = time.time()
+        for key, cached_data in list(self.cache.items()):
+            if not key.startswith(prefix):
+                continue
+            expires_at = cached_data.get("expires_at")
+            if expires_at is None:
+                cache_dt = datetime.fromisoformat(cached_data["timestamp"])
+                expires_at = cache_dt.timestamp() + CACHE_TTL_HOURS * 3600
+            if expires_at > now:
+                yield key, cached_data["result"], expires_at - now
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    Backend disque persistant (SQLite en mode WAL)
+    
+    Survit aux redémarrages et peut être partagé par plusieurs workers uvicorn
+    d'une même machine : WAL autorise les lectures concurrentes pendant une
+    écriture, et busy_timeout sérialise les écritures entre processus.
+    Les entrées expirées et l'excédent de taille sont supprimés par un
+    nettoyage périodique en tâche de fond.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        max_size_mb: int = DISK_CACHE_MAX_SIZE_MB,
+        sweep_interval: int = DISK_CACHE_SWEEP_INTERVAL
+    ):
+        """
+        Args:
+            path: Chemin du fichier SQLite (créé si absent)
+            max_size_mb: Taille max des valeurs stockées (Mo)
+            sweep_interval: Intervalle du nettoyage en tâche de fond (secondes)
+        """
+        self.path = path
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._sweeper: Optional[asyncio.Task] = None
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        conn = self._connection()
+        # auto_vacuum doit être défini avant la création de la table
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if "pinned" not in columns:
+            # Réservations (add) exclues de la réduction de taille ; ajoutée aux caches existants
+            conn.execute("ALTER TABLE cache ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        # Index couvrant : purge des expirées, réduction par ordre d'expiration et somme des tailles
+        # sans lire les valeurs stockées dans la table
+        conn.execute("DROP INDEX IF EXISTS cache_expires_at")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expiry ON cache(expires_at, pinned, size)")
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Connexion SQLite du thread courant (une par thread du pool)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=DISK_CACHE_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Suffisant en WAL : pas de corruption, seulement les derniers commits en cas de coupure
+            conn.execute(f"PRAGMA busy_timeout={DISK_CACHE_BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+    
+    # Opérations synchrones (exécutées dans le threadpool)
+    
+    def _get_sync(self, key: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def _set_sync(self, key: str, value: Dict, ttl_hours: float):
+        payload = json.dumps(value)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, size) VALUES (?, ?, ?, ?)",
+            (key, payload, time.time() + ttl_hours * 3600, len(payload))
+        )
+    
+    def _get_many_sync(self, keys: List[str]) -> List[Optional[Dict]]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?",
+            (*keys, time.time())
+        ).fetchall()
+        found = {key: json.loads(value) for key, value in rows}
+        return [found.get(key) for key in keys]
+    
+    def _set_many_sync(self, items: Dict[str, Dict], ttl_hours: float):
+        expires_at = time.time() + ttl_hours * 3600
+        rows = []
+        for key, value in items.items():
+            payload = json.dumps(value)
+            rows.append((key, payload, expires_at, len(payload)))
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at, size) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def _add_sync(self, key: str, value: Dict, ttl_hours: float) -> bool:
+        payload = json.dumps(value)
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at, size, pinned) VALUES (?, ?, ?, ?, 1)",
+                (key, payload, now + ttl_hours * 3600, len(payload))
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+    
+    def _delete_sync(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+    
+    def _clear_sync(self):
+        self._connection().execute("DELETE FROM cache")
+    
+    def sweep(self) -> int:
+        """
+        Supprime les entrées expirées, puis les plus proches de l'expiration
+        tant que la taille dépasse la limite (jusqu'à 90% de la limite) ;
+        les réservations (add) ne sont supprimées qu'à leur expiration
+        
+        Returns:
+            Nombre d'entrées supprimées
+        """
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total_size > self.max_size_bytes:
+            target = int(self.max_size_bytes * 0.9)
+            # Par lots : chaque transaction courte laisse passer les écritures des autres workers
+            while total_size > target:
+                batch = conn.execute(
+                    "SELECT key, size FROM cache WHERE pinned = 0 ORDER BY expires_at LIMIT ?",
+                    (DISK_CACHE_SWEEP_BATCH,)
+                ).fetchall()
+                if not batch:
+                    break
+                evicted = []
+                for key, size in batch:
+                    if total_size <= target:
+                        break
+                    evicted.append((key,))
+                    total_size -= size
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+                removed += len(evicted)
+        
+        if removed:
+            conn.execute("PRAGMA incremental_vacuum")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Nombre d'entrées et taille des valeurs stockées"""
+        count, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        return {"entries": count, "size_bytes": size, "max_size_bytes": self.max_size_bytes, "path": self.path}
+    
+    # Interface asynchrone
+    
+    async def get(self, key: str) -> Optional[Dict]:
+        """Récupère une valeur depuis le cache disque"""
+        try:
+            return await asyncio.to_thread(self._get_sync, key)
+        except sqlite3.Error:
+            return None
+    
+    async def set(self, key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
+        """Stocke une valeur dans le cache disque"""
+        try:
+            await asyncio.to_thread(self._set_sync, key, value, ttl_hours)
+        except sqlite3.Error:
+            pass
+    
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict]]:
+        """Récupère plusieurs valeurs en une seule requête SQL"""
+        if not keys:
+            return []
+        try:
+            return await asyncio.to_thread(self._get_many_sync, keys)
+        except sqlite3.Error:
+            return [None] * len(keys)
+    
+    async def set_many(self, items: Dict[str, Dict], ttl_hours: float = CACHE_TTL_HOURS):
+        """Stocke plusieurs valeurs en une seule transaction"""
+        if not items:
+            return
+        try:
+            await asyncio.to_thread(self._set_many_sync, items, ttl_hours)
+        except sqlite3.Error:
+            pass
+    
+    async def add(self, key: str, value: Dict, ttl_hours: float = CACHE_TTL_HOURS) -> bool:
+        """Insère la valeur si la clé est absente ou expirée (transaction partagée entre workers)"""
+        try:
+            return await asyncio.to_thread(self._add_sync, key, value, ttl_hours)
+        except sqlite3.Error:
+            return True
+    
+    async def delete(self, key: str):
+        """Supprime une clé du cache disque"""
+        try:
+            await asyncio.to_thread(self._delete_sync, key)
+        except sqlite3.Error:
+            pass
+    
+    async def clear(self):
+        """Vide tout le cache disque"""
+        await asyncio.to_thread(self._clear_sync)
+    
+    def _scan_page(self, prefix: str, after: str, limit: int):
+        return self._connection().execute(
+            "SELECT key, value, expires_at FROM cache WHERE key > ? AND key >= ? AND key < ? "
+            "AND expires_at > ? ORDER BY key LIMIT ?",
+            (after, prefix, prefix + "\uffff", time.time(), limit)
+        ).fetchall()
+    
+    async def scan(self, prefix: str = "", batch_size: int = 500) -> AsyncIterator[Tuple[str, Dict, Optional[float]]]:
+        """Parcourt les entrées non expirées par pages (clé primaire), sans tout charger en mémoire"""
+        after = ""
+        while True:
+            rows = await asyncio.to_thread(self._scan_page, prefix, after, batch_size)
+            now = time.time()
+            for key, payload, expires_at in rows:
+                yield key, json.loads(payload), expires_at - now
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+    
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except sqlite3.Error:
+                pass  # Base occupée par un autre worker : prochain passage
+    
+    def start_sweeper(self):
+        """Démarre le nettoyage périodique (à appeler dans la boucle asyncio)"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+    
+    async def stop_sweeper(self):
+        """Arrête le nettoyage périodique"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
 
 
 # Instance globale du cache backend
 _cache_backend: Optional[CacheBackend] = None
+# Configuration du cache disque (fallback persistant si Redis absent ou indisponible)
+_disk_cache_config: Optional[Dict[str, Any]] = None
 
 
-def init_cache_backend(redis_url: Optional[str] = None, redis_db: int = 0, force_memory: bool = False):
+def _fallback_backend() -> CacheBackend:
+    """Backend local : disque si configuré, sinon mémoire"""
+    if _disk_cache_config:
+        try:
+            return DiskCacheBackend(**_disk_cache_config)
+        except (sqlite3.Error, OSError):
+            pass
+    return MemoryCacheBackend()
+
+
+def init_cache_backend(
+    redis_url: Optional[str] = None,
+    redis_db: int = 0,
+    force_memory: bool = False,
+    disk_path: Optional[str] = None,
+    disk_max_size_mb: int = DISK_CACHE_MAX_SIZE_MB,
+    disk_sweep_interval: int = DISK_CACHE_SWEEP_INTERVAL
+):
     """
     Initialise le backend de cache
     
@@ -153,8 +605,18 @@ def init_cache_backend(redis_url: Optional[str] = None, redis_db: int = 0, force
         redis_url: URL Redis (si None, utilise redis://localhost:6379)
         redis_db: Numéro de base de données Redis
         force_memory: Forcer l'utilisation du cache mémoire même si Redis disponible
+        disk_path: Fichier SQLite du cache disque, utilisé à la place du cache mémoire
+                   si Redis n'est pas configuré ou indisponible
+        disk_max_size_mb: Taille max du cache disque
+        disk_sweep_interval: Intervalle de nettoyage du cache disque (secondes)
     """
-    global _cache_backend
+    global _cache_backend, _disk_cache_config
+    
+    _disk_cache_config = {
+        "path": disk_path,
+        "max_size_mb": disk_max_size_mb,
+        "sweep_interval": disk_sweep_interval,
+    } if disk_path else None
     
     if force_memory:
         _cache_backend = MemoryCacheBackend()
@@ -166,11 +628,28 @@ def init_cache_backend(redis_url: Optional[str] = None, redis_db: int = 0, force
             _cache_backend = RedisCacheBackend(redis_url, redis_db)
             return
         except Exception:
-            # Fallback sur mémoire si Redis échoue
+            # Fallback local si Redis échoue
             pass
     
-    # Fallback sur mémoire
-    _cache_backend = MemoryCacheBackend()
+    # Fallback sur disque (si configuré) ou mémoire
+    _cache_backend = _fallback_backend()
+
+
+async def verify_cache_backend() -> bool:
+    """
+    Vérifie la connexion Redis (à appeler au démarrage, dans la boucle asyncio)
+    Bascule sur le cache disque ou mémoire si Redis ne répond pas
+    
+    Returns:
+        True si le backend Redis est opérationnel
+    """
+    global _cache_backend
+    
+    if isinstance(_cache_backend, RedisCacheBackend):
+        if await ping_redis_pool():
+            return True
+        _cache_backend = _fallback_backend()
+    return False
 
 
 def get_cache_backend() -> CacheBackend:
@@ -184,27 +663,46 @@ def get_cache_backend() -> CacheBackend:
     return _cache_backend
 
 
-def get_cached(key: str) -> Optional[Dict]:
+async def get_cached(key: str) -> Optional[Dict]:
     """Récupère une valeur depuis le cache"""
-    return get_cache_backend().get(key)
+    with time_stage("cache_get"):
+        return await get_cache_backend().get(key)
 
 
-def set_cached(key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
+async def set_cached(key: str, value: Dict, ttl_hours: int = CACHE_TTL_HOURS):
     """Stocke une valeur dans le cache"""
-    get_cache_backend().set(key, value, ttl_hours)
+    with time_stage("cache_set"):
+        await get_cache_backend().set(key, value, ttl_hours)
+
 
+async def get_many_cached(keys: List[str]) -> List[Optional[Dict]]:
+    """Récupère plusieurs valeurs depuis le cache (un aller-retour Redis)"""
+    with time_stage("cache_get"):
+        return await get_cache_backend().get_many(keys)
 
-def delete_cached(key: str):
+
+async def set_many_cached(items: Dict[str, Dict], ttl_hours: float = CACHE_TTL_HOURS):
+    """Stocke plusieurs valeurs dans le cache (un aller-retour Redis)"""
+    with time_stage("cache_set"):
+        await get_cache_backend().set_many(items, ttl_hours)
+
+
+async def add_cached(key: str, value: Dict, ttl_hours: float = CACHE_TTL_HOURS) -> bool:
+    """Stocke une valeur si la clé est absente (SET NX) ; True si stockée"""
+    return await get_cache_backend().add(key, value, ttl_hours)
+
+
+async def delete_cached(key: str):
     """Supprime une clé du cache"""
-    get_cache_backend().delete(key)
+    await get_cache_backend().delete(key)
 
 
-def clear_cache():
+async def clear_cache():
     """Vide tout le cache"""
-    get_cache_backend().clear()
+    await get_cache_backend().clear()
 
 
-def get_cache_info() -> Dict[str, Any]:
+async def get_cache_info() -> Dict[str, Any]:
     """Retourne des informations sur le cache"""
     backend = get_cache_backend()
     
@@ -215,12 +713,18 @@ def get_cache_info() -> Dict[str, Any]:
     
     if isinstance(backend, MemoryCacheBackend):
         info["cache_size"] = len(backend.cache)
+    elif isinstance(backend, DiskCacheBackend):
+        try:
+            info["disk"] = await asyncio.to_thread(backend.stats)
+        except sqlite3.Error:
+            info["disk"] = {"path": backend.path, "error": "unavailable"}
     elif isinstance(backend, RedisCacheBackend):
         try:
-            info["redis_connected"] = backend.redis_client.ping()
-            info["redis_db_size"] = backend.redis_client.dbsize()
+            info["redis_connected"] = await backend.redis_client.ping()
+            info["redis_db_size"] = await backend.redis_client.dbsize()
         except:
             info["redis_connected"] = False
+        info["redis_pool"] = get_redis_pool_info()
     
     return info
 
@@ -0,0 +1,310 @@
+"""
+Outils de cache : export, import et pré-chauffage
+
+Après une bascule Redis ou un changement de région, le cache est vide et
+chaque facture repasse par l'OCR. Ces outils permettent de :
+- exporter le cache vers une archive JSON Lines compressée (gzip), en flux
+- la réimporter ailleurs en conservant le TTL restant de chaque entrée
+- pré-chauffer le cache en faisant passer des documents dans le pipeline OCR
+  avec un nombre borné de workers
+
+Usage:
+    python cache_tools.py export cache.jsonl.gz [--prefix ocr_result:]
+    python cache_tools.py import cache.jsonl.gz [--hashes hashes.txt]
+    python cache_tools.py prewarm factures/ [--language fra] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import zlib
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from cache_redis import CACHE_TTL_HOURS, CacheBackend, MemoryCacheBackend, get_cache_backend, init_cache_backend
+
+ARCHIVE_FORMAT = "ocr-facture-cache"
+ARCHIVE_VERSION = 1
+DEFAULT_EXPORT_PREFIX = "ocr_"  # Résultats OCR, pages PDF et vignettes perceptuelles
+PREWARM_CONCURRENCY = 4
+IMPORT_BATCH_SIZE = 500  # Entrées décodées par passage dans le thread d'import
+PREWARM_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".webp")
+
+# Document à pré-chauffer : chemin d'un fichier, ou (nom, contenu)
+Document = Union[str, Tuple[str, bytes]]
+
+
+async def iter_export_chunks(
+    prefix: str = DEFAULT_EXPORT_PREFIX,
+    backend: Optional[CacheBackend] = None
+) -> AsyncIterator[bytes]:
+    """
+    Exporte le cache en flux : archive gzip de lignes JSON
+
+    La première ligne décrit l'archive ; chaque ligne suivante contient
+    une entrée {"key", "value", "ttl"} (TTL restant en secondes).
+    """
+    backend = backend or get_cache_backend()
+    compressor = zlib.compressobj(wbits=31)  # 31 = format gzip
+    header = {"format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION, "exported_at": time.time()}
+    buffer = [json.dumps(header)]
+    size = 0
+
+    async for key, value, ttl in backend.scan(prefix):
+        line = json.dumps({"key": key, "value": value, "ttl": ttl})
+        buffer.append(line)
+        size += len(line)
+        if size >= 256 * 1024:
+            chunk = compressor.compress(("\n".join(buffer) + "\n").encode())
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+
+    yield compressor.compress(("\n".join(buffer) + "\n").encode() if buffer else b"") + compressor.flush()
+
+
+async def export_cache(
+    fileobj: BinaryIO,
+    prefix: str = DEFAULT_EXPORT_PREFIX,
+    backend: Optional[CacheBackend] = None
+) -> int:
+    """
+    Exporte le cache dans un fichier (archive gzip)
+
+    Returns:
+        Nombre d'octets écrits
+    """
+    written = 0
+    async for chunk in iter_export_chunks(prefix, backend):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _read_archive_header(lines: io.TextIOWrapper) -> float:
+    """Vérifie l'en-tête de l'archive et retourne son âge en secondes"""
+    try:
+        header = json.loads(lines.readline() or "{}")
+    except (ValueError, OSError, EOFError):
+        header = {}
+    if header.get("format") != ARCHIVE_FORMAT:
+        raise ValueError("Fichier invalide : archive de cache attendue")
+    return max(0.0, time.time() - header.get("exported_at", time.time()))
+
+
+def _read_entries(lines: io.TextIOWrapper, limit: int) -> List[Dict]:
+    """Décompresse et décode jusqu'à limit entrées (liste vide en fin d'archive)"""
+    entries = []
+    for line in lines:
+        if line.strip():
+            entries.append(json.loads(line))
+            if len(entries) >= limit:
+                break
+    return entries
+
+
+async def import_cache(
+    fileobj: BinaryIO,
+    only_hashes: Optional[Set[str]] = None,
+    backend: Optional[CacheBackend] = None
+) -> Dict[str, int]:
+    """
+    Importe une archive exportée par export_cache, en conservant les TTL restants
+
+    La décompression et le décodage JSON se font dans un thread, par lots de
+    IMPORT_BATCH_SIZE entrées : un gros import ne bloque pas la boucle asyncio.
+
+    Args:
+        fileobj: Archive gzip (fichier binaire)
+        only_hashes: Ne réimporter que les entrées de ces hash de fichiers
+        backend: Backend cible (défaut : backend actuel)
+
+    Returns:
+        Compteurs : imported, expired, skipped
+
+    Raises:
+        ValueError: Si le fichier n'est pas une archive de cache
+    """
+    backend = backend or get_cache_backend()
+    counts = {"imported": 0, "expired": 0, "skipped": 0}
+
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as archive:
+        lines = io.TextIOWrapper(archive, encoding="utf-8")
+        elapsed = await asyncio.to_thread(_read_archive_header, lines)
+
+        while True:
+            entries = await asyncio.to_thread(_read_entries, lines, IMPORT_BATCH_SIZE)
+            if not entries:
+                break
+            for entry in entries:
+                key = entry["key"]
+                if only_hashes is not None and key.rsplit(":", 1)[-1] not in only_hashes:
+                    counts["skipped"] += 1
+                    continue
+
+                ttl = entry.get("ttl")
+                remaining = CACHE_TTL_HOURS * 3600 if ttl is None else ttl - elapsed
+                if remaining < 1:  # Redis refuse EX 0 : moins d'une seconde restante = expirée
+                    counts["expired"] += 1
+                    continue
+
+                await backend.set(key, entry["value"], ttl_hours=remaining / 3600)
+                counts["imported"] += 1
+
+    return counts
+
+
+def _is_pdf(name: str, data: bytes) -> bool:
+    return name.lower().endswith(".pdf") or data[:5] == b"%PDF-"
+
+
+async def prewarm_documents(
+    documents: Iterable[Document],
+    language: str = "fra",
+    concurrency: int = PREWARM_CONCURRENCY
+) -> Dict[str, int]:
+    """
+    Fait passer des documents dans le pipeline OCR pour remplir le cache
+
+    Les documents déjà en cache ne sont pas retraités. Un nombre fixe de
+    workers consomme une file bornée : l'OCR ne sature pas le threadpool et
+    les fichiers ne sont lus qu'au moment d'être traités.
+
+    Returns:
+        Compteurs : processed, cached, failed
+    """
+    # Import tardif : main initialise l'application et ses backends
+    from main import get_file_hash, get_cached_result, get_or_compute_ocr_result
+
+    counts = {"processed": 0, "cached": 0, "failed": 0}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while True:
+            document = await queue.get()
+            try:
+                if document is None:
+                    return
+                if isinstance(document, str):
+                    name = document
+                    data = await asyncio.to_thread(_read_file, document)
+                else:
+                    name, data = document
+                file_hash = get_file_hash(data)
+                if await get_cached_result(file_hash):
+                    counts["cached"] += 1
+                else:
+                    await get_or_compute_ocr_result(file_hash, data, language, _is_pdf(name, data))
+                    counts["processed"] += 1
+            except Exception:
+                counts["failed"] += 1
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        for document in documents:
+            await queue.put(document)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return counts
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def iter_document_paths(paths: List[str]) -> Iterable[str]:
+    """Liste les documents à pré-chauffer (fichiers, ou contenu des dossiers)"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(PREWARM_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def _init_backend_from_settings():
+    """Initialise le backend de cache comme l'API (Redis, disque ou mémoire)"""
+    from config import settings
+
+    init_cache_backend(
+        redis_url=settings.redis_url,
+        redis_db=settings.redis_db,
+        force_memory=settings.force_memory_cache,
+        disk_path=settings.disk_cache_path,
+        disk_max_size_mb=settings.disk_cache_max_size_mb,
+        disk_sweep_interval=settings.disk_cache_sweep_interval
+    )
+
+
+async def _run_cli(args) -> int:
+    from redis_pool import close_redis_pool
+
+    try:
+        if args.command == "prewarm":
+            counts = await prewarm_documents(
+                iter_document_paths(args.paths), language=args.language, concurrency=args.concurrency
+            )
+            print(json.dumps(counts))
+            return 1 if counts["failed"] else 0
+
+        if isinstance(get_cache_backend(), MemoryCacheBackend):
+            print("Cache mémoire : rien à exporter/importer hors du processus de l'API "
+                  "(configurer REDIS_URL ou DISK_CACHE_PATH)", file=sys.stderr)
+            return 1
+
+        if args.command == "export":
+            with open(args.archive, "wb") as f:
+                written = await export_cache(f, prefix=args.prefix)
+            print(json.dumps({"archive": args.archive, "bytes": written}))
+            return 0
+
+        only_hashes = None
+        if args.hashes:
+            with open(args.hashes) as f:
+                only_hashes = {line.strip() for line in f if line.strip()}
+        with open(args.archive, "rb") as f:
+            counts = await import_cache(f, only_hashes=only_hashes)
+        print(json.dumps(counts))
+        return 0
+    finally:
+        await close_redis_pool()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exporter le cache vers une archive gzip")
+    export_parser.add_argument("archive")
+    export_parser.add_argument("--prefix", default=DEFAULT_EXPORT_PREFIX, help="Préfixe des clés à exporter")
+
+    import_parser = subparsers.add_parser("import", help="Importer une archive (TTL restants conservés)")
+    import_parser.add_argument("archive")
+    import_parser.add_argument("--hashes", help="Fichier de hash (un par ligne) à réimporter uniquement")
+
+    prewarm_parser = subparsers.add_parser("prewarm", help="OCRiser des documents pour remplir le cache")
+    prewarm_parser.add_argument("paths", nargs="+", help="Fichiers ou dossiers de factures")
+    prewarm_parser.add_argument("--language", default="fra")
+    prewarm_parser.add_argument("--concurrency", type=int, default=PREWARM_CONCURRENCY)
+
+    args = parser.parse_args(argv)
+    if args.command != "prewarm":
+        _init_backend_from_settings()
+    return asyncio.run(_run_cli(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
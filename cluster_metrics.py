@@ -0,0 +1,219 @@
+"""
+Agrégation des métriques entre workers (--workers N, plusieurs réplicas)
+
+Chaque worker publie périodiquement un instantané fusionnable de ses métriques
+(compteurs, buckets des histogrammes, séries Prometheus) :
+- dans le hash Redis metrics:workers (un champ par worker) si Redis est actif ;
+- sinon dans METRICS_SHARED_DIR (un fichier JSON par worker, même machine).
+
+/v1/metrics fusionne les instantanés récents des autres workers avec les
+métriques en direct du worker qui répond : compteurs additionnés, histogrammes
+fusionnés bucket par bucket. /metrics ne fusionne que les instantanés publiés
+(y compris celui du worker qui répond) : tous les workers renvoient la même
+somme, qui ne décroît pas d'un scrape à l'autre quel que soit le worker
+interrogé. Un worker arrêté sort des totaux après METRICS_WORKER_TTL secondes
+(vu par Prometheus comme une remise à zéro).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from monitoring import get_metrics, merge_snapshots, render_prometheus, snapshot_metrics
+from redis_pool import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+METRICS_FLUSH_INTERVAL = 10  # Secondes entre deux publications
+METRICS_WORKER_TTL = 300  # Instantané plus ancien : worker considéré arrêté
+REDIS_METRICS_KEY = "metrics:workers"
+
+_shared_dir: Optional[str] = None
+_flush_interval: float = METRICS_FLUSH_INTERVAL
+_worker_ttl: float = METRICS_WORKER_TTL
+_flusher: Optional[asyncio.Task] = None
+_published_pid: Optional[int] = None  # Processus ayant déjà publié son instantané (pid change après un fork)
+
+
+def init_cluster_metrics(
+    shared_dir: Optional[str] = None,
+    flush_interval: float = METRICS_FLUSH_INTERVAL,
+    worker_ttl: float = METRICS_WORKER_TTL
+):
+    """
+    Configure la publication des métriques (Redis prioritaire, sinon répertoire partagé)
+
+    Args:
+        shared_dir: Répertoire commun aux workers d'une machine (sans Redis)
+        flush_interval: Secondes entre deux publications
+        worker_ttl: Âge max d'un instantané avant d'ignorer (et supprimer) le worker
+    """
+    global _shared_dir, _flush_interval, _worker_ttl
+    _shared_dir = shared_dir or None
+    _flush_interval = max(flush_interval, 1)
+    _worker_ttl = max(worker_ttl, _flush_interval * 2)
+    if _shared_dir:
+        os.makedirs(_shared_dir, exist_ok=True)
+
+
+def worker_id() -> str:
+    """Identifiant du worker (calculé à chaque appel : le pid change après un fork)"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _backend() -> Optional[str]:
+    if get_redis_client() is not None:
+        return "redis"
+    if _shared_dir:
+        return "directory"
+    return None
+
+
+def _snapshot_path(worker: str) -> str:
+    return os.path.join(_shared_dir, worker.replace(":", "_").replace(os.sep, "_") + ".json")
+
+
+def _write_snapshot_file(payload: str):
+    """Écriture atomique (fichier temporaire puis rename) : un lecteur ne voit jamais un JSON partiel"""
+    path = _snapshot_path(worker_id())
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshot_files(own_path: Optional[str]) -> List[Dict[str, Any]]:
+    """Instantanés des workers (hors own_path) ; supprime ceux des workers arrêtés"""
+    snapshots = []
+    now = time.time()
+    for name in os.listdir(_shared_dir):
+        path = os.path.join(_shared_dir, name)
+        if not name.endswith(".json") or path == own_path:
+            continue
+        try:
+            if now - os.path.getmtime(path) > _worker_ttl:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f)["snapshot"])
+        except (OSError, ValueError, KeyError):
+            continue  # Fichier supprimé entre-temps ou illisible
+    return snapshots
+
+
+async def publish_snapshot() -> bool:
+    """Publie l'instantané de ce worker ; False si aucun backend partagé n'est disponible"""
+    global _published_pid
+    backend = _backend()
+    if backend is None:
+        return False
+    payload = json.dumps({"updated_at": time.time(), "snapshot": snapshot_metrics()})
+    try:
+        if backend == "redis":
+            client = get_redis_client()
+            await client.hset(REDIS_METRICS_KEY, worker_id(), payload)
+            await client.expire(REDIS_METRICS_KEY, int(_worker_ttl))
+        else:
+            await asyncio.to_thread(_write_snapshot_file, payload)
+        _published_pid = os.getpid()
+        return True
+    except Exception as e:
+        logger.warning(f"Publication des métriques impossible ({backend}): {e}")
+        return False
+
+
+async def load_peer_snapshots(include_own: bool = False) -> List[Dict[str, Any]]:
+    """
+    Instantanés récents publiés par les workers
+
+    Args:
+        include_own: Inclure le dernier instantané publié par ce worker
+                     (sinon exclu : il est lu en direct)
+    """
+    backend = _backend()
+    if backend is None:
+        return []
+    try:
+        if backend == "directory":
+            own_path = None if include_own else _snapshot_path(worker_id())
+            return await asyncio.to_thread(_read_snapshot_files, own_path)
+
+        client = get_redis_client()
+        entries = await client.hgetall(REDIS_METRICS_KEY)
+        own = worker_id()
+        snapshots, stale = [], []
+        for worker, payload in entries.items():
+            worker = worker.decode() if isinstance(worker, bytes) else worker
+            if worker == own and not include_own:
+                continue
+            data = json.loads(payload)
+            if time.time() - data["updated_at"] > _worker_ttl:
+                stale.append(worker)
+            else:
+                snapshots.append(data["snapshot"])
+        if stale:
+            await client.hdel(REDIS_METRICS_KEY, *stale)
+        return snapshots
+    except Exception as e:
+        logger.warning(f"Lecture des métriques des autres workers impossible ({backend}): {e}")
+        return []
+
+
+async def collect_cluster_metrics() -> Tuple[Dict[str, Any], int]:
+    """Métriques fusionnées de tous les workers actifs, et nombre de workers"""
+    peers = await load_peer_snapshots()
+    return merge_snapshots([snapshot_metrics(), *peers]), 1 + len(peers)
+
+
+async def get_cluster_metrics() -> Dict[str, Any]:
+    """Équivalent de get_metrics() pour l'ensemble des workers"""
+    merged, workers = await collect_cluster_metrics()
+    return {**get_metrics(merged), "cluster": {"workers": workers, "backend": _backend() or "local"}}
+
+
+async def render_cluster_prometheus() -> str:
+    """
+    Équivalent de render_prometheus() pour l'ensemble des workers
+
+    Seuls les instantanés publiés sont additionnés : mélanger les métriques en
+    direct d'un worker aux instantanés (plus anciens) des autres ferait
+    décroître les compteurs quand deux scrapes tombent sur des workers différents.
+    """
+    if _backend() is None:
+        return render_prometheus()
+    if _published_pid != os.getpid():
+        await publish_snapshot()  # Premier scrape avant la première publication de ce worker
+    snapshots = await load_peer_snapshots(include_own=True)
+    if not snapshots:
+        return render_prometheus()  # Backend indisponible
+    return render_prometheus(merge_snapshots(snapshots))
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(_flush_interval)
+        await publish_snapshot()
+
+
+def start_metrics_flusher():
+    """Démarre la publication périodique (à appeler dans la boucle asyncio)"""
+    global _flusher
+    if _backend() is not None and (_flusher is None or _flusher.done()):
+        _flusher = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+async def stop_metrics_flusher():
+    """Arrête la publication périodique, après un dernier instantané (compteurs conservés jusqu'au TTL)"""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+        await publish_snapshot()
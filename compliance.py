@@ -12,6 +12,8 @@ import requests
 from fastapi import HTTPException
 import tempfile
 
+from monitoring import time_external_request, time_stage
+
 
 # Taux de TVA valides en France
 VALID_FRENCH_VAT_RATES = [20.0, 10.0, 5.5, 2.1, 0.0]
@@ -280,14 +282,15 @@ def _get_oauth2_token_client_credentials(
                 cert_path = tmp_file.name
         
         # Requête pour obtenir le token
-        response = requests.post(
-            token_url,
-            data={"grant_type": "client_credentials"},
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            cert=cert_path,  # Certificat client pour mTLS
-            auth=(client_id, ""),  # Client ID comme username
-            timeout=10
-        )
+        with time_external_request("sirene_token"):
+            response = requests.post(
+                token_url,
+                data={"grant_type": "client_credentials"},
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                cert=cert_path,  # Certificat client pour mTLS
+                auth=(client_id, ""),  # Client ID comme username
+                timeout=10
+            )
         
         # Nettoyer le fichier temporaire si créé
         if not os.path.exists(client_certificate) and cert_path:
@@ -341,13 +344,14 @@ def _get_oauth2_token_consumer_key(
     
     try:
         # Requête pour obtenir le token avec Basic Auth
-        response = requests.post(
-            token_url,
-            data={"grant_type": "client_credentials"},
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            auth=(consumer_key, consumer_secret),
-            timeout=10
-        )
+        with time_external_request("sirene_token"):
+            response = requests.post(
+                token_url,
+                data={"grant_type": "client_credentials"},
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                auth=(consumer_key, consumer_secret),
+                timeout=10
+            )
         
         if response.status_code == 200:
             token_data = response.json()
@@ -442,14 +446,15 @@ def _call_sirene_api(siret: str, access_token: str) -> Optional[Dict]:
     try:
         api_url = f"https://api.insee.fr/entreprises/sirene/v3/siret/{siret}"
         
-        response = requests.get(
-            api_url,
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/json"
-            },
-            timeout=10
-        )
+        with time_external_request("sirene"):
+            response = requests.get(
+                api_url,
+                headers={
+                    "Authorization": f"Bearer {access_token}",
+                    "Accept": "application/json"
+                },
+                timeout=10
+            )
         
         if response.status_code == 200:
             data = response.json()
@@ -758,7 +763,8 @@ def validate_vies(vat_number: str) -> Dict:
             "SOAPAction": "urn:ec.europa.eu:taxud:vies:services:checkVat/checkVat"
         }
         
-        response = requests.post(vies_url, data=soap_envelope, headers=headers, timeout=10)
+        with time_external_request("vies"):
+            response = requests.post(vies_url, data=soap_envelope, headers=headers, timeout=10)
         
         if response.status_code == 200:
             # Parser la réponse SOAP (simplifié)
@@ -800,6 +806,7 @@ def validate_vies(vat_number: str) -> Dict:
         }
 
 
+@time_stage("compliance")
 def extract_compliance_data(
     extracted_data: Dict, 
     ocr_text: str,
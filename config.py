@@ -9,6 +9,10 @@ load_dotenv()
 class Settings(BaseSettings):
     # Clé secrète pour l'authentification RapidAPI (à configurer sur RapidAPI)
     rapidapi_proxy_secret: str = os.getenv("RAPIDAPI_PROXY_SECRET", "")
+    # Clé des endpoints d'administration /admin (désactivés si non configurée)
+    admin_api_key: Optional[str] = os.getenv("ADMIN_API_KEY", None)
+    # Jeton Bearer exigé par GET /metrics (Prometheus) ; /metrics ouvert si non configuré
+    metrics_bearer_token: Optional[str] = os.getenv("METRICS_BEARER_TOKEN", None)
     # Mode développement (True = pas besoin d'authentification, False = production)
     debug_mode: bool = os.getenv("DEBUG_MODE", "False").lower() == "true"
     # Langue par défaut pour OCR
@@ -23,8 +27,46 @@ class Settings(BaseSettings):
     # Redis URL pour le cache (optionnel, utilise cache mémoire si non configuré)
     redis_url: Optional[str] = os.getenv("REDIS_URL", None)
     redis_db: int = int(os.getenv("REDIS_DB", "0"))
+    # Pool de connexions Redis asynchrone partagé (cache, rate limiting, idempotence)
+    redis_max_connections: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+    redis_pool_timeout: float = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+    redis_health_check_interval: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+    # Contrôle d'admission OCR : OCR simultanés par worker (0 = nombre de cœurs) et latence max
+    # (attente + traitement estimés) au-delà de laquelle un OCR est refusé en 503
+    ocr_max_concurrency: int = int(os.getenv("OCR_MAX_CONCURRENCY", "0"))
+    ocr_latency_slo_seconds: float = float(os.getenv("OCR_LATENCY_SLO_SECONDS", "30"))
+    # Algorithme des limites par minute (plan et IP) : gcra (débit lissé), sliding ou fixed
+    rate_limit_algorithm: str = os.getenv("RATE_LIMIT_ALGORITHM", "gcra")
+    # Logging : niveau, logs en attente d'écriture avant perte, part des requêtes réussies journalisées
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
+    log_queue_size: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    log_success_sample_rate: float = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", "1.0"))
+    # Métriques agrégées entre workers : Redis si actif, sinon répertoire partagé (vide = par worker)
+    metrics_shared_dir: Optional[str] = os.getenv("METRICS_SHARED_DIR", None)
+    metrics_flush_interval: float = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+    metrics_worker_ttl: float = float(os.getenv("METRICS_WORKER_TTL", "300"))
+    # Journal des requêtes lentes : N plus lentes par route sur la fenêtre (0 = désactivé),
+    # fiches aussi ajoutées à un fichier JSON lines si un chemin est configuré
+    slow_requests_per_endpoint: int = int(os.getenv("SLOW_REQUESTS_PER_ENDPOINT", "10"))
+    slow_requests_window_seconds: float = float(os.getenv("SLOW_REQUESTS_WINDOW_SECONDS", "3600"))
+    slow_requests_journal_path: Optional[str] = os.getenv("SLOW_REQUESTS_JOURNAL_PATH", None)
+    slow_requests_journal_max_mb: float = float(os.getenv("SLOW_REQUESTS_JOURNAL_MAX_MB", "50"))
+    # Traçage mémoire tracemalloc dès le lancement (frames par allocation ; 0 = via /admin/memory/tracing)
+    memory_trace_frames: int = int(os.getenv("MEMORY_TRACE_FRAMES", "0"))
+    # Boucle asyncio : période de mesure du retard (0 = désactivé) et blocage journalisé avec sa pile
+    loop_lag_interval_ms: float = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+    loop_block_threshold_ms: float = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
     # Forcer l'utilisation du cache mémoire même si Redis disponible
     force_memory_cache: bool = os.getenv("FORCE_MEMORY_CACHE", "False").lower() == "true"
+    # Cache disque persistant (SQLite WAL) utilisé sans Redis, partagé entre workers d'une même machine
+    disk_cache_path: Optional[str] = os.getenv("DISK_CACHE_PATH", None)
+    disk_cache_max_size_mb: int = int(os.getenv("DISK_CACHE_MAX_SIZE_MB", "512"))
+    disk_cache_sweep_interval: int = int(os.getenv("DISK_CACHE_SWEEP_INTERVAL", "60"))
+    # Cache par hash perceptuel (factures re-scannées / ré-encodées quasi identiques)
+    perceptual_cache_enabled: bool = os.getenv("PERCEPTUAL_CACHE_ENABLED", "False").lower() == "true"
+    perceptual_cache_max_distance: int = int(os.getenv("PERCEPTUAL_CACHE_MAX_DISTANCE", "10"))
+    perceptual_cache_max_entries: int = int(os.getenv("PERCEPTUAL_CACHE_MAX_ENTRIES", "10000"))
+    perceptual_cache_max_pixel_diff: int = int(os.getenv("PERCEPTUAL_CACHE_MAX_PIXEL_DIFF", "20"))
     
     class Config:
         env_file = ".env"
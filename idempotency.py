@@ -0,0 +1,83 @@
+"""
+Store d'idempotence partagé entre workers (Redis, disque ou mémoire via la couche de cache)
+
+- Une Idempotency-Key est réservée par un marqueur "en cours" (SET NX) : un
+  doublon reçu pendant le traitement attend la fin de la première requête au
+  lieu de relancer l'OCR
+- Une fois la requête traitée, la clé ne garde qu'une référence compacte vers
+  les résultats en cache (hash des fichiers), pas une copie de la réponse
+- Si la première requête échoue, le marqueur est supprimé et un doublon en
+  attente prend le relais
+"""
+
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+
+from cache_redis import add_cached, delete_cached, get_cached, set_cached
+
+IDEMPOTENCY_TTL_HOURS = 24  # Les clés idempotence sont valides 24h
+PENDING_TTL_SECONDS = 60  # Durée max d'un traitement avant expiration du marqueur "en cours"
+POLL_INTERVAL_SECONDS = 0.05  # Premier intervalle d'attente d'un doublon (puis x2)
+POLL_MAX_INTERVAL_SECONDS = 0.5
+
+# Clés réservées par ce worker (Idempotency-Key -> jeton du marqueur)
+_claims: Dict[str, str] = {}
+
+
+def _cache_key(idempotency_key: str) -> str:
+    return f"idempotency:{idempotency_key}"
+
+
+async def claim_idempotency_key(idempotency_key: str) -> Optional[Dict]:
+    """
+    Réserve une Idempotency-Key avant de traiter la requête
+
+    Returns:
+        None si la clé est réservée par cet appel (appeler ensuite
+        complete_idempotency_key ou release_idempotency_key), sinon l'entrée existante :
+        {"state": "done", "file_hashes": [...]} si la requête a déjà été traitée,
+        {"state": "pending"} si elle est toujours en cours après PENDING_TTL_SECONDS
+    """
+    cache_key = _cache_key(idempotency_key)
+    token = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PENDING_TTL_SECONDS
+    delay = POLL_INTERVAL_SECONDS
+
+    while True:
+        pending = {"state": "pending", "token": token}
+        if await add_cached(cache_key, pending, ttl_hours=PENDING_TTL_SECONDS / 3600):
+            _claims[idempotency_key] = token
+            return None
+
+        entry = await get_cached(cache_key)
+        if entry is not None and entry.get("state") == "done":
+            return entry
+        if loop.time() >= deadline:
+            return {"state": "pending"}
+
+        # Requête identique en cours (ce worker ou un autre) : attendre sa fin
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_INTERVAL_SECONDS)
+
+
+async def complete_idempotency_key(idempotency_key: str, file_hashes: List[str]):
+    """Marque la clé comme traitée : référence aux résultats en cache (hash des fichiers)"""
+    _claims.pop(idempotency_key, None)
+    await set_cached(
+        _cache_key(idempotency_key),
+        {"state": "done", "file_hashes": file_hashes},
+        ttl_hours=IDEMPOTENCY_TTL_HOURS
+    )
+
+
+async def release_idempotency_key(idempotency_key: str):
+    """Supprime le marqueur "en cours" après un échec (sans effet si la clé a été complétée)"""
+    token = _claims.pop(idempotency_key, None)
+    if token is None:
+        return
+    cache_key = _cache_key(idempotency_key)
+    entry = await get_cached(cache_key)
+    if entry is not None and entry.get("token") == token:
+        await delete_cached(cache_key)
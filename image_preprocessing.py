@@ -7,6 +7,8 @@ import numpy as np
 from typing import Optional
 import io
 
+from monitoring import describe_current_document, time_stage
+
 try:
     import cv2
     CV2_AVAILABLE = True
@@ -14,6 +16,7 @@ except ImportError:
     CV2_AVAILABLE = False
 
 
+@time_stage("preprocess")
 def preprocess_image(
     image: Image.Image,
     enhance_contrast: bool = True,
@@ -49,18 +52,22 @@ def preprocess_image(
         
         # 1. Désinclinaison (deskew)
         if deskew:
-            gray = auto_deskew(gray)
+            with time_stage("preprocess_deskew"):
+                gray = auto_deskew(gray)
         
         # 2. Réduction du bruit
         if denoise:
-            gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+            with time_stage("preprocess_denoise"):
+                gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
         
         # 3. Amélioration du contraste
         if enhance_contrast:
-            gray = enhance_contrast_clahe(gray)
+            with time_stage("preprocess_contrast"):
+                gray = enhance_contrast_clahe(gray)
         
         # 4. Binarisation adaptative
-        gray = adaptive_threshold(gray)
+        with time_stage("preprocess_threshold"):
+            gray = adaptive_threshold(gray)
         
         # 5. Upscaling si nécessaire
         if upscale:
@@ -109,6 +116,7 @@ def auto_deskew(image: np.ndarray) -> np.ndarray:
         angle = -(90 + angle)
     else:
         angle = -angle
+    describe_current_document(deskew_angle=round(float(angle), 2))
     
     # Si l'angle est négligeable, ne pas faire de rotation
     if abs(angle) < 0.5:
@@ -0,0 +1,127 @@
+"""
+Surveillance de la boucle asyncio : retard et appels bloquants
+
+Un appel synchrone dans un handler async (Tesseract, requests vers Sirene/VIES,
+Redis synchrone...) bloque toutes les requêtes du worker. Deux mesures :
+
+- Retard : une tâche dort LOOP_LAG_INTERVAL_MS et mesure de combien son réveil
+  est en retard (percentiles dans /v1/metrics, histogramme dans /metrics).
+- Blocage : un thread surveille le battement de cette tâche ; sans battement
+  depuis plus de LOOP_BLOCK_THRESHOLD_MS, il lit la pile du thread de la boucle
+  (sys._current_frames) et la journalise : la frame du bas est l'appel bloquant.
+  Un blocage n'est journalisé qu'une fois, quelle que soit sa durée.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional
+
+from monitoring import log_event_loop_block, log_event_loop_lag
+
+LOOP_LAG_INTERVAL_MS = 100
+LOOP_BLOCK_THRESHOLD_MS = 250
+MAX_STACK_FRAMES = 30
+
+
+class LoopWatchdog:
+    """Échantillonneur du retard de la boucle et détecteur de blocages"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_MS / 1000, threshold: float = LOOP_BLOCK_THRESHOLD_MS / 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self._last_beat = time.monotonic()
+        self._beats = 0  # Numéro du battement ; un blocage est signalé une fois par battement manqué
+        self._reported_beat = -1
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Démarre l'échantillonnage (dans la boucle) et, si un seuil est fixé, le thread de surveillance"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = loop.create_task(self._sample_loop())
+        if self.threshold > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            log_event_loop_lag(max(0.0, loop.time() - started - self.interval))
+            self._last_beat = time.monotonic()
+            self._beats += 1
+
+    def _watch(self):
+        # Détection au plus tard après 1,5 x le seuil
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beats  # Lu avant _last_beat (écrit après lui) : pas de faux blocage
+            blocked = time.monotonic() - self._last_beat - self.interval
+            if blocked > self.threshold and beat != self._reported_beat:
+                self._reported_beat = beat
+                log_event_loop_block(blocked, self.loop_stack())
+
+    def loop_stack(self) -> List[str]:
+        """Pile actuelle du thread de la boucle (frames les plus récentes en dernier)"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return [
+            f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}" + (f": {entry.line}" if entry.line else "")
+            for entry in traceback.extract_stack(frame, limit=MAX_STACK_FRAMES)
+        ]
+
+
+_watchdog: Optional[LoopWatchdog] = None
+_interval_ms: float = LOOP_LAG_INTERVAL_MS
+_threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS
+
+
+def init_loop_watchdog(interval_ms: float = LOOP_LAG_INTERVAL_MS, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS):
+    """
+    Configure la surveillance de la boucle (démarrée par start_loop_watchdog)
+
+    Args:
+        interval_ms: Période d'échantillonnage du retard (0 = surveillance désactivée)
+        threshold_ms: Blocage journalisé au-delà de cette durée (0 = retard seul, sans piles)
+    """
+    global _interval_ms, _threshold_ms
+    _interval_ms = interval_ms
+    _threshold_ms = threshold_ms
+
+
+def start_loop_watchdog():
+    """Démarre la surveillance (à appeler dans la boucle asyncio)"""
+    global _watchdog
+    if _watchdog is None and _interval_ms > 0:
+        _watchdog = LoopWatchdog(_interval_ms / 1000, _threshold_ms / 1000)
+        _watchdog.start()
+
+
+async def stop_loop_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
@@ -1,9 +1,10 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Body, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import base64
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Tuple
 from config import settings
 from pydantic import BaseModel, Field
 import pytesseract
@@ -12,7 +13,9 @@ import io
 import re
 import os
 import hashlib
+import hmac
 import json
+import time
 from datetime import datetime, timedelta
 from compliance import extract_compliance_data, detect_siren_siret, detect_vat_intracom, validate_vies, enrich_siren_siret, validate_french_vat
 from facturx import generate_facturx_xml, parse_facturx_from_pdf, parse_facturx_xml, validate_facturx_xml
@@ -24,20 +27,57 @@ from export import (
     export_to_csv_generic,
     export_to_json
 )
-from rate_limiting import rate_limit_middleware
-from monitoring import monitoring_middleware, get_metrics, log_cache_hit, log_cache_miss
-from image_preprocessing import preprocess_image, should_preprocess
+from rate_limiting import rate_limit_middleware, set_rate_limit_algorithm, record_ocr_usage, get_request_tenant, QUOTA_COSTS
+from monitoring import (
+    monitoring_middleware, log_cache_hit, log_cache_miss, log_cache_perceptual_hit,
+    log_ocr_pages, log_page_cache, time_stage, get_request_timings, PROMETHEUS_CONTENT_TYPE,
+    init_logging, describe_document, describe_current_document
+)
+from image_preprocessing import preprocess_image, should_preprocess, CV2_AVAILABLE
 from cache_redis import (
     init_cache_backend,
-    get_cached,
+    verify_cache_backend,
     set_cached,
+    get_many_cached,
+    set_many_cached,
+    delete_cached,
     get_cache_info,
-    get_cache_backend
+    get_cache_backend,
+    DiskCacheBackend
+)
+from redis_pool import init_redis_pool, close_redis_pool
+from single_flight import single_flight
+from cache_tools import iter_export_chunks, import_cache, prewarm_documents, PREWARM_CONCURRENCY
+from upload_spool import spool_upload, open_buffer
+from admission import init_admission_control, get_admission_controller, get_admission_info, OCROverloadedError
+from cluster_metrics import (
+    init_cluster_metrics, start_metrics_flusher, stop_metrics_flusher, get_cluster_metrics, render_cluster_prometheus
+)
+from slow_requests import init_slow_request_journal, get_slow_request_journal
+from loop_watchdog import init_loop_watchdog, start_loop_watchdog, stop_loop_watchdog
+from memory_profiling import (
+    init_memory_tracing, start_tracing, stop_tracing, take_snapshot, snapshot_top, diff_snapshots, get_memory_report,
+    DEFAULT_TRACE_FRAMES
+)
+from profiling import (
+    init_profiling, create_profile_token, start_profile, finish_profile, get_profile, list_profiles,
+    run_in_threadpool,
+    DEFAULT_SAMPLE_INTERVAL, MAX_SESSION_SECONDS
+)
+from idempotency import claim_idempotency_key, complete_idempotency_key, release_idempotency_key
+from perceptual_cache import (
+    init_perceptual_index,
+    get_perceptual_index,
+    get_perceptual_index_info,
+    compute_document_signatures,
+    find_near_duplicate,
+    index_document,
 )
 try:
     import fitz  # PyMuPDF
-    PDF_SUPPORT = True
+    FITZ_AVAILABLE = PDF_SUPPORT = True
 except ImportError:
+    FITZ_AVAILABLE = False
     PDF_SUPPORT = False
     try:
         from pdf2image import convert_from_bytes
@@ -102,23 +142,105 @@ app.openapi = custom_openapi
 # Créer le router pour la version v1
 v1_router = APIRouter(prefix="/v1", tags=["v1"])
 
+# Router d'administration (clé X-Admin-Key, hors documentation publique)
+admin_router = APIRouter(prefix="/admin", tags=["admin"], include_in_schema=False)
+
+# Initialiser le pool Redis asynchrone partagé (cache, rate limiting, idempotence)
+if settings.redis_url and not settings.force_memory_cache:
+    init_redis_pool(
+        settings.redis_url,
+        settings.redis_db,
+        max_connections=settings.redis_max_connections,
+        pool_timeout=settings.redis_pool_timeout,
+        health_check_interval=settings.redis_health_check_interval
+    )
+
+# Logging structuré non bloquant (file + thread d'écriture sur stdout)
+init_logging(
+    queue_size=settings.log_queue_size,
+    success_sample_rate=settings.log_success_sample_rate,
+    level=settings.log_level.upper()
+)
+
 # Initialiser le cache backend (Redis ou mémoire)
 init_cache_backend(
     redis_url=settings.redis_url,
     redis_db=settings.redis_db,
-    force_memory=settings.force_memory_cache
+    force_memory=settings.force_memory_cache,
+    disk_path=settings.disk_cache_path,
+    disk_max_size_mb=settings.disk_cache_max_size_mb,
+    disk_sweep_interval=settings.disk_cache_sweep_interval
 )
 
-# Initialiser Redis pour rate limiting si disponible
+# Algorithme des limites par minute, puis Redis pour rate limiting si disponible
+set_rate_limit_algorithm(settings.rate_limit_algorithm)
 if settings.redis_url and not settings.force_memory_cache:
     from rate_limiting import init_rate_limit_redis
     init_rate_limit_redis(settings.redis_url, settings.redis_db)
 
+# Contrôle d'admission des OCR (refus 503 + Retry-After en cas de saturation)
+init_admission_control(settings.ocr_max_concurrency or None, settings.ocr_latency_slo_seconds)
+
+# Profilage à la demande (jetons X-Profile signés avec la clé admin)
+init_profiling(settings.admin_api_key)
+
+# Journal des requêtes lentes (fiches sans contenu des documents, rejouables hors ligne)
+init_slow_request_journal(
+    per_endpoint=settings.slow_requests_per_endpoint,
+    window_seconds=settings.slow_requests_window_seconds,
+    journal_path=settings.slow_requests_journal_path,
+    journal_max_mb=settings.slow_requests_journal_max_mb
+)
+
+# Traçage mémoire (tracemalloc) dès le lancement si MEMORY_TRACE_FRAMES > 0
+init_memory_tracing(settings.memory_trace_frames)
+
+# Retard de la boucle asyncio et piles des appels bloquants
+init_loop_watchdog(settings.loop_lag_interval_ms, settings.loop_block_threshold_ms)
+
+# Métriques agrégées entre workers (instantanés publiés dans Redis ou un répertoire partagé)
+init_cluster_metrics(
+    shared_dir=settings.metrics_shared_dir,
+    flush_interval=settings.metrics_flush_interval,
+    worker_ttl=settings.metrics_worker_ttl
+)
+
+# Index de hash perceptuel (factures quasi identiques), optionnel
+init_perceptual_index(
+    settings.perceptual_cache_enabled,
+    max_distance=settings.perceptual_cache_max_distance,
+    max_entries=settings.perceptual_cache_max_entries,
+    max_pixel_diff=settings.perceptual_cache_max_pixel_diff
+)
+
 CACHE_TTL_HOURS = 24  # Cache valide 24h
-IDEMPOTENCY_TTL_HOURS = 24  # Les clés idempotence sont valides 24h
 
-# Cache mémoire de fallback pour idempotence (peut être migré vers Redis aussi)
-idempotency_cache: Dict[str, Dict[str, Any]] = {}
+
+@app.on_event("startup")
+async def startup_redis_pool():
+    """Vérifie Redis au démarrage, sinon bascule cache/rate limiting/idempotence en mémoire"""
+    if not await verify_cache_backend():
+        await close_redis_pool()
+    
+    # Cache disque : nettoyage périodique des entrées expirées et de l'excédent de taille
+    backend = get_cache_backend()
+    if isinstance(backend, DiskCacheBackend):
+        backend.start_sweeper()
+    
+    # Publication périodique des métriques de ce worker (agrégation /metrics, /v1/metrics)
+    start_metrics_flusher()
+    start_loop_watchdog()
+
+
+@app.on_event("shutdown")
+async def shutdown_redis_pool():
+    """Ferme les connexions du pool Redis et arrête le nettoyage du cache disque"""
+    await stop_loop_watchdog()
+    await stop_metrics_flusher()
+    backend = get_cache_backend()
+    if isinstance(backend, DiskCacheBackend):
+        await backend.stop_sweeper()
+    await close_redis_pool()
 
 
 # Exceptions personnalisées pour codes d'erreur spécifiques
@@ -152,68 +274,329 @@ def get_file_hash(file_data: bytes) -> str:
     return hashlib.sha256(file_data).hexdigest()
 
 
-def get_cached_result(file_hash: str) -> Optional[Dict]:
+def _unwrap_cached_result(cached_data: Optional[Dict]) -> Tuple[Optional[Dict], bool]:
+    """
+    Extrait le résultat d'une entrée de cache
+    
+    Returns:
+        (résultat ou None, True si l'entrée est expirée et doit être supprimée)
+    """
+    if not cached_data:
+        return None, False
+    # Vérifier si le cache n'est pas expiré (si backend mémoire)
+    cache_time = cached_data.get("timestamp")
+    if cache_time:
+        cache_dt = datetime.fromisoformat(cache_time)
+        if datetime.now() - cache_dt >= timedelta(hours=CACHE_TTL_HOURS):
+            return None, True
+    # Redis gère l'expiration automatiquement
+    return cached_data.get("result"), False
+
+
+def _wrap_cached_result(result: Dict) -> Dict:
+    return {
+        "result": result,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+async def get_cached_result(file_hash: str) -> Optional[Dict]:
     """Récupère un résultat depuis le cache (Redis ou mémoire)"""
-    cache_key = f"ocr_result:{file_hash}"
-    cached_data = get_cached(cache_key)
-    
-    if cached_data:
-        # Vérifier si le cache n'est pas expiré (si backend mémoire)
-        cache_time = cached_data.get("timestamp")
-        if cache_time:
-            cache_dt = datetime.fromisoformat(cache_time)
-            if datetime.now() - cache_dt < timedelta(hours=CACHE_TTL_HOURS):
-                return cached_data.get("result")
-            else:
-                # Cache expiré (pour mémoire backend)
-                from cache_redis import delete_cached
-                delete_cached(cache_key)
+    return (await get_cached_results([file_hash]))[0]
+
+
+async def get_cached_results(file_hashes: List[str]) -> List[Optional[Dict]]:
+    """Récupère plusieurs résultats depuis le cache en un seul aller-retour (MGET)"""
+    cache_keys = [f"ocr_result:{file_hash}" for file_hash in file_hashes]
+    results = []
+    for cache_key, cached_data in zip(cache_keys, await get_many_cached(cache_keys)):
+        result, expired = _unwrap_cached_result(cached_data)
+        if expired:
+            # Cache expiré (pour mémoire backend)
+            await delete_cached(cache_key)
+        results.append(result)
+    return results
+
+
+async def set_cached_result(file_hash: str, result: Dict):
+    """Stocke un résultat dans le cache (Redis ou mémoire)"""
+    await set_cached(f"ocr_result:{file_hash}", _wrap_cached_result(result), ttl_hours=CACHE_TTL_HOURS)
+
+
+async def set_cached_results(results: Dict[str, Dict]):
+    """Stocke plusieurs résultats (file_hash -> résultat) en un seul aller-retour (pipeline)"""
+    await set_many_cached(
+        {f"ocr_result:{file_hash}": _wrap_cached_result(result) for file_hash, result in results.items()},
+        ttl_hours=CACHE_TTL_HOURS
+    )
+
+
+class BatchResultWriter:
+    """
+    Écriture groupée des résultats OCR d'un lot : un seul pipeline pour tous les absents
+
+    Chaque calcul ajoute son résultat puis attend l'écriture : son verrou single-flight
+    n'est libéré qu'une fois le résultat lisible dans le cache partagé. Un fichier
+    calculé par une autre requête (ou en échec) est libéré du lot sans attendre.
+    """
+
+    def __init__(self, file_hashes: List[str]):
+        self.results: Dict[str, Dict] = {}
+        self._pending = set(file_hashes)
+        self._flushed = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            self._flushed.set_result(None)
+
+    async def add(self, file_hash: str, result: Dict):
+        """Ajoute le résultat d'un calcul et attend son écriture dans le cache"""
+        if self._flushed.done():
+            # Calculé après l'écriture du lot (ex: attente d'un autre worker expirée)
+            await set_cached_result(file_hash, result)
+            return
+        self.results[file_hash] = result
+        self.release(file_hash)
+        # shield : l'annulation d'un calcul n'interrompt pas l'écriture des autres
+        await asyncio.shield(self._flushed)
+
+    def release(self, file_hash: str):
+        """Le fichier n'attend plus de calcul dans ce lot ; écrit le lot quand plus aucun n'en attend"""
+        if file_hash not in self._pending:
+            return
+        self._pending.discard(file_hash)
+        if not self._pending:
+            asyncio.ensure_future(self._flush())
+
+    async def _flush(self):
+        try:
+            await set_cached_results(self.results)
+        finally:
+            self._flushed.set_result(None)
+
+
+async def find_perceptual_match(file_hash: str, file_data: bytes, is_pdf: bool) -> Optional[Dict]:
+    """Cherche le résultat en cache d'un document quasi identique (hash perceptuel)"""
+    signatures = await run_in_threadpool(compute_document_signatures, file_data, is_pdf)
+    if not signatures:
+        return None
+    
+    match = await find_near_duplicate(file_hash, signatures)
+    if match is None:
+        return None
+    
+    matched_hash, distance = match
+    cached_result = await get_cached_result(matched_hash)
+    if not cached_result:
+        # Résultat expiré du cache : oublier l'entrée
+        get_perceptual_index().remove(matched_hash)
+        return None
+    
+    log_cache_perceptual_hit(distance)
+    return cached_result
+
+
+async def lookup_cached_results(documents: List[Tuple[str, bytes, bool]]) -> List[Tuple[Optional[Dict], Optional[str]]]:
+    """
+    Cherche plusieurs résultats OCR en cache : hash exacts en un seul MGET,
+    puis hash perceptuel pour les absents si activé
+    
+    Args:
+        documents: Liste de (file_hash, file_data, is_pdf)
+    
+    Returns:
+        Pour chaque document : (résultat ou None, type de match : "exact", "perceptual" ou None)
+    """
+    cached_results = await get_cached_results([file_hash for file_hash, _, _ in documents])
+    lookups = [(result, "exact") if result else (None, None) for result in cached_results]
+    
+    if get_perceptual_index() is not None:
+        perceptual_hits = {}
+        for i, (file_hash, file_data, is_pdf) in enumerate(documents):
+            if lookups[i][0] is None:
+                cached_result = await find_perceptual_match(file_hash, file_data, is_pdf)
+                if cached_result:
+                    lookups[i] = (cached_result, "perceptual")
+                    perceptual_hits[file_hash] = cached_result
+        
+        # Les renvois à l'identique de ces fichiers deviennent des hits exacts
+        await set_cached_results(perceptual_hits)
+    
+    # Description des documents pour le journal des requêtes lentes (jamais leur contenu)
+    for (file_hash, file_data, is_pdf), (_, cache_match) in zip(documents, lookups):
+        describe_document(file_hash, size_bytes=len(file_data), kind="pdf" if is_pdf else "image", cache=cache_match or "miss")
+    return lookups
+
+
+async def lookup_cached_result(file_hash: str, file_data: bytes, is_pdf: bool) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Cherche un résultat OCR en cache : hash exact, puis hash perceptuel si activé
+    
+    Returns:
+        (résultat ou None, type de match : "exact", "perceptual" ou None)
+    """
+    return (await lookup_cached_results([(file_hash, file_data, is_pdf)]))[0]
+
+
+def get_page_cache_key(page_hash: str, language: str) -> str:
+    """Clé de cache de l'OCR d'une page PDF"""
+    return f"ocr_page:{language}:{page_hash}"
+
+
+async def perform_ocr_with_page_cache(file_data: bytes, language: str, is_pdf: bool) -> dict:
+    """
+    Effectue l'OCR dans le threadpool ; pour un PDF, réutilise l'OCR des pages inchangées
+    
+    Un fournisseur qui renvoie un PDF corrigé (ex: date de la page 1) ne fait
+    ré-OCRiser que les pages modifiées. Les pages OCRisées et la durée de l'OCR
+    sont imputées au quota de la requête en cours. L'OCR attend son tour dans
+    la file du client (ordonnancement équitable pondéré par le plan).
+    
+    Raises:
+        OCROverloadedError: OCR saturé (503), l'attente dépasserait le SLO de latence
+    """
+    admission = get_admission_controller()
+    tenant, plan = get_request_tenant()
+    if not is_pdf:
+        async with admission.slot(pages=1, tenant=tenant, plan=plan):
+            started = time.perf_counter()
+            ocr_result = await run_in_threadpool(perform_ocr, file_data, language, is_pdf=False)
+        ocr_seconds = time.perf_counter() - started
+        record_ocr_usage(1, ocr_seconds)
+        log_ocr_pages("image", 1, ocr_seconds)
+        describe_current_document(pages=1, ocr_language=ocr_result["language"])
+        return ocr_result
+    
+    # Hash du contenu des pages (sans rendu) : seules les pages absentes du cache sont rendues, dans le créneau
+    page_hashes = await run_in_threadpool(compute_pdf_page_hashes, file_data)
+    cached = await get_many_cached([get_page_cache_key(page_hash, language) for page_hash in page_hashes])
+    cached_pages = {page_num: page for page_num, page in enumerate(cached) if page}
+    log_page_cache(len(cached_pages), len(page_hashes) - len(cached_pages))
+    if page_hashes:
+        pages_to_ocr = len(page_hashes) - len(cached_pages)
+    else:
+        pages_to_ocr = await run_in_threadpool(count_pdf_pages, file_data)  # Sans PyMuPDF : tout le PDF
+    
+    async with admission.slot(pages=pages_to_ocr, tenant=tenant, plan=plan):
+        started = time.perf_counter()
+        ocr_result = await run_in_threadpool(perform_ocr, file_data, language, is_pdf=True, cached_pages=cached_pages)
+    ocr_pages = ocr_result.get("pages_processed", 1) - ocr_result.get("pages_from_cache", 0)
+    ocr_seconds = time.perf_counter() - started
+    record_ocr_usage(ocr_pages, ocr_seconds)
+    log_ocr_pages("pdf", ocr_pages, ocr_seconds)
+    describe_current_document(
+        pages=ocr_result.get("pages_processed", 1), pages_from_cache=ocr_result.get("pages_from_cache", 0),
+        ocr_language=ocr_result["language"]
+    )
+    
+    new_pages = ocr_result.pop("new_pages", {})
+    await set_many_cached({
+        get_page_cache_key(page_hashes[page_num], language): page
+        for page_num, page in new_pages.items() if page_num < len(page_hashes)
+    }, ttl_hours=CACHE_TTL_HOURS)
+    return ocr_result
+
+
+async def get_or_compute_ocr_result(
+    file_hash: str, file_data: bytes, language: str, is_pdf: bool,
+    batch_writer: Optional[BatchResultWriter] = None
+) -> Dict:
+    """
+    Effectue l'OCR et l'extraction d'un fichier, puis stocke le résultat dans le cache
+    
+    Les requêtes concurrentes sur un même fichier (même worker ou autre worker via Redis)
+    partagent un seul calcul OCR (single-flight).
+    
+    Args:
+        batch_writer: Écriture groupée du lot en cours (sinon écriture immédiate)
+    
+    Returns:
+        Données mises en cache : data, extracted_data, confidence_scores
+    """
+    computed_here = False
+    
+    async def compute() -> Dict:
+        nonlocal computed_here
+        computed_here = True
+        # OCR dans le threadpool : la boucle asyncio reste libre pendant Tesseract
+        ocr_result = await perform_ocr_with_page_cache(file_data, language, is_pdf)
+        
+        # Extraire les données structurées avec scores de confiance
+        extracted_data, confidence_scores = extract_invoice_data(ocr_result)
+        
+        # Préparer les données de réponse
+        response_data = {
+            "text": ocr_result["text"],
+            "language": ocr_result["language"]
+        }
+        if "pages_processed" in ocr_result:
+            response_data["pages_processed"] = ocr_result["pages_processed"]
+            response_data["pages_from_cache"] = ocr_result.get("pages_from_cache", 0)
+        
+        # Stocker dans le cache
+        cache_data = {
+            "data": response_data,
+            "extracted_data": extracted_data,
+            "confidence_scores": confidence_scores
+        }
+        if batch_writer is None:
+            await set_cached_result(file_hash, cache_data)
         else:
-            # Redis gère l'expiration automatiquement
-            return cached_data.get("result")
+            await batch_writer.add(file_hash, cache_data)
+        
+        # Indexer le hash perceptuel pour les futures versions re-scannées du document
+        if get_perceptual_index() is not None:
+            signatures = await run_in_threadpool(compute_document_signatures, file_data, is_pdf)
+            if signatures:
+                await index_document(file_hash, signatures, CACHE_TTL_HOURS)
+        return cache_data
     
-    return None
+    describe_document(file_hash, language=language)
+    on_wait = (lambda: batch_writer.release(file_hash)) if batch_writer is not None else None
+    try:
+        result = await single_flight(file_hash, compute, lambda: get_cached_result(file_hash), on_wait)
+    finally:
+        if batch_writer is not None:
+            batch_writer.release(file_hash)  # Échec, ou calcul d'une autre requête
+    if not computed_here:
+        describe_document(file_hash, cache="coalesced")  # Calculé par une autre requête
+    return result
 
 
-def set_cached_result(file_hash: str, result: Dict):
-    """Stocke un résultat dans le cache (Redis ou mémoire)"""
-    cache_key = f"ocr_result:{file_hash}"
-    cache_data = {
-        "result": result,
-        "timestamp": datetime.now().isoformat()
-    }
-    set_cached(cache_key, cache_data, ttl_hours=CACHE_TTL_HOURS)
+async def check_idempotency(request: Request) -> Optional[Dict]:
+    """
+    Réserve l'Idempotency-Key de la requête dans le store partagé (Redis, disque ou mémoire)
+    
+    Un doublon reçu pendant le traitement de la première requête attend sa fin.
+    
+    Returns:
+        Référence de la requête déjà traitée (ou toujours en cours), None si la requête doit être traitée
+    """
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        return None
+    return await claim_idempotency_key(idempotency_key)
+
+
+def duplicate_request_error(idempotent_result: Dict) -> DuplicateError:
+    """409 pour une Idempotency-Key déjà utilisée : requête traitée, ou toujours en cours"""
+    if idempotent_result.get("state") == "pending":
+        detail = "Une requête identique est toujours en cours de traitement avec cette Idempotency-Key"
+    else:
+        detail = "Une requête identique a déjà été traitée avec cette Idempotency-Key"
+    return DuplicateError(detail=detail, existing_result=idempotent_result)
 
 
-def check_idempotency(request: Request) -> Optional[Dict]:
-    """Vérifie si une Idempotency-Key existe déjà dans le cache"""
+async def store_idempotency(request: Request, file_hashes: List[str]):
+    """Marque l'Idempotency-Key comme traitée (référence aux résultats en cache, pas de copie)"""
     idempotency_key = request.headers.get("Idempotency-Key")
-    if idempotency_key and idempotency_key in idempotency_cache:
-        cached_response = idempotency_cache[idempotency_key]
-        cache_time = cached_response.get("timestamp")
-        if cache_time:
-            cache_dt = datetime.fromisoformat(cache_time)
-            if datetime.now() - cache_dt < timedelta(hours=IDEMPOTENCY_TTL_HOURS):
-                return cached_response.get("result")
-            else:
-                # Cache expiré, le supprimer
-                del idempotency_cache[idempotency_key]
-    return None
+    if idempotency_key:
+        await complete_idempotency_key(idempotency_key, file_hashes)
 
 
-def store_idempotency(request: Request, result: Dict):
-    """Stocke un résultat dans le cache d'idempotence"""
+async def release_idempotency(request: Request):
+    """Libère l'Idempotency-Key si la requête a échoué (sans effet après store_idempotency)"""
     idempotency_key = request.headers.get("Idempotency-Key")
     if idempotency_key:
-        idempotency_cache[idempotency_key] = {
-            "result": result,
-            "timestamp": datetime.now().isoformat()
-        }
-        # Limiter la taille du cache
-        if len(idempotency_cache) > 1000:
-            sorted_items = sorted(idempotency_cache.items(), key=lambda x: x[1].get("timestamp", ""))
-            for key, _ in sorted_items[:100]:
-                del idempotency_cache[key]
+        await release_idempotency_key(idempotency_key)
 
 
 # CORS middleware
@@ -242,7 +625,9 @@ async def verify_rapidapi_auth(request: Request, call_next):
         or request.url.path.startswith("/assets/")
         or request.url.path.startswith("/images/")
         or request.url.path.startswith("/marketing")
-        or request.url.path.startswith("/v1/languages")):
+        or request.url.path.startswith("/v1/languages")
+        or request.url.path.startswith("/admin/")  # Authentifié par X-Admin-Key
+        or request.url.path == "/metrics"):  # Authentifié par METRICS_BEARER_TOKEN
         response = await call_next(request)
         return response
     
@@ -286,7 +671,9 @@ class OCRResponse(BaseModel):
     extracted_data: Optional[dict] = None
     confidence_scores: Optional[dict] = None
     cached: Optional[bool] = False  # Indique si le résultat vient du cache
+    cache_match: Optional[str] = None  # Type de match cache : "exact" ou "perceptual"
     compliance: Optional[dict] = None  # Données de conformité FR (si demandé)
+    timings: Optional[Dict[str, float]] = None  # Durée par étape en ms (si include_timings)
 
 
 class BatchOCRRequest(BaseModel):
@@ -308,33 +695,97 @@ class WebhookPayload(BaseModel):
     source: str = "ocr_facture_api"
 
 
-def process_pdf_multi_page(pdf_data: bytes, language: str) -> dict:
+def render_pdf_page(page):
+    """Rendu d'une page PDF pour l'OCR (PyMuPDF, résolution x2)"""
+    return page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Augmenter la résolution
+
+
+def compute_pdf_page_hashes(pdf_data: bytes) -> List[str]:
+    """
+    Hash SHA256 du contenu de chaque page, sans la rendre
+    
+    Couvre le flux de contenu de la page, ses dimensions et sa rotation, et les
+    objets qu'elle référence (images, polices, formulaires). Une page scannée ne
+    contient qu'une référence d'image, mais les octets de l'image intégrée
+    diffèrent d'une page à l'autre et entrent dans le hash.
+    
+    Returns:
+        Liste des hash par page (vide si PyMuPDF n'est pas disponible)
+    """
+    if not FITZ_AVAILABLE:
+        return []
+    try:
+        page_hashes = []
+        with fitz.open(stream=pdf_data, filetype="pdf") as pdf_document:
+            for page in pdf_document:
+                sha256 = hashlib.sha256(f"{tuple(page.rect)}:{page.rotation}:".encode())
+                sha256.update(page.read_contents())
+                xrefs = {image[0] for image in page.get_images(full=True)}
+                xrefs.update(font[0] for font in page.get_fonts(full=True))
+                xrefs.update(xobject[0] for xobject in page.get_xobjects())
+                for xref in sorted(xref for xref in xrefs if xref > 0):
+                    sha256.update(pdf_document.xref_object(xref, compressed=True).encode())
+                    sha256.update(pdf_document.xref_stream_raw(xref) or b"")
+                page_hashes.append(sha256.hexdigest())
+        return page_hashes
+    except Exception:
+        return []
+
+
+def count_pdf_pages(pdf_data: bytes) -> int:
+    """Nombre de pages d'un PDF (estimation des créneaux OCR quand les pages ne sont pas hachées)"""
+    try:
+        from pdf2image import pdfinfo_from_bytes
+        return max(1, int(pdfinfo_from_bytes(bytes(pdf_data))["Pages"]))
+    except Exception:
+        # Sans poppler : objets /Type /Page du fichier (hors /Pages)
+        return max(1, len(re.findall(rb"/Type\s*/Page\b", pdf_data)))
+
+
+def process_pdf_multi_page(pdf_data: bytes, language: str, cached_pages: Optional[Dict[int, dict]] = None) -> dict:
     """
     Traite un PDF multi-pages et fusionne les résultats
+    
+    Args:
+        pdf_data: Contenu du PDF
+        language: Code langue Tesseract
+        cached_pages: OCR déjà en cache par numéro de page ({"text", "data"}),
+                      ces pages ne sont ni rendues ni OCRisées
     """
     all_text = []
     all_data = []
+    cached_pages = cached_pages or {}
     
     try:
         # Essayer PyMuPDF d'abord (plus rapide)
-        if PDF_SUPPORT:
+        if FITZ_AVAILABLE:
             try:
-                import fitz
                 pdf_document = fitz.open(stream=pdf_data, filetype="pdf")
+                new_pages = {}
+                dimensions = []  # Pages rendues (journal des requêtes lentes)
                 for page_num in range(len(pdf_document)):
-                    page = pdf_document[page_num]
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Augmenter la résolution
-                    img_data = pix.tobytes("png")
-                    image = Image.open(io.BytesIO(img_data))
-                    
-                    # OCR sur cette page
-                    page_text = pytesseract.image_to_string(image, lang=language)
-                    page_data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+                    cached_page = cached_pages.get(page_num)
+                    if cached_page is not None:
+                        page_text = cached_page["text"]
+                        page_data = cached_page["data"]
+                    else:
+                        with time_stage("pdf_render"):
+                            pix = render_pdf_page(pdf_document[page_num])
+                            dimensions.append([pix.width, pix.height])
+                            img_data = pix.tobytes("png")
+                            image = Image.open(io.BytesIO(img_data))
+                        
+                        # OCR sur cette page
+                        with time_stage("tesseract"):
+                            page_text = pytesseract.image_to_string(image, lang=language)
+                            page_data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+                        new_pages[page_num] = {"text": page_text, "data": page_data}
                     
                     all_text.append(f"--- Page {page_num + 1} ---\n{page_text}")
                     all_data.append(page_data)
                 
                 pdf_document.close()
+                describe_current_document(dimensions=dimensions)
                 
                 # Fusionner les textes
                 merged_text = "\n\n".join(all_text)
@@ -343,7 +794,9 @@ def process_pdf_multi_page(pdf_data: bytes, language: str) -> dict:
                     "text": merged_text,
                     "data": all_data[0] if all_data else {},  # Prendre les données de la première page
                     "language": language,
-                    "pages_processed": len(all_text)
+                    "pages_processed": len(all_text),
+                    "pages_from_cache": len(all_text) - len(new_pages),
+                    "new_pages": new_pages  # Pages OCRisées, à mettre en cache
                 }
             except Exception as e:
                 # Si PyMuPDF échoue, essayer pdf2image
@@ -353,12 +806,15 @@ def process_pdf_multi_page(pdf_data: bytes, language: str) -> dict:
         if PDF_SUPPORT:
             try:
                 from pdf2image import convert_from_bytes
-                images = convert_from_bytes(pdf_data, dpi=300)
+                with time_stage("pdf_render"):
+                    images = convert_from_bytes(pdf_data, dpi=300)
+                describe_current_document(dimensions=[list(image.size) for image in images])
                 
                 for page_num, image in enumerate(images):
                     # OCR sur cette page
-                    page_text = pytesseract.image_to_string(image, lang=language)
-                    page_data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
+                    with time_stage("tesseract"):
+                        page_text = pytesseract.image_to_string(image, lang=language)
+                        page_data = pytesseract.image_to_data(image, lang=language, output_type=pytesseract.Output.DICT)
                     
                     all_text.append(f"--- Page {page_num + 1} ---\n{page_text}")
                     all_data.append(page_data)
@@ -370,7 +826,8 @@ def process_pdf_multi_page(pdf_data: bytes, language: str) -> dict:
                     "text": merged_text,
                     "data": all_data[0] if all_data else {},
                     "language": language,
-                    "pages_processed": len(all_text)
+                    "pages_processed": len(all_text),
+                    "pages_from_cache": 0
                 }
             except Exception as e:
                 raise HTTPException(
@@ -389,10 +846,10 @@ def process_pdf_multi_page(pdf_data: bytes, language: str) -> dict:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement PDF: {str(e)}")
 
 
-def perform_ocr(image_data: bytes, language: str = "fra", is_pdf: bool = False) -> dict:
+def perform_ocr(image_data: bytes, language: str = "fra", is_pdf: bool = False, cached_pages: Optional[Dict[int, dict]] = None) -> dict:
     """
     Effectue l'OCR sur l'image utilisant pytesseract
-    Supporte les PDFs multi-pages
+    Supporte les PDFs multi-pages (cached_pages : OCR des pages déjà en cache)
     """
     try:
         # Vérifier que Tesseract est disponible
@@ -406,16 +863,17 @@ def perform_ocr(image_data: bytes, language: str = "fra", is_pdf: bool = False)
         
         # Traiter les PDFs séparément
         if is_pdf:
-            return process_pdf_multi_page(image_data, language)
+            return process_pdf_multi_page(image_data, language, cached_pages)
         
-        # Ouvrir l'image depuis les bytes
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convertir en RGB si nécessaire
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # Ouvrir l'image depuis les bytes, en RGB si nécessaire
+        with time_stage("decode"):
+            image = Image.open(open_buffer(image_data))  # Upload mappé lu sans copie
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
         
         # Préprocessing d'image amélioré (si recommandé)
+        preprocessing = {"applied": False, "dpi": float(image.info.get("dpi", (72, 72))[0])}
+        describe_current_document(dimensions=[list(image.size)], preprocessing=preprocessing)
         if should_preprocess(image):
             try:
                 image = preprocess_image(
@@ -425,9 +883,10 @@ def perform_ocr(image_data: bytes, language: str = "fra", is_pdf: bool = False)
                     deskew=True,
                     upscale=False
                 )
+                preprocessing.update(applied=True, opencv=CV2_AVAILABLE)
             except Exception as preprocess_error:
                 # Si le preprocessing échoue, continuer avec l'image originale
-                pass
+                preprocessing["error"] = type(preprocess_error).__name__
         
         # Mapping des codes langue
         lang_map = {
@@ -449,11 +908,10 @@ def perform_ocr(image_data: bytes, language: str = "fra", is_pdf: bool = False)
         except:
             pass  # Si on ne peut pas vérifier, on continue quand même
         
-        # Effectuer l'OCR
-        text = pytesseract.image_to_string(image, lang=tesseract_lang)
-        
-        # Obtenir les données détaillées
-        data = pytesseract.image_to_data(image, lang=tesseract_lang, output_type=pytesseract.Output.DICT)
+        # Effectuer l'OCR et obtenir les données détaillées
+        with time_stage("tesseract"):
+            text = pytesseract.image_to_string(image, lang=tesseract_lang)
+            data = pytesseract.image_to_data(image, lang=tesseract_lang, output_type=pytesseract.Output.DICT)
         
         return {
             "text": text,
@@ -810,6 +1268,7 @@ def extract_banking_info(text: str, lines: List[str]) -> Dict:
     return banking_info
 
 
+@time_stage("extraction")
 def extract_invoice_data(ocr_result: dict) -> tuple[dict, dict]:
     """
     Extrait les données structurées de la facture depuis le résultat OCR
@@ -1135,13 +1594,15 @@ async def root():
 async def health_check():
     """Vérifie l'état de santé de l'API et les dépendances"""
     # Informations sur le cache
-    cache_info = get_cache_info()
+    cache_info = await get_cache_info()
     
     health_status = {
         "status": "healthy",
         "debug_mode": settings.debug_mode,
         "api_version": "2.0.0",
-        "cache": cache_info
+        "cache": cache_info,
+        "perceptual_cache": get_perceptual_index_info(),
+        "ocr_admission": get_admission_info()
     }
     
     # Vérifier si Tesseract est disponible
@@ -1166,6 +1627,23 @@ async def health_check():
     return health_status
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """
+    Métriques au format texte Prometheus (latence par route et plan, OCR par page,
+    étapes du traitement, cache par niveau, refus 429/503, API externes)
+    
+    Compteurs de tous les workers (derniers instantanés publiés dans Redis ou
+    METRICS_SHARED_DIR, jusqu'à METRICS_FLUSH_INTERVAL de retard), sinon de ce worker ;
+    exige `Authorization: Bearer <METRICS_BEARER_TOKEN>` si configuré.
+    """
+    if settings.metrics_bearer_token:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(token.encode(), settings.metrics_bearer_token.encode()):
+            raise HTTPException(status_code=401, detail="Invalid or missing metrics bearer token")
+    return Response(content=await render_cluster_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # Version originale (sans /v1/) - À déprécier progressivement
 @app.post("/ocr/upload", response_model=OCRResponse)
 async def upload_and_ocr(
@@ -1196,13 +1674,18 @@ async def upload_and_ocr(
             detail="Le fichier doit être une image (jpeg, png) ou un PDF"
         )
     
+    upload = None
     try:
-        # Lire le contenu du fichier
-        file_data = await file.read()
+        # Upload lu sur place : SHA256 sans recopie, gros fichiers mappés depuis le fichier temporaire de Starlette
+        upload = await spool_upload(file)
+        file_data = upload.data
         
-        # Vérifier le cache
-        file_hash = get_file_hash(file_data)
-        cached_result = get_cached_result(file_hash)
+        # Détecter si c'est un PDF
+        is_pdf = file.content_type == "application/pdf" or (file.filename and file.filename.lower().endswith('.pdf'))
+        
+        # Vérifier le cache (hash exact sans décoder le document)
+        file_hash = upload.file_hash
+        cached_result, cache_match = await lookup_cached_result(file_hash, file_data, is_pdf)
         
         if cached_result:
             # Retourner le résultat depuis le cache
@@ -1211,39 +1694,18 @@ async def upload_and_ocr(
                 data=cached_result.get("data"),
                 extracted_data=cached_result.get("extracted_data"),
                 confidence_scores=cached_result.get("confidence_scores"),
-                cached=True
+                cached=True,
+                cache_match=cache_match
             )
         
-        # Détecter si c'est un PDF
-        is_pdf = file.content_type == "application/pdf" or (file.filename and file.filename.lower().endswith('.pdf'))
-        
-        # Effectuer l'OCR
-        ocr_result = perform_ocr(file_data, language, is_pdf=is_pdf)
-        
-        # Extraire les données structurées avec scores de confiance
-        extracted_data, confidence_scores = extract_invoice_data(ocr_result)
-        
-        # Préparer les données de réponse
-        response_data = {
-            "text": ocr_result["text"],
-            "language": ocr_result["language"]
-        }
-        if "pages_processed" in ocr_result:
-            response_data["pages_processed"] = ocr_result["pages_processed"]
-        
-        # Stocker dans le cache
-        cache_data = {
-            "data": response_data,
-            "extracted_data": extracted_data,
-            "confidence_scores": confidence_scores
-        }
-        set_cached_result(file_hash, cache_data)
+        # Effectuer l'OCR (dédupliqué) et stocker dans le cache
+        ocr_data = await get_or_compute_ocr_result(file_hash, file_data, language, is_pdf)
         
         return OCRResponse(
             success=True,
-            data=response_data,
-            extracted_data=extracted_data,
-            confidence_scores=confidence_scores,
+            data=ocr_data["data"],
+            extracted_data=ocr_data["extracted_data"],
+            confidence_scores=ocr_data["confidence_scores"],
             cached=False
         )
     
@@ -1254,6 +1716,9 @@ async def upload_and_ocr(
             success=False,
             error=str(e)
         )
+    finally:
+        if upload:
+            upload.close()
 
 
 # Version v1 avec idempotence et codes d'erreur spécifiques
@@ -1262,7 +1727,8 @@ async def upload_and_ocr_v1(
     request: Request,
     file: UploadFile = File(...),
     language: str = Form("fra"),
-    check_compliance: bool = Form(False)
+    check_compliance: bool = Form(False),
+    include_timings: bool = Form(False)
 ):
     """
     Upload une image de facture et extrait automatiquement les données structurées.
@@ -1276,21 +1742,16 @@ async def upload_and_ocr_v1(
     - `file`: Fichier image (JPEG, PNG, PDF)
     - `language`: Code langue pour OCR (fra, eng, deu, spa, ita, por). Défaut: fra
     - `check_compliance`: Activer validation conformité FR (bool). Défaut: false
+    - `include_timings`: Ajouter la durée par étape (`timings`, en ms) à la réponse. Défaut: false
+      (toujours disponible dans le header `Server-Timing`)
     
     **Codes d'erreur:**
     - 400 : Fichier invalide
     - 409 : Doublon détecté (Idempotency-Key)
     - 422 : Erreur de conformité
+    - 503 : OCR saturé, réessayer après le délai indiqué par Retry-After
     - 504 : Timeout OCR
     """
-    # Vérifier l'idempotence
-    idempotent_result = check_idempotency(request)
-    if idempotent_result:
-        raise DuplicateError(
-            detail="Une requête identique a déjà été traitée avec cette Idempotency-Key",
-            existing_result=idempotent_result
-        )
-    
     # Vérifier le type de fichier
     if not file.content_type or not (file.content_type.startswith("image/") or file.content_type == "application/pdf"):
         raise HTTPException(
@@ -1298,13 +1759,23 @@ async def upload_and_ocr_v1(
             detail="Le fichier doit être une image (jpeg, png) ou un PDF"
         )
     
+    # Vérifier l'idempotence (un doublon en cours de traitement attend sa fin)
+    idempotent_result = await check_idempotency(request)
+    if idempotent_result:
+        raise duplicate_request_error(idempotent_result)
+    
+    upload = None
     try:
-        # Lire le contenu du fichier
-        file_data = await file.read()
+        # Upload lu sur place : SHA256 sans recopie, gros fichiers mappés depuis le fichier temporaire de Starlette
+        upload = await spool_upload(file)
+        file_data = upload.data
         
-        # Vérifier le cache
-        file_hash = get_file_hash(file_data)
-        cached_result = get_cached_result(file_hash)
+        # Détecter si c'est un PDF
+        is_pdf = file.content_type == "application/pdf" or (file.filename and file.filename.lower().endswith('.pdf'))
+        
+        # Vérifier le cache (hash exact sans décoder le document)
+        file_hash = upload.file_hash
+        cached_result, cache_match = await lookup_cached_result(file_hash, file_data, is_pdf)
         
         if cached_result:
             log_cache_hit("/v1/ocr/upload")
@@ -1313,25 +1784,25 @@ async def upload_and_ocr_v1(
                 data=cached_result.get("data"),
                 extracted_data=cached_result.get("extracted_data"),
                 confidence_scores=cached_result.get("confidence_scores"),
-                cached=True
+                cached=True,
+                cache_match=cache_match,
+                timings=get_request_timings() if include_timings else None
             )
             # Stocker pour idempotence
-            store_idempotency(request, result.dict())
+            await store_idempotency(request, [file_hash])
             return result
         
-        # Détecter si c'est un PDF
-        is_pdf = file.content_type == "application/pdf" or (file.filename and file.filename.lower().endswith('.pdf'))
-        
-        # Effectuer l'OCR avec timeout
+        # Effectuer l'OCR (dédupliqué) avec timeout
         try:
-            ocr_result = perform_ocr(file_data, language, is_pdf=is_pdf)
+            ocr_data = await get_or_compute_ocr_result(file_hash, file_data, language, is_pdf)
         except Exception as ocr_error:
             if "timeout" in str(ocr_error).lower() or "timed out" in str(ocr_error).lower():
                 raise TimeoutError("Le traitement OCR a dépassé le délai maximum (30 secondes)")
             raise
         
-        # Extraire les données structurées avec scores de confiance
-        extracted_data, confidence_scores = extract_invoice_data(ocr_result)
+        response_data = ocr_data["data"]
+        extracted_data = ocr_data["extracted_data"]
+        confidence_scores = ocr_data["confidence_scores"]
         
         # Validation compliance si demandée
         compliance_data = None
@@ -1339,7 +1810,7 @@ async def upload_and_ocr_v1(
             try:
                 compliance_data = extract_compliance_data(
                     extracted_data,
-                    ocr_result["text"],
+                    response_data["text"],
                     siren_api_key=settings.sirene_api_key,
                     siren_api_secret=settings.sirene_api_secret,
                     siren_client_id=settings.sirene_client_id,
@@ -1356,23 +1827,9 @@ async def upload_and_ocr_v1(
             except Exception as comp_error:
                 raise ComplianceError(detail=f"Erreur lors de la validation de conformité : {str(comp_error)}")
         
-        # Préparer les données de réponse
-        response_data = {
-            "text": ocr_result["text"],
-            "language": ocr_result["language"]
-        }
-        if "pages_processed" in ocr_result:
-            response_data["pages_processed"] = ocr_result["pages_processed"]
-        
-        # Stocker dans le cache
-        cache_data = {
-            "data": response_data,
-            "extracted_data": extracted_data,
-            "confidence_scores": confidence_scores
-        }
+        # Compléter le cache avec la conformité (copie : ocr_data peut être partagé)
         if compliance_data:
-            cache_data["compliance"] = compliance_data
-        set_cached_result(file_hash, cache_data)
+            await set_cached_result(file_hash, {**ocr_data, "compliance": compliance_data})
         
         result = OCRResponse(
             success=True,
@@ -1380,11 +1837,12 @@ async def upload_and_ocr_v1(
             extracted_data=extracted_data,
             confidence_scores=confidence_scores,
             cached=False,
-            compliance=compliance_data
+            compliance=compliance_data,
+            timings=get_request_timings() if include_timings else None
         )
         
         # Stocker pour idempotence
-        store_idempotency(request, result.dict())
+        await store_idempotency(request, [file_hash])
         
         return result
     
@@ -1392,6 +1850,44 @@ async def upload_and_ocr_v1(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement : {str(e)}")
+    finally:
+        await release_idempotency(request)
+        if upload:
+            upload.close()
+
+
+@v1_router.api_route("/ocr/result/{sha256}", methods=["GET", "HEAD"], response_model=OCRResponse)
+async def get_ocr_result_v1(sha256: str):
+    """
+    Retourne le résultat OCR en cache d'un document à partir de son SHA256, sans upload.
+    
+    Le client calcule le hash du fichier localement : si le document a déjà été
+    traité, le résultat est renvoyé sans transférer le fichier. `HEAD` permet de
+    tester la présence sans recevoir le résultat.
+    
+    **Codes d'erreur:**
+    - 400 : Hash invalide (64 caractères hexadécimaux attendus)
+    - 404 : Aucun résultat en cache pour ce document
+    """
+    file_hash = sha256.lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", file_hash):
+        raise HTTPException(status_code=400, detail="Hash invalide : SHA256 hexadécimal (64 caractères) attendu")
+    
+    cached_result = await get_cached_result(file_hash)
+    if not cached_result:
+        log_cache_miss("/v1/ocr/result")
+        raise HTTPException(status_code=404, detail="Aucun résultat en cache pour ce document")
+    
+    log_cache_hit("/v1/ocr/result")
+    return OCRResponse(
+        success=True,
+        data=cached_result.get("data"),
+        extracted_data=cached_result.get("extracted_data"),
+        confidence_scores=cached_result.get("confidence_scores"),
+        cached=True,
+        cache_match="exact",
+        compliance=cached_result.get("compliance")
+    )
 
 
 @app.post("/ocr/base64")
@@ -1419,7 +1915,7 @@ async def ocr_from_base64(
         
         # Vérifier le cache
         file_hash = get_file_hash(file_data)
-        cached_result = get_cached_result(file_hash)
+        cached_result, cache_match = await lookup_cached_result(file_hash, file_data, is_pdf)
         
         if cached_result:
             log_cache_hit("/ocr/base64")
@@ -1429,40 +1925,24 @@ async def ocr_from_base64(
                 data=cached_result.get("data"),
                 extracted_data=cached_result.get("extracted_data"),
                 confidence_scores=cached_result.get("confidence_scores"),
-                cached=True
+                cached=True,
+                cache_match=cache_match
             )
         
         log_cache_miss("/ocr/base64")
-        # Effectuer l'OCR
-        ocr_result = perform_ocr(file_data, language, is_pdf=is_pdf)
-        
-        # Extraire les données structurées avec scores de confiance
-        extracted_data, confidence_scores = extract_invoice_data(ocr_result)
-        
-        # Préparer les données de réponse
-        response_data = {
-            "text": ocr_result["text"],
-            "language": ocr_result["language"]
-        }
-        if "pages_processed" in ocr_result:
-            response_data["pages_processed"] = ocr_result["pages_processed"]
-        
-        # Stocker dans le cache
-        cache_data = {
-            "data": response_data,
-            "extracted_data": extracted_data,
-            "confidence_scores": confidence_scores
-        }
-        set_cached_result(file_hash, cache_data)
+        # Effectuer l'OCR (dédupliqué) et stocker dans le cache
+        ocr_data = await get_or_compute_ocr_result(file_hash, file_data, language, is_pdf)
         
         return OCRResponse(
             success=True,
-            data=response_data,
-            extracted_data=extracted_data,
-            confidence_scores=confidence_scores,
+            data=ocr_data["data"],
+            extracted_data=ocr_data["extracted_data"],
+            confidence_scores=ocr_data["confidence_scores"],
             cached=False
         )
     
+    except OCROverloadedError:
+        raise  # 503 + Retry-After : le client doit différer, pas réessayer aussitôt
     except Exception as e:
         return OCRResponse(
             success=False,
@@ -1470,6 +1950,113 @@ async def ocr_from_base64(
         )
 
 
+def decode_base64_document(file_base64: str) -> Tuple[bytes, bool]:
+    """Décode un document base64 (avec ou sans préfixe data:) ; retourne (contenu, is_pdf)"""
+    is_pdf = False
+    if file_base64.startswith("data:image"):
+        file_base64 = file_base64.split(",")[1]
+    elif file_base64.startswith("data:application/pdf"):
+        is_pdf = True
+        file_base64 = file_base64.split(",")[1]
+    return base64.b64decode(file_base64), is_pdf
+
+
+async def process_batch_files(
+    files: List[str], language: str, raise_timeouts: bool = False
+) -> Tuple[List["OCRResponse"], int, List[Optional[str]]]:
+    """
+    Traite un lot de documents base64 : tous les hits de cache sont résolus
+    en un seul aller-retour, seuls les absents passent par l'OCR
+    
+    Args:
+        files: Documents encodés en base64
+        language: Code langue OCR
+        raise_timeouts: Convertir les timeouts OCR en TimeoutError (v1)
+    
+    Returns:
+        (réponses dans l'ordre des fichiers, nombre servi depuis le cache,
+         hash de chaque fichier ou None s'il n'a pas pu être décodé)
+    """
+    results: List[Optional[OCRResponse]] = [None] * len(files)
+    file_hashes: List[Optional[str]] = [None] * len(files)
+    documents = []  # (index, file_hash, file_data, is_pdf)
+    
+    for i, file_base64 in enumerate(files):
+        try:
+            file_data, is_pdf = decode_base64_document(file_base64)
+            file_hashes[i] = get_file_hash(file_data)
+            documents.append((i, file_hashes[i], file_data, is_pdf))
+        except Exception as e:
+            results[i] = OCRResponse(success=False, error=str(e))
+    
+    # Vérifier le cache pour tout le lot
+    lookups = await lookup_cached_results([(file_hash, file_data, is_pdf) for _, file_hash, file_data, is_pdf in documents])
+    total_cached = 0
+    misses: Dict[str, Tuple[bytes, bool, List[int]]] = {}  # Doublons dans le lot : un seul OCR
+    
+    for (i, file_hash, file_data, is_pdf), (cached_result, cache_match) in zip(documents, lookups):
+        if cached_result:
+            results[i] = OCRResponse(
+                success=True,
+                data=cached_result.get("data"),
+                extracted_data=cached_result.get("extracted_data"),
+                confidence_scores=cached_result.get("confidence_scores"),
+                cached=True,
+                cache_match=cache_match
+            )
+            total_cached += 1
+        else:
+            misses.setdefault(file_hash, (file_data, is_pdf, []))[2].append(i)
+    
+    # OCR des absents en parallèle (créneaux d'admission) ; résultats écrits en un seul pipeline
+    batch_writer = BatchResultWriter(list(misses))
+    
+    async def compute_document(file_hash: str, file_data: bytes, is_pdf: bool) -> OCRResponse:
+        try:
+            # Effectuer l'OCR (dédupliqué) et stocker dans le cache
+            try:
+                ocr_data = await get_or_compute_ocr_result(file_hash, file_data, language, is_pdf, batch_writer)
+            except Exception as ocr_error:
+                if raise_timeouts and "timeout" in str(ocr_error).lower():
+                    raise TimeoutError("Le traitement OCR a dépassé le délai maximum")
+                raise
+            return OCRResponse(
+                success=True,
+                data=ocr_data["data"],
+                extracted_data=ocr_data["extracted_data"],
+                confidence_scores=ocr_data["confidence_scores"],
+                cached=False
+            )
+        except OCROverloadedError:
+            raise
+        except Exception as e:
+            return OCRResponse(success=False, error=str(e))
+    
+    tasks = [
+        asyncio.ensure_future(compute_document(file_hash, file_data, is_pdf))
+        for file_hash, (file_data, is_pdf, _) in misses.items()
+    ]
+    try:
+        responses = await asyncio.gather(*tasks)
+    except BaseException:
+        # 503 + Retry-After pour tout le lot : inutile de poursuivre l'OCR des autres fichiers
+        for task in tasks:
+            task.cancel()
+        raise
+    
+    for (_, _, indexes), response in zip(misses.values(), responses):
+        results[indexes[0]] = response
+        for i in indexes[1:]:
+            # Doublon dans le lot : servi par le calcul du premier
+            if response.success:
+                results[i] = response.model_copy(update={"cached": True, "cache_match": "exact"})
+                total_cached += 1
+            else:
+                results[i] = response
+    
+    return results, total_cached, file_hashes
+
+
 @app.post("/ocr/batch", response_model=BatchOCRResponse)
 async def batch_ocr(batch_request: BatchOCRRequest):
     """
@@ -1492,69 +2079,7 @@ async def batch_ocr(batch_request: BatchOCRRequest):
             detail="Maximum 10 fichiers par requête batch"
         )
     
-    results = []
-    total_cached = 0
-    
-    for file_base64 in batch_request.files:
-        try:
-            # Décoder l'image base64
-            is_pdf = False
-            if file_base64.startswith("data:image"):
-                file_base64 = file_base64.split(",")[1]
-            elif file_base64.startswith("data:application/pdf"):
-                is_pdf = True
-                file_base64 = file_base64.split(",")[1]
-            
-            file_data = base64.b64decode(file_base64)
-            
-            # Vérifier le cache
-            file_hash = get_file_hash(file_data)
-            cached_result = get_cached_result(file_hash)
-            
-            if cached_result:
-                results.append(OCRResponse(
-                    success=True,
-                    data=cached_result.get("data"),
-                    extracted_data=cached_result.get("extracted_data"),
-                    confidence_scores=cached_result.get("confidence_scores"),
-                    cached=True
-                ))
-                total_cached += 1
-            else:
-                # Effectuer l'OCR
-                ocr_result = perform_ocr(file_data, batch_request.language, is_pdf=is_pdf)
-                
-                # Extraire les données structurées
-                extracted_data, confidence_scores = extract_invoice_data(ocr_result)
-                
-                # Préparer les données de réponse
-                response_data = {
-                    "text": ocr_result["text"],
-                    "language": ocr_result["language"]
-                }
-                if "pages_processed" in ocr_result:
-                    response_data["pages_processed"] = ocr_result["pages_processed"]
-                
-                # Stocker dans le cache
-                cache_data = {
-                    "data": response_data,
-                    "extracted_data": extracted_data,
-                    "confidence_scores": confidence_scores
-                }
-                set_cached_result(file_hash, cache_data)
-                
-                results.append(OCRResponse(
-                    success=True,
-                    data=response_data,
-                    extracted_data=extracted_data,
-                    confidence_scores=confidence_scores,
-                    cached=False
-                ))
-        except Exception as e:
-            results.append(OCRResponse(
-                success=False,
-                error=str(e)
-            ))
+    results, total_cached, _ = await process_batch_files(batch_request.files, batch_request.language)
     
     return BatchOCRResponse(
         success=True,
@@ -2084,15 +2609,13 @@ async def export_json_endpoint(
 async def ocr_from_base64_v1(
     request: Request,
     image_base64: str = Form(...),
-    language: str = Form("fra")
+    language: str = Form("fra"),
+    include_timings: bool = Form(False)
 ):
-    """Version v1 de /ocr/base64 avec idempotence"""
-    idempotent_result = check_idempotency(request)
+    """Version v1 de /ocr/base64 avec idempotence (`include_timings` : durée par étape dans la réponse)"""
+    idempotent_result = await check_idempotency(request)
     if idempotent_result:
-        raise DuplicateError(
-            detail="Une requête identique a déjà été traitée avec cette Idempotency-Key",
-            existing_result=idempotent_result
-        )
+        raise duplicate_request_error(idempotent_result)
     
     try:
         is_pdf = False
@@ -2104,7 +2627,7 @@ async def ocr_from_base64_v1(
         
         file_data = base64.b64decode(image_base64)
         file_hash = get_file_hash(file_data)
-        cached_result = get_cached_result(file_hash)
+        cached_result, cache_match = await lookup_cached_result(file_hash, file_data, is_pdf)
         
         if cached_result:
             result = OCRResponse(
@@ -2112,128 +2635,64 @@ async def ocr_from_base64_v1(
                 data=cached_result.get("data"),
                 extracted_data=cached_result.get("extracted_data"),
                 confidence_scores=cached_result.get("confidence_scores"),
-                cached=True
+                cached=True,
+                cache_match=cache_match,
+                timings=get_request_timings() if include_timings else None
             )
-            store_idempotency(request, result.dict())
+            await store_idempotency(request, [file_hash])
             return result
         
         try:
-            ocr_result = perform_ocr(file_data, language, is_pdf=is_pdf)
+            ocr_data = await get_or_compute_ocr_result(file_hash, file_data, language, is_pdf)
         except Exception as ocr_error:
             if "timeout" in str(ocr_error).lower():
                 raise TimeoutError("Le traitement OCR a dépassé le délai maximum")
             raise
         
-        extracted_data, confidence_scores = extract_invoice_data(ocr_result)
-        response_data = {
-            "text": ocr_result["text"],
-            "language": ocr_result["language"]
-        }
-        if "pages_processed" in ocr_result:
-            response_data["pages_processed"] = ocr_result["pages_processed"]
-        
-        cache_data = {
-            "data": response_data,
-            "extracted_data": extracted_data,
-            "confidence_scores": confidence_scores
-        }
-        set_cached_result(file_hash, cache_data)
-        
         result = OCRResponse(
             success=True,
-            data=response_data,
-            extracted_data=extracted_data,
-            confidence_scores=confidence_scores,
-            cached=False
+            data=ocr_data["data"],
+            extracted_data=ocr_data["extracted_data"],
+            confidence_scores=ocr_data["confidence_scores"],
+            cached=False,
+            timings=get_request_timings() if include_timings else None
         )
-        store_idempotency(request, result.dict())
+        await store_idempotency(request, [file_hash])
         return result
     
     except (HTTPException, DuplicateError, TimeoutError):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await release_idempotency(request)
 
 
 @v1_router.post("/ocr/batch", response_model=BatchOCRResponse)
 async def batch_ocr_v1(request: Request, batch_request: BatchOCRRequest):
     """Version v1 de /ocr/batch avec idempotence"""
-    idempotent_result = check_idempotency(request)
-    if idempotent_result:
-        raise DuplicateError(
-            detail="Une requête identique a déjà été traitée avec cette Idempotency-Key",
-            existing_result=idempotent_result
-        )
-    
     if len(batch_request.files) > 10:
         raise HTTPException(status_code=400, detail="Maximum 10 fichiers par requête batch")
     
-    results = []
-    total_cached = 0
-    
-    for file_base64 in batch_request.files:
-        try:
-            is_pdf = False
-            if file_base64.startswith("data:image"):
-                file_base64 = file_base64.split(",")[1]
-            elif file_base64.startswith("data:application/pdf"):
-                is_pdf = True
-                file_base64 = file_base64.split(",")[1]
-            
-            file_data = base64.b64decode(file_base64)
-            file_hash = get_file_hash(file_data)
-            cached_result = get_cached_result(file_hash)
-            
-            if cached_result:
-                results.append(OCRResponse(
-                    success=True,
-                    data=cached_result.get("data"),
-                    extracted_data=cached_result.get("extracted_data"),
-                    confidence_scores=cached_result.get("confidence_scores"),
-                    cached=True
-                ))
-                total_cached += 1
-            else:
-                try:
-                    ocr_result = perform_ocr(file_data, batch_request.language, is_pdf=is_pdf)
-                except Exception as ocr_error:
-                    if "timeout" in str(ocr_error).lower():
-                        raise TimeoutError("Le traitement OCR a dépassé le délai maximum")
-                    raise
-                
-                extracted_data, confidence_scores = extract_invoice_data(ocr_result)
-                response_data = {
-                    "text": ocr_result["text"],
-                    "language": ocr_result["language"]
-                }
-                if "pages_processed" in ocr_result:
-                    response_data["pages_processed"] = ocr_result["pages_processed"]
-                
-                cache_data = {
-                    "data": response_data,
-                    "extracted_data": extracted_data,
-                    "confidence_scores": confidence_scores
-                }
-                set_cached_result(file_hash, cache_data)
-                
-                results.append(OCRResponse(
-                    success=True,
-                    data=response_data,
-                    extracted_data=extracted_data,
-                    confidence_scores=confidence_scores,
-                    cached=False
-                ))
-        except Exception as e:
-            results.append(OCRResponse(success=False, error=str(e)))
+    idempotent_result = await check_idempotency(request)
+    if idempotent_result:
+        raise duplicate_request_error(idempotent_result)
     
-    result = BatchOCRResponse(
-        success=True,
-        results=results,
-        total_processed=len(batch_request.files),
-        total_cached=total_cached
-    )
-    store_idempotency(request, result.dict())
-    return result
+    try:
+        results, total_cached, file_hashes = await process_batch_files(
+            batch_request.files, batch_request.language, raise_timeouts=True
+        )
+        
+        result = BatchOCRResponse(
+            success=True,
+            results=results,
+            total_processed=len(batch_request.files),
+            total_cached=total_cached
+        )
+        await store_idempotency(request, [file_hash for file_hash in file_hashes if file_hash])
+        return result
+    finally:
+        await release_idempotency(request)
 
 
 @v1_router.post("/compliance/check")
@@ -2280,22 +2739,33 @@ async def get_quota_v1(request: Request):
     """
     Retourne les informations sur le quota restant pour l'utilisateur
     
+    Les quotas sont exprimés en unités : une requête simple ou un résultat en
+    cache coûte une unité, un OCR coûte une unité par page OCRisée (ou par
+    tranche de secondes d'OCR si plus élevé), voir "costs".
+    
     Headers retournés:
     - X-RateLimit-Limit: Limite totale
-    - X-RateLimit-Remaining: Requêtes restantes
+    - X-RateLimit-Remaining: Unités restantes
     - X-RateLimit-Reset: Timestamp de réinitialisation
     - X-RateLimit-Plan: Plan actuel
+    - X-RateLimit-Cost: Unités facturées pour la requête
     """
     from rate_limiting import get_plan_from_request, check_rate_limit
     
     plan = get_plan_from_request(request)
-    daily_allowed, daily_info = check_rate_limit(request, limit_type="daily")
-    
-    # Pour monthly, calculer depuis daily si nécessaire
-    monthly_allowed, monthly_info = check_rate_limit(request, limit_type="monthly")
+    # Consultation seule (cost=0) : cette requête a déjà été comptée par le middleware
+    daily_allowed, daily_info = await check_rate_limit(request, limit_type="daily", cost=0)
+    monthly_allowed, monthly_info = await check_rate_limit(request, limit_type="monthly", cost=0)
     
     return {
         "plan": plan,
+        "unit": "request",
+        "costs": {
+            "request": QUOTA_COSTS["request"],
+            "cached_result": QUOTA_COSTS["request"],
+            "ocr_page": QUOTA_COSTS["page"],
+            "ocr_seconds_per_unit": QUOTA_COSTS["ocr_seconds"]
+        },
         "daily": {
             "limit": daily_info["limit"] if daily_info else None,
             "remaining": daily_info["remaining"] if daily_info else None,
@@ -2314,9 +2784,11 @@ async def get_metrics_v1(request: Request):
     """
     Retourne les métriques de performance de l'API
     
+    Agrégées sur tous les workers (bloc "cluster" : nombre de workers, backend).
+    
     Note: Endpoint pour monitoring interne, peut nécessiter authentification admin
     """
-    metrics_data = get_metrics()
+    metrics_data = await get_cluster_metrics()
     return {
         "status": "ok",
         "metrics": metrics_data,
@@ -2324,8 +2796,219 @@ async def get_metrics_v1(request: Request):
     }
 
 
-# Inclure le router v1 dans l'application
+def verify_admin_key(request: Request):
+    """Vérifie le header X-Admin-Key (endpoints /admin introuvables si ADMIN_API_KEY n'est pas configurée)"""
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    admin_key = request.headers.get("X-Admin-Key", "")
+    if not hmac.compare_digest(admin_key.encode(), settings.admin_api_key.encode()):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Key header")
+
+
+@admin_router.get("/cache/export")
+async def admin_export_cache(request: Request, prefix: str = "ocr_"):
+    """
+    Exporte le cache en flux (archive gzip de lignes JSON, TTL restants inclus)
+    """
+    verify_admin_key(request)
+    filename = f"cache-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+    return StreamingResponse(
+        iter_export_chunks(prefix),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@admin_router.post("/cache/import")
+async def admin_import_cache(
+    request: Request,
+    file: UploadFile = File(...),
+    hashes: Optional[str] = Form(None)
+):
+    """
+    Importe une archive exportée par /admin/cache/export
+    
+    - `hashes`: Liste de hash de fichiers séparés par des virgules (optionnel, filtre l'import)
+    """
+    verify_admin_key(request)
+    only_hashes = {h.strip() for h in hashes.split(",") if h.strip()} if hashes else None
+    try:
+        counts = await import_cache(file.file, only_hashes=only_hashes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **counts}
+
+
+@admin_router.post("/cache/prewarm")
+async def admin_prewarm_cache(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    language: str = Form("fra"),
+    concurrency: int = Form(PREWARM_CONCURRENCY)
+):
+    """
+    Pré-chauffe le cache : OCR des documents envoyés (déjà en cache = ignorés)
+    """
+    verify_admin_key(request)
+    documents = [(file.filename or "", await file.read()) for file in files]
+    counts = await prewarm_documents(documents, language=language, concurrency=max(1, min(concurrency, 16)))
+    return {"success": True, **counts}
+
+
+@admin_router.get("/ocr/queues")
+async def admin_ocr_queues(request: Request, limit: int = 50):
+    """
+    Files OCR par tenant (profondeur, attente moyenne et max) et agrégats par plan
+
+    Sert à régler les poids OCR des plans (PLAN_LIMITS["ocr_weight"]) ; le
+    détail par client n'est pas exposé sur /health.
+    """
+    verify_admin_key(request)
+    admission = get_admission_controller()
+    return {
+        **admission.info(),
+        "tenants": admission.tenant_stats(limit=max(1, min(limit, 1000)))
+    }
+
+
+@admin_router.get("/slow-requests")
+async def admin_slow_requests(request: Request, endpoint: Optional[str] = None, limit: int = 10):
+    """
+    Requêtes les plus lentes par route sur la fenêtre glissante (ce worker)
+
+    Chaque fiche donne la durée par étape et, par document, SHA256, taille,
+    pages, dimensions, langue, prétraitement et issue du cache : de quoi
+    retrouver et rejouer une facture pathologique sans l'avoir conservée.
+    """
+    verify_admin_key(request)
+    journal = get_slow_request_journal()
+    if journal is None:
+        raise HTTPException(status_code=404, detail="Slow request journal disabled (SLOW_REQUESTS_PER_ENDPOINT=0)")
+    return {
+        **journal.info(),
+        "endpoints": journal.slowest(endpoint, limit=max(1, min(limit, journal.per_endpoint)))
+    }
+
+
+MEMORY_GROUP_BY = ("lineno", "filename", "traceback")
+
+
+@admin_router.get("/memory")
+async def admin_memory(request: Request, deep: bool = False):
+    """
+    Mémoire du worker : RSS, mémoire tracée (tracemalloc), instantanés disponibles
+    et nombre d'entrées de chaque cache ou registre en mémoire (taille approximative si deep=true)
+    """
+    verify_admin_key(request)
+    if deep:
+        return await run_in_threadpool(get_memory_report, True)
+    return get_memory_report()
+
+
+@admin_router.post("/memory/tracing")
+async def admin_memory_start_tracing(request: Request, frames: int = DEFAULT_TRACE_FRAMES):
+    """Démarre tracemalloc (frames par allocation ; ralentit les allocations tant qu'il est actif)"""
+    verify_admin_key(request)
+    return start_tracing(frames)
+
+
+@admin_router.delete("/memory/tracing")
+async def admin_memory_stop_tracing(request: Request):
+    """Arrête tracemalloc et libère les instantanés"""
+    verify_admin_key(request)
+    return stop_tracing()
+
+
+@admin_router.post("/memory/snapshot")
+async def admin_memory_snapshot(request: Request, group_by: str = "lineno", limit: int = 20):
+    """Prend un instantané tracemalloc ; renvoie son identifiant et les plus grosses allocations"""
+    verify_admin_key(request)
+    if group_by not in MEMORY_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}")
+    try:
+        snapshot_id = await run_in_threadpool(take_snapshot)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    top = await run_in_threadpool(snapshot_top, snapshot_id, group_by, max(1, min(limit, 200)))
+    return {"id": snapshot_id, "top": top}
+
+
+@admin_router.get("/memory/diff")
+async def admin_memory_diff(
+    request: Request, base: str, target: Optional[str] = None, group_by: str = "lineno", limit: int = 20
+):
+    """
+    Allocations qui ont le plus grandi entre l'instantané base et target
+    (sans target : nouvel instantané pris maintenant)
+    """
+    verify_admin_key(request)
+    if group_by not in MEMORY_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(MEMORY_GROUP_BY)}")
+    try:
+        return await run_in_threadpool(diff_snapshots, base, target, group_by, max(1, min(limit, 200)))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@admin_router.get("/profile/token")
+async def admin_profile_token(request: Request, ttl: int = 300):
+    """
+    Délivre un jeton pour le header X-Profile (valable `ttl` secondes, 1 h max)
+    
+    Une requête portant `X-Profile: <jeton>` est profilée ; son profil est
+    consultable via /admin/profile/{X-Profile-Id renvoyé}.
+    """
+    verify_admin_key(request)
+    try:
+        return create_profile_token(ttl)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@admin_router.post("/profile")
+async def admin_profile_session(request: Request, seconds: float = 10.0, interval_ms: float = DEFAULT_SAMPLE_INTERVAL * 1000):
+    """
+    Profile tout le worker pendant `seconds` secondes (60 max)
+    
+    Renvoie le profil au format collapsed stacks (flamegraph.pl, speedscope).
+    """
+    verify_admin_key(request)
+    sampler = start_profile(interval=max(1.0, interval_ms) / 1000)
+    if sampler is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        await asyncio.sleep(max(0.1, min(seconds, MAX_SESSION_SECONDS)))
+    finally:
+        profile_id = finish_profile(sampler, f"session {seconds:g}s")
+    return Response(
+        content=get_profile(profile_id)["collapsed"],
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Profile-Id": profile_id}
+    )
+
+
+@admin_router.get("/profile")
+async def admin_list_profiles(request: Request):
+    """Profils récents conservés en mémoire (requêtes X-Profile et sessions)"""
+    verify_admin_key(request)
+    return {"profiles": list_profiles()}
+
+
+@admin_router.get("/profile/{profile_id}")
+async def admin_get_profile(request: Request, profile_id: str):
+    """Profil au format collapsed stacks (flamegraph.pl, speedscope)"""
+    verify_admin_key(request)
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=profile["collapsed"], media_type="text/plain; charset=utf-8")
+
+
+# Inclure les routers dans l'application
 app.include_router(v1_router)
+app.include_router(admin_router)
 
 # Servir l'interface de démo React (si le dossier dist existe)
 demo_dist_path = os.path.join(os.path.dirname(__file__), "demo", "dist")
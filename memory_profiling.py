@@ -0,0 +1,295 @@
+"""
+Suivi mémoire (admin) : tracemalloc à la demande, instantanés et différences, taille des caches
+
+- Taille de chaque cache et registre en mémoire du processus (compliance, idempotence,
+  cache mémoire, rate limiting, single-flight, index perceptuel, files OCR...)
+- Instantanés tracemalloc et différence entre deux instantanés (ou avec maintenant) :
+  les lignes dont l'allocation grandit désignent la fuite
+- Pendant le traçage, pic de mémoire par requête (histogramme /metrics)
+
+tracemalloc ralentit les allocations (de l'ordre de 2x) : il n'est actif que sur
+demande (POST /admin/memory/tracing) ou avec MEMORY_TRACE_FRAMES > 0. Les
+tampons alloués par PIL et OpenCV hors de l'allocateur Python n'y figurent pas :
+ils se voient dans l'écart entre le RSS et la mémoire tracée.
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+MAX_SNAPSHOTS = 5  # Instantanés conservés (chacun pèse autant que les allocations tracées)
+DEFAULT_TRACE_FRAMES = 1  # Frames par allocation : 1 suffit pour grouper par ligne
+MAX_DEEP_SIZE_OBJECTS = 200000  # Objets visités au plus par mesure de taille profonde
+
+_snapshots: "OrderedDict[str, Tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+_snapshot_ids = itertools.count(1)
+_requests_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+# Allocations de tracemalloc lui-même et du chargement des modules : bruit
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def init_memory_tracing(frames: int = 0):
+    """Démarre tracemalloc au lancement si frames > 0 (sinon seulement via l'endpoint admin)"""
+    if frames > 0:
+        start_tracing(frames)
+
+
+def start_tracing(frames: int = DEFAULT_TRACE_FRAMES) -> Dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(frames, 50)))
+    return tracing_info()
+
+
+def stop_tracing() -> Dict[str, Any]:
+    """Arrête tracemalloc et libère les instantanés (inutilisables sans traçage)"""
+    _snapshots.clear()
+    tracemalloc.stop()
+    return tracing_info()
+
+
+def tracing_info() -> Dict[str, Any]:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+        "snapshots": [
+            {"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in _snapshots.items()
+        ],
+    }
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """RSS courant (Linux, /proc) et RSS maximal du processus"""
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    max_rss = None
+    if RESOURCE_AVAILABLE:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        max_rss *= 1 if sys.platform == "darwin" else 1024  # Octets sur macOS, Ko ailleurs
+    return {"rss_bytes": rss, "max_rss_bytes": max_rss}
+
+
+# ---------- Instantanés ----------
+
+def take_snapshot() -> str:
+    """
+    Prend un instantané tracemalloc (lent sur un gros tas : à appeler hors de la boucle asyncio)
+
+    Raises:
+        RuntimeError: tracemalloc n'est pas actif
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("Memory tracing is not active: POST /admin/memory/tracing first")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    snapshot_id = str(next(_snapshot_ids))
+    _snapshots[snapshot_id] = (time.time(), snapshot)
+    while len(_snapshots) > MAX_SNAPSHOTS:
+        _snapshots.popitem(last=False)
+    return snapshot_id
+
+
+def _format_stat(stat: Any, group_by: str) -> Dict[str, Any]:
+    if group_by == "traceback":
+        location = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    else:
+        frame = stat.traceback[0]
+        location = frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+    entry = {"location": location, "size_bytes": stat.size, "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        entry.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+    return entry
+
+
+def snapshot_top(snapshot_id: str, group_by: str = "lineno", limit: int = 20) -> List[Dict[str, Any]]:
+    """Plus grosses allocations vivantes d'un instantané"""
+    _, snapshot = _get_snapshot(snapshot_id)
+    return [_format_stat(stat, group_by) for stat in snapshot.statistics(group_by)[:limit]]
+
+
+def diff_snapshots(
+    base_id: str, target_id: Optional[str] = None, group_by: str = "lineno", limit: int = 20
+) -> Dict[str, Any]:
+    """
+    Allocations qui ont le plus grandi entre deux instantanés
+
+    Args:
+        base_id: Instantané de référence
+        target_id: Instantané comparé ; None = nouvel instantané pris maintenant
+        group_by: "lineno", "filename" ou "traceback"
+        limit: Nombre de lignes renvoyées
+    """
+    base_taken_at, base = _get_snapshot(base_id)
+    if target_id is None:
+        target_id = take_snapshot()
+    target_taken_at, target = _get_snapshot(target_id)
+    stats = target.compare_to(base, group_by)
+    return {
+        "base": base_id,
+        "target": target_id,
+        "elapsed_seconds": round(target_taken_at - base_taken_at, 1),
+        "total_diff_bytes": sum(stat.size_diff for stat in stats),
+        "top": [_format_stat(stat, group_by) for stat in stats[:limit]],
+    }
+
+
+def _get_snapshot(snapshot_id: str) -> Tuple[float, tracemalloc.Snapshot]:
+    try:
+        return _snapshots[snapshot_id]
+    except KeyError:
+        raise KeyError(f"Unknown or expired snapshot: {snapshot_id}") from None
+
+
+# ---------- Pic mémoire par requête ----------
+
+def begin_request_memory() -> Optional[int]:
+    """
+    Mémoire tracée au début d'une requête (None hors traçage)
+
+    Le pic de tracemalloc est global au processus : il n'est remis à zéro que
+    lorsqu'aucune autre requête n'est en cours. Avec des requêtes concurrentes, le
+    pic mesuré inclut leurs allocations (majorant du pic propre à la requête).
+    """
+    global _requests_in_flight
+    if not tracemalloc.is_tracing():
+        return None
+    with _in_flight_lock:
+        if _requests_in_flight == 0:
+            tracemalloc.reset_peak()
+        _requests_in_flight += 1
+    return tracemalloc.get_traced_memory()[0]
+
+
+def end_request_memory(started_at: Optional[int]) -> Optional[int]:
+    """Pic de mémoire tracée au-delà du niveau de départ (octets), None hors traçage"""
+    global _requests_in_flight
+    if started_at is None:
+        return None
+    with _in_flight_lock:
+        _requests_in_flight = max(0, _requests_in_flight - 1)
+    if not tracemalloc.is_tracing():
+        return None  # Traçage arrêté pendant la requête
+    return max(0, tracemalloc.get_traced_memory()[1] - started_at)
+
+
+# ---------- Caches et registres en mémoire ----------
+
+def _deep_size(root: Any) -> int:
+    """Taille approximative d'un objet et de son contenu (conteneurs usuels, sans __dict__)"""
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack and len(seen) < MAX_DEEP_SIZE_OBJECTS:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            for key, value in list(obj.items()):  # Copie atomique : le dict peut changer dans le threadpool
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(list(obj))
+        elif hasattr(obj, "__slots__"):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+    return total
+
+
+def _registries() -> Dict[str, Callable[[], Any]]:
+    """Conteneurs en mémoire du processus, par nom (importés ici pour ne pas créer de cycle)"""
+    import admission
+    import cache_redis
+    import compliance
+    import idempotency
+    import monitoring
+    import perceptual_cache
+    import profiling
+    import rate_limiting
+    import single_flight
+    import slow_requests
+
+    def backend_cache():
+        backend = cache_redis.get_cache_backend()
+        return backend.cache if isinstance(backend, cache_redis.MemoryCacheBackend) else None
+
+    def perceptual_entries():
+        index = perceptual_cache.get_perceptual_index()
+        return index.entries if index is not None else None
+
+    def slow_request_records():
+        journal = slow_requests.get_slow_request_journal()
+        if journal is None:
+            return None
+        return [record for records in journal.slowest().values() for record in records]
+
+    return {
+        "compliance.sirene_results_cache": lambda: compliance._sirene_results_cache,
+        "compliance.token_cache": lambda: compliance._token_cache,
+        "compliance.sirene_rate_limit": lambda: compliance._sirene_rate_limit,
+        "idempotency.claims": lambda: idempotency._claims,
+        "cache.memory_backend": backend_cache,
+        "cache.memory_fallback": lambda: cache_redis.memory_cache,
+        "rate_limiting.memory_counters": lambda: rate_limiting._memory_store.counters,
+        "rate_limiting.memory_quota_counters": lambda: rate_limiting._memory_store.quota_counters,
+        "single_flight.inflight": lambda: single_flight._inflight,
+        "perceptual_index.entries": perceptual_entries,
+        "admission.tenants": lambda: admission.get_admission_controller()._tenants,
+        "profiling.profiles": lambda: profiling._profiles,
+        "slow_requests.records": slow_request_records,
+        "monitoring.latency_by_route": lambda: monitoring.metrics["latency_by_route"],
+    }
+
+
+def registry_sizes(deep: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Nombre d'entrées (et taille approximative en octets si deep) de chaque cache ou registre
+
+    Args:
+        deep: Parcourir le contenu pour estimer sa taille (coûteux sur un gros cache)
+    """
+    sizes = {}
+    for name, getter in _registries().items():
+        container = getter()
+        if container is None:
+            continue  # Désactivé (ex: index perceptuel, backend Redis)
+        entry: Dict[str, Any] = {"entries": len(container)}
+        if name == "compliance.sirene_rate_limit":
+            entry["timestamps"] = sum(len(calls) for calls in list(container.values()))
+        if deep:
+            entry["approx_bytes"] = _deep_size(container)
+        sizes[name] = entry
+    return sizes
+
+
+def get_memory_report(deep: bool = False) -> Dict[str, Any]:
+    return {
+        **process_memory(),
+        **tracing_info(),
+        "registries": registry_sizes(deep),
+    }
@@ -2,26 +2,198 @@
 Monitoring et logging structuré pour l'API OCR Facture
 """
 
+import atexit
 import logging
 import json
+import math
+import queue
+import random
+import threading
 import time
-from typing import Dict, Any, Optional
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import Request
 import sys
 
-# Configuration du logging structuré
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from profiling import PROFILE_HEADER, finish_profile, start_request_profile, verify_profile_token
+from slow_requests import get_slow_request_journal
+from memory_profiling import begin_request_memory, end_request_memory
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_QUEUE_SIZE = 10000  # Logs en attente d'écriture ; au-delà, perdus (comptés) plutôt que bloquer
+LOG_SUCCESS_SAMPLE_RATE = 1.0  # Part des requêtes réussies journalisées (erreurs toujours journalisées)
 
 logger = logging.getLogger("ocr_facture_api")
 
+
+class JsonMessage:
+    """Message de log sérialisé en JSON seulement à l'écriture (thread du writer)"""
+    __slots__ = ("data",)
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    def __str__(self) -> str:
+        return json.dumps(self.data)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Handler non bloquant : place l'enregistrement dans une file bornée
+
+    Le formatage (et la sérialisation JSON) est laissé au writer. File pleine
+    (stdout ralenti par le collecteur de logs) : l'enregistrement est perdu et
+    compté, la requête n'attend jamais.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics["logs_dropped"] += 1
+            logs_dropped.inc()
+
+
+_log_listener: Optional[QueueListener] = None
+
+
+def init_logging(
+    queue_size: int = LOG_QUEUE_SIZE,
+    success_sample_rate: float = LOG_SUCCESS_SAMPLE_RATE,
+    level: Union[int, str] = logging.INFO
+):
+    """
+    Configure le logging structuré : file bornée vers stdout, écrite par un thread dédié
+
+    Args:
+        queue_size: Logs en attente max avant perte
+        success_sample_rate: Part des requêtes réussies journalisées (0 à 1)
+        level: Niveau minimum (ex: logging.INFO ou "DEBUG")
+    """
+    global _log_listener, LOG_SUCCESS_SAMPLE_RATE
+    
+    stop_logging()
+    LOG_SUCCESS_SAMPLE_RATE = min(max(success_sample_rate, 0.0), 1.0)
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    root = logging.getLogger()
+    for handler in [handler for handler in root.handlers if isinstance(handler, DroppingQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+    _log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+
+
+def stop_logging():
+    """Écrit les logs en attente et arrête le writer"""
+    global _log_listener
+    
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+atexit.register(stop_logging)
+init_logging()
+
+HISTOGRAM_SUB_BUCKETS = 32  # Sous-intervalles par puissance de 2 : précision relative ~3 %
+MAX_LATENCY_ROUTES = 200  # Au-delà, les routes supplémentaires sont agrégées dans "other"
+
+
+class LatencyHistogram:
+    """
+    Histogramme de latences à buckets logarithmiques (style HDR), en temps constant
+
+    Chaque puissance de 2 est découpée en HISTOGRAM_SUB_BUCKETS intervalles
+    égaux : l'enregistrement est un simple incrément, les percentiles ne sont
+    calculés qu'à la lecture, sur les buckets non vides (quelques centaines au plus).
+    """
+    __slots__ = ("buckets", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @staticmethod
+    def bucket_index(value: float) -> int:
+        mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+        return exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa * 2 - 1) * HISTOGRAM_SUB_BUCKETS)
+
+    @staticmethod
+    def bucket_upper_bound(index: int) -> float:
+        exponent, sub_bucket = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        return math.ldexp(1 + (sub_bucket + 1) / HISTOGRAM_SUB_BUCKETS, exponent - 1)
+
+    def record(self, value: float):
+        if value <= 0:
+            value = 1e-6
+        index = self.bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, *quantiles: float) -> Tuple[Optional[float], ...]:
+        """Valeurs aux quantiles demandés (croissants, entre 0 et 1), bornées par min/max observés"""
+        if not self.count:
+            return tuple(None for _ in quantiles)
+        ranks = [max(1, math.ceil(quantile * self.count)) for quantile in quantiles]
+        results = []
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while len(results) < len(ranks) and seen >= ranks[len(results)]:
+                results.append(min(max(self.bucket_upper_bound(index), self.min), self.max))
+        return tuple(results + [self.max] * (len(quantiles) - len(results)))
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95, p99 = self.percentiles(0.50, 0.95, 0.99)
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count, 2) if self.count else None,
+            "p50_ms": round(p50, 2) if p50 is not None else None,
+            "p95_ms": round(p95, 2) if p95 is not None else None,
+            "p99_ms": round(p99, 2) if p99 is not None else None,
+            "max_ms": round(self.max, 2) if self.count else None,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """État sérialisable en JSON (instantané publié aux autres workers)"""
+        return {
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max,
+        }
+
+    def merge(self, data: Dict[str, Any]):
+        """Ajoute un histogramme sérialisé (mêmes buckets : la fusion est exacte)"""
+        for index, count in data["buckets"].items():
+            self.buckets[int(index)] = self.buckets.get(int(index), 0) + count
+        self.count += data["count"]
+        self.sum += data["sum"]
+        if data["count"]:
+            self.min = min(self.min, data["min"])
+            self.max = max(self.max, data["max"])
+
 # Métriques en mémoire (en production, utiliser Prometheus ou équivalent)
 metrics: Dict[str, Any] = {
     "requests_total": 0,
@@ -29,59 +201,409 @@ metrics: Dict[str, Any] = {
     "requests_errors": 0,
     "requests_by_endpoint": {},
     "requests_by_status": {},
-    "latency_p50": [],
-    "latency_p95": [],
-    "latency_p99": [],
+    "latency": LatencyHistogram(),  # Toutes requêtes confondues (ms)
+    "latency_by_route": {},  # (route, classe de statut) -> LatencyHistogram
+    "event_loop_lag": LatencyHistogram(),  # Retard de la boucle asyncio (ms), cf. loop_watchdog
+    "event_loop_blocks": 0,
     "cache_hits": 0,
     "cache_misses": 0,
-    "ocr_processing_times": [],
+    "cache_perceptual_hits": 0,
+    "ocr_coalesced_local": 0,
+    "ocr_coalesced_distributed": 0,
+    "ocr_shed": 0,
+    "logs_dropped": 0,
 }
 
 
+def get_route_template(request: Request) -> str:
+    """
+    Route correspondant à la requête (ex: /v1/jobs/{job_id}), cardinalité bornée
+
+    Les chemins sans route (404) sont regroupés pour ne pas créer un histogramme par URL.
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+# ---------- Exposition Prometheus (format texte 0.0.4) ----------
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PROMETHEUS_NAMESPACE = "ocr_api"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+EXTERNAL_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MEMORY_BYTES_BUCKETS = tuple(float(2 ** exponent) for exponent in range(16, 31, 2))  # 64 Ko à 1 Go
+PLAN_LABELS = ("BASIC", "PRO", "ULTRA", "MEGA")  # Autres valeurs du header : "other" (cardinalité bornée)
+
+_prometheus_registry: List["PrometheusMetric"] = []
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusMetric:
+    """Famille de séries étiquetées, enregistrée pour /metrics"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), register: bool = True):
+        self.name = f"{PROMETHEUS_NAMESPACE}_{name}"
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()  # Observations aussi depuis le threadpool (OCR, API externes)
+        if register:
+            _prometheus_registry.append(self)
+
+    def render(self, data: Optional[Dict] = None) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples(data)]
+
+    def samples(self, data: Optional[Dict] = None) -> List[str]:
+        """Lignes de séries : celles de ce worker, ou data (séries fusionnées, cf. merge_into)"""
+        raise NotImplementedError
+
+    def snapshot(self) -> List[list]:
+        """Séries sérialisables en JSON : [[valeurs des labels, ...], ...]"""
+        raise NotImplementedError
+
+    def merge_into(self, data: Dict, entries: List[list]):
+        """Additionne des séries sérialisées (snapshot d'un autre worker) dans data"""
+        raise NotImplementedError
+
+
+class PrometheusCounter(PrometheusMetric):
+    """Compteur (nom terminé par _total)"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), register: bool = True):
+        super().__init__(name, documentation, labelnames, register)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self, data: Optional[Dict] = None) -> List[str]:
+        with self._lock:
+            values = sorted((self.values if data is None else data).items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values]
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge_into(self, data: Dict, entries: List[list]):
+        for labels, value in entries:
+            labels = tuple(labels)
+            data[labels] = data.get(labels, 0) + value
+
+
+class PrometheusHistogram(PrometheusMetric):
+    """Histogramme à bornes fixes : une recherche dichotomique et un incrément par observation"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = SECONDS_BUCKETS,
+        register: bool = True
+    ):
+        super().__init__(name, documentation, labelnames, register)
+        self.bounds = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}  # labels -> [comptes par bucket (+Inf inclus), somme]
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self, data: Optional[Dict] = None) -> List[str]:
+        with self._lock:
+            series = self.series if data is None else data
+            snapshot = sorted((labels, list(counts), total) for labels, (counts, total) in series.items())
+        lines = []
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), list(counts), total] for labels, (counts, total) in self.series.items()]
+
+    def merge_into(self, data: Dict, entries: List[list]):
+        for labels, counts, total in entries:
+            if len(counts) != len(self.bounds) + 1:
+                continue  # Bornes différentes (worker d'une autre version) : série ignorée
+            series = data.setdefault(tuple(labels), [[0] * len(counts), 0.0])
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+
+
+request_duration = PrometheusHistogram(
+    "request_duration_seconds", "Durée des requêtes HTTP par route, plan et classe de statut", ("route", "plan", "status")
+)
+ocr_page_duration = PrometheusHistogram(
+    "ocr_page_seconds", "Temps d'OCR par page (OCR effectifs, pages en cache exclues)", ("kind",)
+)
+stage_duration = PrometheusHistogram(
+    "stage_seconds", "Durée des étapes du traitement d'un document", ("stage",)
+)
+cache_requests = PrometheusCounter(
+    "cache_requests_total", "Consultations du cache par niveau (result, perceptual, page) et résultat", ("tier", "result")
+)
+ocr_coalesced = PrometheusCounter(
+    "ocr_coalesced_total", "OCR dédupliqués (single-flight) par portée", ("scope",)
+)
+rate_limit_rejections = PrometheusCounter(
+    "rate_limit_rejections_total", "Requêtes refusées (429) par fenêtre de limitation", ("window",)
+)
+ocr_shed = PrometheusCounter(
+    "ocr_shed_total", "OCR refusés (503) par le contrôle d'admission"
+)
+logs_dropped = PrometheusCounter(
+    "log_records_dropped_total", "Logs perdus, file du writer pleine (stdout saturé)"
+)
+external_request_duration = PrometheusHistogram(
+    "external_request_seconds", "Latence des API externes (sirene, sirene_token, vies) par issue", ("service", "outcome"),
+    buckets=EXTERNAL_SECONDS_BUCKETS
+)
+event_loop_lag = PrometheusHistogram(
+    "event_loop_lag_seconds", "Retard de la boucle asyncio (appels bloquants dans le code async)", buckets=LAG_SECONDS_BUCKETS
+)
+event_loop_blocks = PrometheusCounter(
+    "event_loop_blocks_total", "Boucle asyncio bloquée au-delà du seuil (pile journalisée)"
+)
+request_peak_memory = PrometheusHistogram(
+    "request_peak_memory_bytes", "Pic de mémoire Python par requête et route (seulement pendant le traçage tracemalloc)",
+    ("route",), buckets=MEMORY_BYTES_BUCKETS
+)
+
+
+def render_prometheus(merged: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Toutes les métriques au format texte Prometheus (pour GET /metrics)
+
+    Args:
+        merged: Métriques fusionnées de plusieurs workers (merge_snapshots), sinon celles de ce worker
+    """
+    lines: List[str] = []
+    for metric in _prometheus_registry:
+        lines.extend(metric.render(None if merged is None else merged["prometheus"].get(metric.name, {})))
+    return "\n".join(lines) + "\n"
+
+
+class SpanRecorder:
+    """
+    Durées cumulées par étape pour une requête (header Server-Timing, bloc timings d'OCRResponse)
+
+    Les étapes s'emboîtent (preprocess contient preprocess_deskew...) : ce n'est
+    pas une partition de la durée totale. Garde aussi la description des
+    documents traités, pour le journal des requêtes lentes.
+    """
+    __slots__ = ("spans", "documents", "_lock")
+
+    def __init__(self):
+        self.spans: Dict[str, List[float]] = {}  # étape -> [secondes, occurrences]
+        self.documents: Dict[str, Dict[str, Any]] = {}  # SHA256 -> description (jamais le contenu)
+        self._lock = threading.Lock()  # Étapes aussi mesurées dans le threadpool
+
+    def describe(self, file_hash: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            document = self.documents.get(file_hash)
+            if document is None:
+                document = self.documents[file_hash] = {"file_hash": file_hash}
+            document.update(fields)
+        return document
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            span = self.spans.get(stage)
+            if span is None:
+                self.spans[stage] = [seconds, 1]
+            else:
+                span[0] += seconds
+                span[1] += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        """Millisecondes par étape"""
+        with self._lock:
+            return {stage: round(seconds * 1000, 2) for stage, (seconds, _) in self.spans.items()}
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Valeur du header Server-Timing (ex: tesseract;dur=812.4, total;dur=905.1)"""
+        with self._lock:
+            entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.spans.items()]
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# Étapes de la requête en cours (posé par monitoring_middleware, partagé avec le threadpool)
+_request_spans: ContextVar[Optional[SpanRecorder]] = ContextVar("request_spans", default=None)
+
+
+# Description du document en cours de traitement (posé par describe_document, visible du threadpool)
+_current_document: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_document", default=None)
+
+
+def describe_document(file_hash: str, **fields: Any):
+    """
+    Complète la description d'un document de la requête en cours (journal des
+    requêtes lentes) et en fait le document courant
+
+    Args:
+        file_hash: SHA256 du document
+        fields: Ex: size_bytes, cache ("exact", "perceptual", "miss", "coalesced"), language
+    """
+    recorder = _request_spans.get()
+    if recorder is not None:
+        _current_document.set(recorder.describe(file_hash, fields))
+
+
+def describe_current_document(**fields: Any):
+    """Complète la description du document courant (ex: dimensions, prétraitement, depuis l'OCR)"""
+    document = _current_document.get()
+    if document is not None:
+        document.update(fields)
+
+
+def get_request_timings() -> Optional[Dict[str, float]]:
+    """Millisecondes par étape de la requête en cours (None hors requête)"""
+    recorder = _request_spans.get()
+    return recorder.as_dict() if recorder is not None else None
+
+
+def _record_span(stage: str, seconds: float):
+    recorder = _request_spans.get()
+    if recorder is not None:
+        recorder.add(stage, seconds)
+
+
+def plan_label(plan: Optional[str]) -> str:
+    if not plan:
+        return "none"
+    plan = plan.upper()
+    return plan if plan in PLAN_LABELS else "other"
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Mesure une étape du traitement (histogramme /metrics et Server-Timing de la requête)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage)
+        _record_span(stage, elapsed)
+
+
+@contextmanager
+def time_external_request(service: str) -> Iterator[None]:
+    """Mesure un appel à une API externe (issue : response, timeout ou error)"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "response"
+    except Exception as e:
+        outcome = "timeout" if "timeout" in type(e).__name__.lower() else "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        external_request_duration.observe(elapsed, service, outcome)
+        _record_span(service, elapsed)
+
+
+def log_ocr_pages(kind: str, pages: int, ocr_seconds: float):
+    """Enregistre le temps par page d'un OCR effectif (kind : image ou pdf)"""
+    if pages > 0:
+        ocr_page_duration.observe(ocr_seconds / pages, kind)
+
+
+def log_page_cache(hits: int, misses: int):
+    """Pages d'un PDF trouvées (ou non) dans le cache de pages"""
+    if hits:
+        cache_requests.inc("page", "hit", amount=hits)
+    if misses:
+        cache_requests.inc("page", "miss", amount=misses)
+
+
+def log_rate_limit_rejection(window: str):
+    """Compte une requête refusée en 429 (window : ip_minute, ip_hour, ip_day, monthly, daily, per_minute)"""
+    rate_limit_rejections.inc(window)
+
+
 def log_request(request: Request, response_time: float, status_code: int, endpoint: str):
     """
     Log une requête avec toutes les informations pertinentes
-    """
-    client_ip = request.client.host if request.client else "unknown"
-    user_agent = request.headers.get("user-agent", "unknown")
-    method = request.method
     
-    # Correlation ID (si présent dans les headers)
-    correlation_id = request.headers.get("X-Correlation-ID", "none")
-    
-    # Log structuré en JSON
-    log_data = {
-        "timestamp": datetime.now().isoformat(),
-        "level": "INFO",
-        "type": "request",
-        "method": method,
-        "endpoint": endpoint,
-        "status_code": status_code,
-        "response_time_ms": round(response_time * 1000, 2),
-        "client_ip": client_ip,
-        "user_agent": user_agent,
-        "correlation_id": correlation_id,
-    }
-    
-    # Ajouter les headers RapidAPI si présents
-    if "X-RapidAPI-Plan" in request.headers:
-        log_data["plan"] = request.headers.get("X-RapidAPI-Plan")
-    
-    # Logger selon le niveau
+    Les requêtes réussies sont échantillonnées (LOG_SUCCESS_SAMPLE_RATE) ; rien
+    n'est construit si le niveau est désactivé. Les métriques comptent tout.
+    """
+    # Niveau selon le statut
     if status_code >= 500:
-        logger.error(json.dumps(log_data))
+        level = logging.ERROR
     elif status_code >= 400:
-        logger.warning(json.dumps(log_data))
+        level = logging.WARNING
     else:
-        logger.info(json.dumps(log_data))
+        level = logging.INFO
+    sampled = level > logging.INFO or LOG_SUCCESS_SAMPLE_RATE >= 1.0 or random.random() < LOG_SUCCESS_SAMPLE_RATE
+    
+    if sampled and logger.isEnabledFor(level):
+        # Log structuré en JSON
+        log_data = {
+            "timestamp": datetime.now().isoformat(),
+            "level": logging.getLevelName(level),
+            "type": "request",
+            "method": request.method,
+            "endpoint": endpoint,
+            "status_code": status_code,
+            "response_time_ms": round(response_time * 1000, 2),
+            "client_ip": request.client.host if request.client else "unknown",
+            "user_agent": request.headers.get("user-agent", "unknown"),
+            "correlation_id": request.headers.get("X-Correlation-ID", "none"),
+        }
+        if level == logging.INFO and LOG_SUCCESS_SAMPLE_RATE < 1.0:
+            log_data["sample_rate"] = LOG_SUCCESS_SAMPLE_RATE  # Pour repondérer les comptages
+        
+        # Ajouter les headers RapidAPI si présents
+        if "X-RapidAPI-Plan" in request.headers:
+            log_data["plan"] = request.headers.get("X-RapidAPI-Plan")
+        
+        logger.log(level, JsonMessage(log_data))
     
     # Mettre à jour les métriques
-    update_metrics(endpoint, status_code, response_time)
+    update_metrics(endpoint, status_code, response_time, get_route_template(request), getattr(request.state, "plan", None))
 
 
-def update_metrics(endpoint: str, status_code: int, response_time: float):
+def update_metrics(endpoint: str, status_code: int, response_time: float, route: Optional[str] = None, plan: Optional[str] = None):
     """
-    Met à jour les métriques de performance
+    Met à jour les métriques de performance (temps constant : les percentiles
+    sont calculés à la lecture, dans get_metrics)
     """
     metrics["requests_total"] += 1
     
@@ -90,10 +612,12 @@ def update_metrics(endpoint: str, status_code: int, response_time: float):
     else:
         metrics["requests_errors"] += 1
     
-    # Métriques par endpoint
-    if endpoint not in metrics["requests_by_endpoint"]:
-        metrics["requests_by_endpoint"][endpoint] = 0
-    metrics["requests_by_endpoint"][endpoint] += 1
+    # Métriques par endpoint, clé = route (ex: /v1/ocr/result/{sha256}) : cardinalité
+    # bornée, l'instantané publié aux autres workers ne grossit pas à chaque hash
+    endpoint_key = route or endpoint
+    if endpoint_key not in metrics["requests_by_endpoint"]:
+        metrics["requests_by_endpoint"][endpoint_key] = 0
+    metrics["requests_by_endpoint"][endpoint_key] += 1
     
     # Métriques par statut
     status_group = f"{status_code // 100}xx"
@@ -101,21 +625,19 @@ def update_metrics(endpoint: str, status_code: int, response_time: float):
         metrics["requests_by_status"][status_group] = 0
     metrics["requests_by_status"][status_group] += 1
     
-    # Latence
+    # Latence, globale et par route / classe de statut
     response_time_ms = response_time * 1000
-    metrics["ocr_processing_times"].append(response_time_ms)
+    metrics["latency"].record(response_time_ms)
     
-    # Garder seulement les 1000 dernières mesures pour P50/P95/P99
-    if len(metrics["ocr_processing_times"]) > 1000:
-        metrics["ocr_processing_times"] = metrics["ocr_processing_times"][-1000:]
-    
-    # Calculer les percentiles
-    if metrics["ocr_processing_times"]:
-        sorted_times = sorted(metrics["ocr_processing_times"])
-        n = len(sorted_times)
-        metrics["latency_p50"] = sorted_times[int(n * 0.50)]
-        metrics["latency_p95"] = sorted_times[int(n * 0.95)]
-        metrics["latency_p99"] = sorted_times[int(n * 0.99)]
+    by_route = metrics["latency_by_route"]
+    key = (route or endpoint, status_group)
+    histogram = by_route.get(key)
+    if histogram is None:
+        if len(by_route) >= MAX_LATENCY_ROUTES:
+            key = ("other", status_group)
+        histogram = by_route.setdefault(key, LatencyHistogram())
+    histogram.record(response_time_ms)
+    request_duration.observe(response_time, key[0], plan_label(plan), status_group)
 
 
 def log_cache_hit(endpoint: str):
@@ -123,11 +645,13 @@ def log_cache_hit(endpoint: str):
     Log un cache hit
     """
     metrics["cache_hits"] += 1
-    logger.debug(json.dumps({
-        "timestamp": datetime.now().isoformat(),
-        "type": "cache_hit",
-        "endpoint": endpoint
-    }))
+    cache_requests.inc("result", "hit")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(JsonMessage({
+            "timestamp": datetime.now().isoformat(),
+            "type": "cache_hit",
+            "endpoint": endpoint
+        }))
 
 
 def log_cache_miss(endpoint: str):
@@ -135,10 +659,88 @@ def log_cache_miss(endpoint: str):
     Log un cache miss
     """
     metrics["cache_misses"] += 1
-    logger.debug(json.dumps({
+    cache_requests.inc("result", "miss")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(JsonMessage({
+            "timestamp": datetime.now().isoformat(),
+            "type": "cache_miss",
+            "endpoint": endpoint
+        }))
+
+
+def log_cache_perceptual_hit(distance: int):
+    """
+    Log un résultat réutilisé via le hash perceptuel (document quasi identique)
+    
+    Args:
+        distance: Distance de Hamming entre les hash perceptuels
+    """
+    metrics["cache_perceptual_hits"] += 1
+    cache_requests.inc("perceptual", "hit")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(JsonMessage({
+            "timestamp": datetime.now().isoformat(),
+            "type": "cache_perceptual_hit",
+            "distance": distance
+        }))
+
+
+def log_ocr_coalesced(scope: str):
+    """
+    Log une requête OCR dédupliquée (single-flight)
+    
+    Args:
+        scope: "local" (même worker) ou "distributed" (autre worker, verrou Redis)
+    """
+    metrics[f"ocr_coalesced_{scope}"] += 1
+    ocr_coalesced.inc(scope)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(JsonMessage({
+            "timestamp": datetime.now().isoformat(),
+            "type": "ocr_coalesced",
+            "scope": scope
+        }))
+
+
+def log_ocr_shed(retry_after: int, estimated_wait: float):
+    """
+    Log un OCR refusé par le contrôle d'admission (503)
+    
+    Args:
+        retry_after: Retry-After renvoyé au client (secondes)
+        estimated_wait: Attente estimée au moment du refus (secondes)
+    """
+    metrics["ocr_shed"] += 1
+    ocr_shed.inc()
+    logger.warning(JsonMessage({
+        "timestamp": datetime.now().isoformat(),
+        "type": "ocr_shed",
+        "retry_after": retry_after,
+        "estimated_wait_seconds": round(estimated_wait, 2)
+    }))
+
+
+def log_event_loop_lag(lag_seconds: float):
+    """Enregistre un échantillon du retard de la boucle asyncio"""
+    metrics["event_loop_lag"].record(lag_seconds * 1000)
+    event_loop_lag.observe(lag_seconds)
+
+
+def log_event_loop_block(blocked_seconds: float, stack: List[str]):
+    """
+    Log une boucle asyncio bloquée au-delà du seuil (appelé depuis le thread du watchdog)
+    
+    Args:
+        blocked_seconds: Durée du blocage au moment de la détection
+        stack: Pile de la boucle à cet instant (l'appel bloquant est en bas)
+    """
+    metrics["event_loop_blocks"] += 1
+    event_loop_blocks.inc()
+    logger.warning(JsonMessage({
         "timestamp": datetime.now().isoformat(),
-        "type": "cache_miss",
-        "endpoint": endpoint
+        "type": "event_loop_blocked",
+        "blocked_ms": round(blocked_seconds * 1000, 1),
+        "stack": stack
     }))
 
 
@@ -157,25 +759,88 @@ def log_error(error: Exception, context: Optional[Dict] = None):
     if context:
         log_data.update(context)
     
-    logger.error(json.dumps(log_data))
+    logger.error(JsonMessage(log_data))
     metrics["requests_errors"] += 1
 
 
-def get_metrics() -> Dict[str, Any]:
+def snapshot_metrics() -> Dict[str, Any]:
+    """
+    Instantané des métriques de ce worker, sérialisable en JSON
+
+    Compteurs et buckets d'histogrammes bruts (pas de percentiles) : les
+    instantanés de plusieurs workers se fusionnent exactement (merge_snapshots).
+    """
+    return {
+        "counters": {key: value for key, value in metrics.items() if isinstance(value, (int, float))},
+        "requests_by_endpoint": dict(metrics["requests_by_endpoint"]),
+        "requests_by_status": dict(metrics["requests_by_status"]),
+        "histograms": {key: value.to_dict() for key, value in metrics.items() if isinstance(value, LatencyHistogram)},
+        "latency_by_route": [
+            [route, status_group, histogram.to_dict()]
+            for (route, status_group), histogram in list(metrics["latency_by_route"].items())
+        ],
+        "prometheus": {metric.name: metric.snapshot() for metric in _prometheus_registry},
+    }
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fusionne des instantanés (snapshot_metrics) de plusieurs workers
+
+    Returns:
+        {"metrics": même forme que metrics (pour get_metrics),
+         "prometheus": séries par métrique (pour render_prometheus)}
+    """
+    merged: Dict[str, Any] = {key: 0 for key, value in metrics.items() if isinstance(value, (int, float))}
+    merged.update({key: LatencyHistogram() for key, value in metrics.items() if isinstance(value, LatencyHistogram)})
+    merged.update(requests_by_endpoint={}, requests_by_status={}, latency_by_route={})
+    prometheus: Dict[str, Dict] = {metric.name: {} for metric in _prometheus_registry}
+    registry = {metric.name: metric for metric in _prometheus_registry}
+    
+    for snapshot in snapshots:
+        for key, value in snapshot["counters"].items():
+            merged[key] = merged.get(key, 0) + value
+        for field in ("requests_by_endpoint", "requests_by_status"):
+            for key, value in snapshot[field].items():
+                merged[field][key] = merged[field].get(key, 0) + value
+        for key, data in snapshot["histograms"].items():
+            if key in merged:
+                merged[key].merge(data)
+        for route, status_group, data in snapshot["latency_by_route"]:
+            histogram = merged["latency_by_route"].setdefault((route, status_group), LatencyHistogram())
+            histogram.merge(data)
+        for name, entries in snapshot["prometheus"].items():
+            if name in registry:
+                registry[name].merge_into(prometheus[name], entries)
+    
+    return {"metrics": merged, "prometheus": prometheus}
+
+
+def get_metrics(merged: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Retourne les métriques actuelles
+    
+    Args:
+        merged: Métriques fusionnées de plusieurs workers (merge_snapshots), sinon celles de ce worker
     """
+    source = merged["metrics"] if merged is not None else metrics
+    
     # Calculer le taux d'erreur
-    total = metrics["requests_total"]
-    errors = metrics["requests_errors"]
-    success = metrics["requests_success"]
+    total = source["requests_total"]
+    errors = source["requests_errors"]
+    success = source["requests_success"]
     
     error_rate = (errors / total * 100) if total > 0 else 0
     success_rate = (success / total * 100) if total > 0 else 0
     
     # Taux de cache hit
-    cache_total = metrics["cache_hits"] + metrics["cache_misses"]
-    cache_hit_rate = (metrics["cache_hits"] / cache_total * 100) if cache_total > 0 else 0
+    cache_total = source["cache_hits"] + source["cache_misses"]
+    cache_hit_rate = (source["cache_hits"] / cache_total * 100) if cache_total > 0 else 0
+    
+    # Percentiles par route et classe de statut, calculés seulement ici
+    latency_by_route: Dict[str, Dict[str, Any]] = {}
+    for (route, status_group), histogram in sorted(source["latency_by_route"].items()):
+        latency_by_route.setdefault(route, {})[status_group] = histogram.summary()
     
     return {
         "requests": {
@@ -185,35 +850,78 @@ def get_metrics() -> Dict[str, Any]:
             "success_rate": round(success_rate, 2),
             "error_rate": round(error_rate, 2),
         },
-        "latency": {
-            "p50_ms": round(metrics["latency_p50"], 2) if metrics["latency_p50"] else None,
-            "p95_ms": round(metrics["latency_p95"], 2) if metrics["latency_p95"] else None,
-            "p99_ms": round(metrics["latency_p99"], 2) if metrics["latency_p99"] else None,
-        },
+        "latency": source["latency"].summary(),
+        "latency_by_route": latency_by_route,
         "cache": {
-            "hits": metrics["cache_hits"],
-            "misses": metrics["cache_misses"],
+            "hits": source["cache_hits"],
+            "misses": source["cache_misses"],
             "hit_rate": round(cache_hit_rate, 2),
+            "perceptual_hits": source["cache_perceptual_hits"],
+        },
+        "ocr_coalesced": {
+            "local": source["ocr_coalesced_local"],
+            "distributed": source["ocr_coalesced_distributed"],
+            "total": source["ocr_coalesced_local"] + source["ocr_coalesced_distributed"],
+        },
+        "ocr_shed": source["ocr_shed"],
+        "logs_dropped": source["logs_dropped"],
+        "event_loop": {
+            "lag": source["event_loop_lag"].summary(),
+            "blocks": source["event_loop_blocks"],
         },
-        "by_endpoint": metrics["requests_by_endpoint"],
-        "by_status": metrics["requests_by_status"],
+        "by_endpoint": source["requests_by_endpoint"],
+        "by_status": source["requests_by_status"],
     }
 
 
 async def monitoring_middleware(request: Request, call_next):
     """
     Middleware FastAPI pour le monitoring
+    
+    Ajoute le header Server-Timing (durée par étape : décodage, prétraitement,
+    tesseract, extraction, conformité, cache, API externes). Avec un jeton
+    X-Profile valide, la requête est profilée (identifiant dans X-Profile-Id).
+    Les requêtes les plus lentes de chaque route sont gardées dans le journal
+    des requêtes lentes. Pendant le traçage mémoire, le pic de mémoire de la
+    requête est mesuré.
     """
     start_time = time.time()
     endpoint = request.url.path
+    sampler = None
+    profile_token = request.headers.get(PROFILE_HEADER)
+    if profile_token is not None and verify_profile_token(profile_token):
+        sampler = start_request_profile()
+    recorder = SpanRecorder()
+    token = _request_spans.set(recorder)
+    memory_start = begin_request_memory()
     
     try:
         response = await call_next(request)
         response_time = time.time() - start_time
+        response.headers["Server-Timing"] = _request_spans.get().server_timing(response_time)
+        if sampler is not None:
+            response.headers["X-Profile-Id"] = finish_profile(sampler, f"{request.method} {endpoint}")
+            sampler = None
         
         # Log la requête
         log_request(request, response_time, response.status_code, endpoint)
         
+        peak_memory = end_request_memory(memory_start)
+        memory_start = None
+        if peak_memory is not None:
+            request_peak_memory.observe(peak_memory, get_route_template(request))
+        
+        journal = get_slow_request_journal()
+        if journal is not None:
+            journal.offer(get_route_template(request), response_time, lambda: {
+                "method": request.method,
+                "status_code": response.status_code,
+                "plan": plan_label(getattr(request.state, "plan", None)),
+                "stages_ms": recorder.as_dict(),
+                "peak_memory_bytes": peak_memory,
+                "documents": [dict(document) for document in recorder.documents.values()],
+            })
+        
         return response
         
     except Exception as e:
@@ -224,6 +932,11 @@ async def monitoring_middleware(request: Request, call_next):
             "response_time_ms": round(response_time * 1000, 2)
         })
         raise
+    finally:
+        _request_spans.reset(token)
+        end_request_memory(memory_start)  # Requête en erreur : libère le compteur de requêtes en cours
+        if sampler is not None:
+            finish_profile(sampler, f"{request.method} {endpoint} (error)")
 
 
 
@@ -0,0 +1,290 @@
+"""
+Index de hash perceptuel pour retrouver les factures quasi identiques dans le cache
+
+Une même facture ré-enregistrée en JPEG à une autre qualité ou transférée par
+un autre client mail a un SHA-256 différent, mais la même image à quelques
+artefacts de compression près. Recherche en deux étapes :
+
+1. dHash 256 bits par page (gradient sur une vignette normalisée), indexé dans
+   un BK-tree pour trouver les candidats par distance de Hamming
+2. Vérification pixel à pixel sur une vignette 256 px de chaque page : deux
+   factures d'un même modèle fournisseur ont le même dHash, seul ce contrôle
+   distingue un montant ou un numéro différent
+
+Le contrôle est volontairement strict : une facture re-numérisée physiquement
+(décalage, rotation) n'est pas reconnue, mais un résultat OCR n'est jamais
+réutilisé pour un document au contenu différent.
+
+Optionnel et désactivé par défaut. L'index des hash est local au worker ; les
+vignettes de vérification sont stockées dans le cache partagé (Redis ou mémoire).
+"""
+
+import base64
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Dict, Any
+
+from PIL import Image, ImageChops
+
+from cache_redis import get_cached, set_cached
+from upload_spool import open_buffer
+
+try:
+    import fitz  # PyMuPDF
+    FITZ_AVAILABLE = True
+except ImportError:
+    FITZ_AVAILABLE = False
+
+HASH_SIZE = 16  # dHash 16x16 = 256 bits
+VERIFY_SIZE = (256, 362)  # Vignette de vérification (format A4)
+PERCEPTUAL_MAX_DISTANCE = 10  # Distance de Hamming max (sur 256 bits) pour un candidat
+PERCEPTUAL_MAX_PIXEL_DIFF = 20  # Écart max de niveau de gris (0-255) sur la vignette de vérification
+PERCEPTUAL_MAX_ENTRIES = 10000  # Taille max de l'index par worker
+PDF_THUMBNAIL_ZOOM = 0.5  # Rendu basse résolution des pages PDF (36 dpi)
+
+# Une page = (dHash, vignette de vérification en niveaux de gris)
+PageSignature = Tuple[int, bytes]
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Distance de Hamming entre deux hash"""
+    return bin(a ^ b).count("1")
+
+
+def compute_dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    Calcule le dHash d'une image (gradient horizontal sur une vignette en niveaux de gris)
+
+    Args:
+        image: Image PIL
+        hash_size: Côté de la grille (hash de hash_size² bits)
+
+    Returns:
+        Hash sous forme d'entier
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(thumbnail.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def compute_page_signature(image: Image.Image) -> PageSignature:
+    """Calcule le dHash et la vignette de vérification d'une page"""
+    # Pas de décodage JPEG réduit (draft) : il décale les niveaux de gris et fausse la vérification
+    gray = image.convert("L")
+    return compute_dhash(gray), gray.resize(VERIFY_SIZE, Image.BOX).tobytes()
+
+
+def compute_document_signatures(file_data: bytes, is_pdf: bool = False) -> Optional[List[PageSignature]]:
+    """
+    Calcule les signatures perceptuelles d'un document (une par page)
+
+    Returns:
+        Liste des signatures par page, ou None si le document ne peut pas être décodé
+    """
+    try:
+        if is_pdf:
+            if not FITZ_AVAILABLE:
+                return None
+            signatures = []
+            with fitz.open(stream=file_data, filetype="pdf") as pdf_document:
+                for page in pdf_document:
+                    pix = page.get_pixmap(matrix=fitz.Matrix(PDF_THUMBNAIL_ZOOM, PDF_THUMBNAIL_ZOOM), colorspace=fitz.csGRAY)
+                    signatures.append(compute_page_signature(Image.frombytes("L", (pix.width, pix.height), pix.samples)))
+            return signatures or None
+
+        return [compute_page_signature(Image.open(open_buffer(file_data)))]
+    except Exception:
+        return None
+
+
+def thumbnails_match(a: bytes, b: bytes, max_pixel_diff: int = PERCEPTUAL_MAX_PIXEL_DIFF) -> bool:
+    """Vérifie que deux vignettes sont identiques aux artefacts de compression près"""
+    if len(a) != len(b):
+        return False
+    difference = ImageChops.difference(Image.frombytes("L", VERIFY_SIZE, a), Image.frombytes("L", VERIFY_SIZE, b))
+    return difference.getextrema()[1] <= max_pixel_diff
+
+
+class BKTree:
+    """BK-tree pour la recherche de voisins par distance de Hamming"""
+
+    def __init__(self):
+        # Noeud = [hash, valeurs, {distance: noeud enfant}]
+        self.root: Optional[list] = None
+
+    def add(self, hash_value: int, value: Any):
+        """Ajoute un hash (plusieurs valeurs possibles pour un même hash)"""
+        if self.root is None:
+            self.root = [hash_value, [value], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Retourne les valeurs à distance <= max_distance, triées par distance
+        """
+        results = []
+        if self.root is None:
+            return results
+
+        candidates = [self.root]
+        while candidates:
+            node = candidates.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node[1])
+            # Inégalité triangulaire : seuls les enfants dans [d - max, d + max] peuvent matcher
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class PerceptualIndex:
+    """Index borné : dHash par page -> file_hash du résultat en cache"""
+
+    def __init__(
+        self,
+        max_distance: int = PERCEPTUAL_MAX_DISTANCE,
+        max_entries: int = PERCEPTUAL_MAX_ENTRIES,
+        max_pixel_diff: int = PERCEPTUAL_MAX_PIXEL_DIFF
+    ):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.max_pixel_diff = max_pixel_diff
+        self.entries: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self.tree = BKTree()
+
+    def add(self, page_hashes: Tuple[int, ...], file_hash: str):
+        """Indexe les hash d'un document dont le résultat est en cache"""
+        if file_hash in self.entries:
+            self.entries.move_to_end(file_hash)
+            return
+        self.entries[file_hash] = page_hashes
+        self.tree.add(page_hashes[0], file_hash)
+
+        # Index plein : reconstruire l'arbre avec la moitié la plus récente
+        if len(self.entries) > self.max_entries:
+            keep = list(self.entries.items())[len(self.entries) // 2:]
+            self.entries = OrderedDict(keep)
+            self.tree = BKTree()
+            for indexed_hash, hashes in keep:
+                self.tree.add(hashes[0], indexed_hash)
+
+    def candidates(self, page_hashes: Tuple[int, ...], exclude: Optional[str] = None) -> List[Tuple[str, int]]:
+        """
+        Cherche les documents proches (même nombre de pages, chaque page proche)
+
+        Returns:
+            Liste de (file_hash, distance max entre pages), du plus proche au plus éloigné
+        """
+        results = []
+        for _, candidate in self.tree.search(page_hashes[0], self.max_distance):
+            if candidate == exclude:
+                continue
+            candidate_hashes = self.entries.get(candidate)
+            if candidate_hashes is None or len(candidate_hashes) != len(page_hashes):
+                continue
+            distance = max(hamming_distance(a, b) for a, b in zip(page_hashes, candidate_hashes))
+            if distance <= self.max_distance:
+                results.append((candidate, distance))
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def remove(self, file_hash: str):
+        """Oublie un document (ex: résultat expiré du cache) ; l'arbre est nettoyé à la reconstruction"""
+        self.entries.pop(file_hash, None)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+# Instance globale (None = fonctionnalité désactivée)
+_perceptual_index: Optional[PerceptualIndex] = None
+
+
+def init_perceptual_index(
+    enabled: bool,
+    max_distance: int = PERCEPTUAL_MAX_DISTANCE,
+    max_entries: int = PERCEPTUAL_MAX_ENTRIES,
+    max_pixel_diff: int = PERCEPTUAL_MAX_PIXEL_DIFF
+):
+    """Active (ou désactive) l'index de hash perceptuel"""
+    global _perceptual_index
+    _perceptual_index = PerceptualIndex(max_distance, max_entries, max_pixel_diff) if enabled else None
+
+
+def get_perceptual_index() -> Optional[PerceptualIndex]:
+    """Retourne l'index de hash perceptuel, ou None s'il est désactivé"""
+    return _perceptual_index
+
+
+def _thumbnails_key(file_hash: str) -> str:
+    return f"ocr_phash:{file_hash}"
+
+
+async def index_document(file_hash: str, signatures: List[PageSignature], ttl_hours: int):
+    """Indexe un document OCRisé : hash en mémoire, vignettes dans le cache partagé"""
+    if _perceptual_index is None:
+        return
+    thumbnails = [base64.b64encode(zlib.compress(thumbnail)).decode("ascii") for _, thumbnail in signatures]
+    await set_cached(_thumbnails_key(file_hash), {"thumbnails": thumbnails}, ttl_hours=ttl_hours)
+    _perceptual_index.add(tuple(page_hash for page_hash, _ in signatures), file_hash)
+
+
+async def find_near_duplicate(file_hash: str, signatures: List[PageSignature]) -> Optional[Tuple[str, int]]:
+    """
+    Cherche un document déjà OCRisé quasi identique (candidats dHash puis vérification des vignettes)
+
+    Returns:
+        (file_hash du document en cache, distance de Hamming), ou None
+    """
+    if _perceptual_index is None:
+        return None
+
+    page_hashes = tuple(page_hash for page_hash, _ in signatures)
+    for candidate, distance in _perceptual_index.candidates(page_hashes, exclude=file_hash):
+        stored = await get_cached(_thumbnails_key(candidate))
+        if not stored:
+            _perceptual_index.remove(candidate)
+            continue
+        candidate_thumbnails = [zlib.decompress(base64.b64decode(t)) for t in stored["thumbnails"]]
+        if all(
+            thumbnails_match(thumbnail, candidate_thumbnail, _perceptual_index.max_pixel_diff)
+            for (_, thumbnail), candidate_thumbnail in zip(signatures, candidate_thumbnails)
+        ):
+            return candidate, distance
+    return None
+
+
+def get_perceptual_index_info() -> Dict[str, Any]:
+    """Retourne des informations sur l'index"""
+    if _perceptual_index is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "entries": len(_perceptual_index),
+        "max_entries": _perceptual_index.max_entries,
+        "max_distance": _perceptual_index.max_distance,
+        "max_pixel_diff": _perceptual_index.max_pixel_diff,
+        "hash_bits": HASH_SIZE * HASH_SIZE,
+    }
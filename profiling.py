@@ -0,0 +1,214 @@
+"""
+Profilage à la demande (admin) : échantillonnage des piles de tous les threads
+
+- Requête isolée : header X-Profile signé (jeton délivré par /admin/profile/token)
+- Session : POST /admin/profile?seconds=N profile tout le worker pendant N secondes
+
+Le profil est au format « collapsed stacks » (une pile par ligne, frames
+séparées par « ; », suivie du nombre d'échantillons), lisible par flamegraph.pl
+ou speedscope. L'échantillonneur lit sys._current_frames(). Une session couvre
+tous les threads ; le profil d'une requête ne garde que la boucle asyncio et les
+threads du pool pendant qu'ils exécutent un run_in_threadpool de cette requête
+(OCR, prétraitement, extraction), pas le travail des requêtes des autres clients.
+Hors profilage, rien ne tourne ; une requête sans header X-Profile ne coûte
+qu'une recherche de header.
+"""
+
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool as _starlette_run_in_threadpool
+
+DEFAULT_SAMPLE_INTERVAL = 0.005  # 200 échantillons par seconde
+MAX_SESSION_SECONDS = 60
+MAX_TOKEN_TTL_SECONDS = 3600
+PROFILE_HISTORY = 20  # Profils conservés en mémoire (les plus récents)
+PROFILE_HEADER = "X-Profile"
+
+_signing_key: Optional[str] = None
+_profiles: "OrderedDict[str, Dict]" = OrderedDict()
+_active_lock = threading.Lock()  # Un seul profil à la fois
+
+# Profil de la requête en cours (propagé aux threads du pool par run_in_threadpool)
+_request_sampler: ContextVar[Optional["StackSampler"]] = ContextVar("request_sampler", default=None)
+
+
+class StackSampler:
+    """
+    Échantillonne périodiquement la pile Python de chaque thread (sauf le sien),
+    ou seulement des threads rattachés (profil d'une requête)
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, attached_only: bool = False):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._attached: Optional[Counter] = Counter() if attached_only else None
+        self._context_token = None
+
+    def attach_thread(self):
+        """Échantillonne le thread courant jusqu'à detach_thread (sans effet si tous les threads le sont)"""
+        if self._attached is not None:
+            self._attached[threading.get_ident()] += 1
+
+    def detach_thread(self):
+        if self._attached is not None:
+            ident = threading.get_ident()
+            self._attached[ident] -= 1
+            if self._attached[ident] <= 0:
+                del self._attached[ident]
+
+    def run_attached(self, func: Callable, *args, **kwargs) -> Any:
+        """Exécute func dans le thread courant en l'échantillonnant"""
+        self.attach_thread()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.detach_thread()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            attached = set(self._attached) if self._attached is not None else None
+            for ident, frame in sys._current_frames().items():
+                if attached is not None and ident not in attached:
+                    continue  # Thread d'une autre requête
+                if ident == own_ident or frame.f_code.co_filename.endswith("threading.py"):
+                    continue  # Threads en attente (threadpool inoccupé, verrous)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Profil au format collapsed stacks (flamegraph.pl, speedscope)"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def init_profiling(signing_key: Optional[str]):
+    """Active les jetons X-Profile (signés avec la clé admin ; désactivés sans clé)"""
+    global _signing_key
+    _signing_key = signing_key or None
+
+
+def _signature(expires: int) -> str:
+    return hmac.new(_signing_key.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def create_profile_token(ttl: int = 300) -> Dict:
+    """Jeton X-Profile valable ttl secondes, de la forme <expiration unix>.<HMAC-SHA256>"""
+    if not _signing_key:
+        raise ValueError("Profiling disabled: ADMIN_API_KEY is not configured")
+    expires = int(time.time()) + max(1, min(ttl, MAX_TOKEN_TTL_SECONDS))
+    return {"token": f"{expires}.{_signature(expires)}", "expires_at": expires}
+
+
+def verify_profile_token(token: str) -> bool:
+    """Jeton signé, non expiré et d'une durée de validité bornée"""
+    if not _signing_key:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit():
+        return False
+    remaining = int(expires) - time.time()
+    if not 0 < remaining <= MAX_TOKEN_TTL_SECONDS:
+        return False
+    # Comparaison sur des bytes : sur des str, compare_digest lève TypeError hors ASCII
+    return hmac.compare_digest(signature.encode(), _signature(int(expires)).encode())
+
+
+def start_profile(interval: float = DEFAULT_SAMPLE_INTERVAL) -> Optional[StackSampler]:
+    """Démarre un échantillonneur de tous les threads, ou None si un profil est déjà en cours"""
+    if not _active_lock.acquire(blocking=False):
+        return None
+    sampler = StackSampler(interval)
+    sampler.start()
+    return sampler
+
+
+def start_request_profile(interval: float = DEFAULT_SAMPLE_INTERVAL) -> Optional[StackSampler]:
+    """
+    Démarre le profil de la requête en cours (appelé depuis la boucle asyncio),
+    ou None si un profil est déjà en cours
+
+    Seuls la boucle asyncio et les threads du pool exécutant un run_in_threadpool
+    de cette requête sont échantillonnés.
+    """
+    if not _active_lock.acquire(blocking=False):
+        return None
+    sampler = StackSampler(interval, attached_only=True)
+    sampler.attach_thread()
+    sampler._context_token = _request_sampler.set(sampler)
+    sampler.start()
+    return sampler
+
+
+async def run_in_threadpool(func: Callable, *args, **kwargs) -> Any:
+    """run_in_threadpool de Starlette ; pendant le profil d'une requête, le thread du pool y est rattaché"""
+    sampler = _request_sampler.get()
+    if sampler is None:
+        return await _starlette_run_in_threadpool(func, *args, **kwargs)
+    return await _starlette_run_in_threadpool(sampler.run_attached, func, *args, **kwargs)
+
+
+def finish_profile(sampler: StackSampler, label: str) -> str:
+    """Arrête l'échantillonneur, conserve le profil et renvoie son identifiant"""
+    try:
+        sampler.stop()
+        if sampler._context_token is not None:
+            _request_sampler.reset(sampler._context_token)
+            sampler._context_token = None
+    finally:
+        _active_lock.release()
+    profile_id = uuid.uuid4().hex[:12]
+    _profiles[profile_id] = {
+        "id": profile_id,
+        "label": label,
+        "started_at": sampler.started_at,
+        "duration_seconds": round(sampler.duration, 3),
+        "samples": sampler.samples,
+        "collapsed": sampler.collapsed(),
+    }
+    while len(_profiles) > PROFILE_HISTORY:
+        _profiles.popitem(last=False)
+    return profile_id
+
+
+def get_profile(profile_id: str) -> Optional[Dict]:
+    return _profiles.get(profile_id)
+
+
+def list_profiles() -> List[Dict]:
+    """Profils conservés, du plus récent au plus ancien (sans les piles)"""
+    return [
+        {key: value for key, value in profile.items() if key != "collapsed"}
+        for profile in reversed(_profiles.values())
+    ]
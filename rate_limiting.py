@@ -4,46 +4,53 @@ Gère les quotas par plan, par IP, et par clé API
 Support Redis pour scalabilité
 """
 
-from typing import Optional, Dict, Tuple
+from collections import OrderedDict
+from typing import Optional, Dict, List, NamedTuple, Tuple
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from fastapi import Request, HTTPException
+from fastapi import Request
 from fastapi.responses import JSONResponse
 import hashlib
-import json
+import math
+import time
 
-# Tentative d'import Redis
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
+from monitoring import log_rate_limit_rejection
+from redis_pool import REDIS_AVAILABLE, init_redis_pool, get_redis_client
 
-# Cache mémoire de fallback pour rate limiting
-rate_limit_cache: Dict[str, Dict] = {}
-_redis_client: Optional[redis.Redis] = None
+_redis_enabled = False  # Utiliser le pool Redis partagé (redis_pool) si disponible
 
+RATE_LIMIT_KEY_PREFIX = "rate_limit:"  # Compteurs entiers (INCRBY), distincts des anciennes entrées JSON
 
-# Limites par plan (requêtes par mois)
+
+# Limites par plan (unités de quota ; une requête simple coûte une unité, voir QUOTA_COSTS)
 PLAN_LIMITS = {
     "BASIC": {
         "monthly": 400,
         "daily": None,  # Calculé automatiquement (400/30 = ~13-14/jour)
         "per_minute": 1,
+        "burst": 3,  # Requêtes d'affilée admises par gcra (débit lissé ensuite), jamais sous per_minute
+        "ocr_weight": 1,  # Part des créneaux OCR quand plusieurs clients attendent (voir admission.py)
     },
     "PRO": {
         "monthly": 20000,
         "daily": 666,  # ~666/jour
         "per_minute": 10,
+        "burst": 10,
+        "ocr_weight": 2,
     },
     "ULTRA": {
         "monthly": 80000,
         "daily": 2666,  # ~2666/jour
         "per_minute": 50,
+        "burst": 50,
+        "ocr_weight": 4,
     },
     "MEGA": {
         "monthly": 250000,
         "daily": 8333,  # ~8333/jour
         "per_minute": 150,
+        "burst": 150,
+        "ocr_weight": 8,
     },
 }
 
@@ -52,68 +59,500 @@ IP_LIMITS = {
     "per_minute": 20,  # Max 20 requêtes/minute par IP
     "per_hour": 200,   # Max 200 requêtes/heure par IP
     "per_day": 1000,   # Max 1000 requêtes/jour par IP
+    "burst": 10,       # Rafale max de la fenêtre minute (gcra)
 }
 
 
+# Coût d'une requête en unités des quotas mensuel/quotidien, ajusté une fois la requête traitée.
+# Les fenêtres par minute et par IP comptent toujours une unité par requête HTTP.
+QUOTA_COSTS = {
+    "request": 1,  # Requête sans OCR (export, conformité...) ou résultat servi depuis le cache
+    "page": 1,  # Par page réellement OCRisée (pages déjà en cache exclues)
+    "ocr_seconds": 5.0,  # Secondes d'OCR par unité, si plus coûteux que le nombre de pages
+}
+
+
+class QuotaUsage:
+    """Travail effectué pendant une requête (OCR), base de son coût en unités de quota"""
+    __slots__ = ("pages", "ocr_seconds")
+    
+    def __init__(self):
+        self.pages = 0
+        self.ocr_seconds = 0.0
+    
+    @property
+    def cost(self) -> int:
+        if not self.pages and not self.ocr_seconds:
+            return QUOTA_COSTS["request"]
+        return max(
+            QUOTA_COSTS["request"],
+            self.pages * QUOTA_COSTS["page"],
+            math.ceil(self.ocr_seconds / QUOTA_COSTS["ocr_seconds"])
+        )
+
+
+# Usage de la requête en cours (posé par rate_limit_middleware, hérité par les tâches du handler)
+_quota_usage: ContextVar[Optional[QuotaUsage]] = ContextVar("quota_usage", default=None)
+
+
+# Client et plan de la requête en cours (file OCR du tenant, voir admission.py)
+_request_tenant: ContextVar[Tuple[str, Optional[str]]] = ContextVar("request_tenant", default=("internal", None))
+
+
+def get_request_tenant() -> Tuple[str, Optional[str]]:
+    """(client_id, plan) de la requête en cours, ("internal", None) hors requête (ex: prewarm)"""
+    return _request_tenant.get()
+
+
+def record_ocr_usage(pages: int, ocr_seconds: float):
+    """Ajoute un OCR au coût de la requête en cours (sans effet hors requête, ex: prewarm)"""
+    usage = _quota_usage.get()
+    if usage is not None:
+        usage.pages += pages
+        usage.ocr_seconds += ocr_seconds
+
+
+RATE_LIMIT_ALGORITHMS = ("fixed", "sliding", "gcra")
+# Algorithme des fenêtres courtes (minute) ; les quotas heure/jour/mois restent en fenêtres fixes
+RATE_LIMIT_ALGORITHM = "gcra"
+
+
+class RateWindow(NamedTuple):
+    """
+    Fenêtre de limitation : compteur, limite, durée et algorithme
+    
+    - fixed : compteur remis à zéro en fin de fenêtre (jusqu'à 2x limit autour de la réinitialisation)
+    - sliding : compteur glissant, estimé à partir de la fenêtre fixe précédente pondérée
+    - gcra : débit limit/period lissé, avec au plus burst requêtes d'affilée
+    
+    quota : quota du plan (mensuel, quotidien), jamais évincé du store mémoire tant qu'il est vivant
+    """
+    key: str
+    limit: int
+    period: int  # secondes
+    algorithm: str = "fixed"
+    burst: int = 0  # gcra uniquement (0 = limit)
+    quota: bool = False
+    
+    @property
+    def capacity(self) -> int:
+        """Requêtes acceptables d'affilée (base de remaining)"""
+        if self.algorithm == "gcra":
+            return self.burst or self.limit
+        return self.limit
+
+
+# Vérifie toutes les fenêtres puis les met à jour, en un seul appel atomique :
+# deux requêtes concurrentes ne peuvent pas perdre d'incrément, et une requête
+# refusée ne consomme aucun quota. L'heure vient du serveur Redis (TIME), commune à tous les workers.
+# KEYS : fenêtres ; ARGV : coût, force (1 = appliquer le coût sans vérifier, ex: ajustement
+# après traitement), puis (limite, durée en secondes, algorithme, burst) par fenêtre
+# Retourne {index de la première fenêtre dépassée (0 = accepté), compteurs,
+#           ms avant réinitialisation, ms avant qu'une requête de ce coût soit acceptée}
+RATE_LIMIT_SCRIPT = """
+local cost = tonumber(ARGV[1])
+local force = ARGV[2] == '1'
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local denied = 0
+local windows = {}
+
+local function check(key, limit, period, algorithm, burst, commit)
+    if algorithm == 'gcra' then
+        -- Heure théorique d'arrivée (TAT) : le seau est vide quand TAT <= now
+        local interval = period / limit
+        local tat = math.max(tonumber(redis.call('GET', key) or '0'), now)
+        local allow_at = tat + cost * interval - burst * interval
+        if commit then
+            tat = math.ceil(tat + cost * interval)
+            redis.call('SET', key, tat, 'PX', tat - now)
+        end
+        return math.ceil((tat - now) / interval), tat - now, math.max(0, math.ceil(allow_at - now))
+    elseif algorithm == 'sliding' then
+        local index = math.floor(now / period)
+        local elapsed = now - index * period
+        local current_key = key .. ':' .. index
+        local current = tonumber(redis.call('GET', current_key) or '0')
+        local previous = tonumber(redis.call('GET', key .. ':' .. (index - 1)) or '0')
+        if commit then
+            current = redis.call('INCRBY', current_key, cost)
+            redis.call('PEXPIRE', current_key, 2 * period - elapsed)
+        end
+        local estimate = previous * (period - elapsed) / period + current
+        local retry = 0
+        if estimate + cost > limit then
+            if current + cost <= limit then
+                retry = period * (1 - (limit - current - cost) / previous) - elapsed
+            else
+                retry = 2 * period - elapsed - period * (limit - cost) / current
+            end
+        end
+        return math.ceil(estimate), period - elapsed, math.ceil(retry)
+    end
+    local count = tonumber(redis.call('GET', key) or '0')
+    if commit then
+        count = redis.call('INCRBY', key, cost)
+        if redis.call('PTTL', key) < 0 then
+            redis.call('PEXPIRE', key, period)
+        end
+    end
+    local ttl = redis.call('PTTL', key)
+    if ttl < 0 then
+        ttl = period
+    end
+    local retry = 0
+    if count + cost > limit then
+        retry = ttl
+    end
+    return count, ttl, retry
+end
+
+local counts, resets, retries = {}, {}, {}
+for i, key in ipairs(KEYS) do
+    local base = 4 * i - 1
+    windows[i] = {tonumber(ARGV[base]), tonumber(ARGV[base + 1]) * 1000, ARGV[base + 2], tonumber(ARGV[base + 3])}
+    counts[i], resets[i], retries[i] = check(key, windows[i][1], windows[i][2], windows[i][3], windows[i][4], false)
+    if denied == 0 and retries[i] > 0 and not force then
+        denied = i
+    end
+end
+if denied == 0 and cost ~= 0 then
+    for i, key in ipairs(KEYS) do
+        counts[i], resets[i] = check(key, windows[i][1], windows[i][2], windows[i][3], windows[i][4], true)
+    end
+end
+return {denied, counts, resets, retries}
+"""
+
+
+def _monotonic_ms() -> int:
+    """Horloge monotone en millisecondes entières"""
+    return time.monotonic_ns() // 1_000_000
+
+
+WHEEL_BITS = 6
+WHEEL_SLOTS = 1 << WHEEL_BITS  # 64 cases par niveau
+WHEEL_MASK = WHEEL_SLOTS - 1
+WHEEL_LEVELS = 4  # Cases de 1 s, 64 s, ~68 min, ~3 jours : horizon ~194 jours
+WHEEL_TICK_MS = 1000
+
+
+class TimingWheel:
+    """
+    Roue temporelle hiérarchique (secondes) : planification et expiration en O(1) amorti
+    
+    Une échéance lointaine est rangée dans un niveau grossier puis redescendue
+    (cascade) quand le niveau inférieur fait un tour, jusqu'au niveau des secondes.
+    """
+    
+    __slots__ = ("levels", "counts", "tick", "size")
+    
+    def __init__(self, tick: int = 0):
+        self.levels = [[[] for _ in range(WHEEL_SLOTS)] for _ in range(WHEEL_LEVELS)]
+        self.counts = [0] * WHEEL_LEVELS  # Entrées par niveau
+        self.tick = tick
+        self.size = 0
+    
+    def schedule(self, key: str, expire_tick: int) -> bool:
+        """Planifie l'expiration d'une clé ; False si l'échéance est déjà passée"""
+        delta = expire_tick - self.tick
+        if delta <= 0:
+            return False
+        level = 0
+        while level < WHEEL_LEVELS - 1 and delta >= 1 << (WHEEL_BITS * (level + 1)):
+            level += 1
+        slot = (expire_tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+        self.levels[level][slot].append((key, expire_tick))
+        self.counts[level] += 1
+        self.size += 1
+        return True
+    
+    def _take(self, level: int, slot: int) -> list:
+        entries, self.levels[level][slot] = self.levels[level][slot], []
+        self.counts[level] -= len(entries)
+        self.size -= len(entries)
+        return entries
+    
+    def advance(self, tick: int) -> List[str]:
+        """Avance jusqu'à tick et retourne les clés arrivées à échéance"""
+        expired = []
+        while self.tick < tick:
+            if self.size == 0:
+                self.tick = tick
+                break
+            # Niveaux inférieurs vides : rien ne se passe avant la prochaine frontière du premier niveau occupé
+            empty = 0
+            while self.counts[empty] == 0:
+                empty += 1
+            if empty:
+                boundary = ((self.tick >> (WHEEL_BITS * empty)) + 1) << (WHEEL_BITS * empty)
+                if boundary > tick:
+                    self.tick = tick
+                    break
+                self.tick = boundary - 1
+            
+            self.tick += 1
+            # Cascade : les niveaux supérieurs redescendent quand le niveau inférieur fait un tour
+            for level in range(WHEEL_LEVELS - 1, 0, -1):
+                if self.tick & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                    slot = (self.tick >> (WHEEL_BITS * level)) & WHEEL_MASK
+                    for key, expire_tick in self._take(level, slot):
+                        if not self.schedule(key, expire_tick):
+                            expired.append(key)
+            expired.extend(key for key, _ in self._take(0, self.tick & WHEEL_MASK))
+        return expired
+
+
+class _Counter:
+    """Compteur d'une fenêtre, ou TAT en ms pour gcra (expiration en ms monotones)"""
+    __slots__ = ("count", "expires_at", "scheduled")
+    
+    def __init__(self, count: int, expires_at: int):
+        self.count = count
+        self.expires_at = expires_at
+        self.scheduled = 0  # Case de la roue qui porte ce compteur
+
+
+class MemoryRateLimitStore:
+    """
+    Fenêtres en mémoire (fallback sans Redis), même sémantique que RATE_LIMIT_SCRIPT
+    
+    Chaque vérification est en O(1) : les compteurs expirés sont retirés par une
+    roue temporelle au fil de l'eau, sans parcours du dictionnaire. Au-delà de
+    max_keys compteurs de débit vivants (flood d'IP distinctes), les plus anciens
+    sont évincés. Les quotas du plan sont gardés à part, bornés par max_quota_keys
+    en LRU : un flood d'identifiants n'évince que les quotas des clients inactifs
+    depuis le plus longtemps, jamais celui d'un client actif.
+    """
+    
+    def __init__(self, max_keys: int = 100000, max_quota_keys: int = 100000, clock=_monotonic_ms):
+        self.max_keys = max_keys
+        self.max_quota_keys = max_quota_keys
+        self.clock = clock
+        self.counters: Dict[str, _Counter] = {}  # Débits (IP, minute du plan), bornés par max_keys
+        self.quota_counters: "OrderedDict[str, _Counter]" = OrderedDict()  # Quotas mensuel et quotidien (LRU)
+        self.wheel = TimingWheel(clock() // WHEEL_TICK_MS)
+    
+    def consume(
+        self, windows: List[RateWindow], cost: int = 1, force: bool = False
+    ) -> Tuple[int, List[int], List[float], List[float]]:
+        """
+        Returns:
+            (index 1-based de la première fenêtre dépassée ou 0, compteurs,
+             secondes avant réinitialisation, secondes avant qu'une requête de ce coût soit acceptée)
+        """
+        now = self.clock()
+        self._expire(now)
+        
+        checks = [self._check(window, now, cost, commit=False) for window in windows]
+        denied = 0 if force else next((i for i, (_, _, retry) in enumerate(checks, start=1) if retry > 0), 0)
+        retries = [retry / 1000 for _, _, retry in checks]
+        if not denied and cost != 0:
+            checks = [self._check(window, now, cost, commit=True) for window in windows]
+        
+        counts = [count for count, _, _ in checks]
+        resets = [reset / 1000 for _, reset, _ in checks]
+        return denied, counts, resets, retries
+    
+    def _check(self, window: RateWindow, now: int, cost: int, commit: bool) -> Tuple[int, int, int]:
+        """(compteur, ms avant réinitialisation, ms avant acceptation) ; commit applique le coût"""
+        period = window.period * 1000
+        counters = self.quota_counters if window.quota else self.counters
+        
+        if window.algorithm == "gcra":
+            interval = period / window.limit
+            counter = self._live(counters, window.key, now)
+            tat = max(counter.count if counter else 0, now)
+            allow_at = tat + cost * interval - window.capacity * interval
+            if commit:
+                tat = math.ceil(tat + cost * interval)
+                if counter is None:
+                    counter = self._create(counters, window.key, tat)
+                counter.count = counter.expires_at = tat
+            return math.ceil((tat - now) / interval), tat - now, max(0, math.ceil(allow_at - now))
+        
+        if window.algorithm == "sliding":
+            index, elapsed = divmod(now, period)
+            counter = self._live(counters, f"{window.key}:{index}", now)
+            previous_counter = self._live(counters, f"{window.key}:{index - 1}", now)
+            if commit:
+                if counter is None:
+                    counter = self._create(counters, f"{window.key}:{index}", (index + 2) * period)
+                counter.count += cost
+            current = counter.count if counter else 0
+            previous = previous_counter.count if previous_counter else 0
+            estimate = previous * (period - elapsed) / period + current
+            retry = 0
+            if estimate + cost > window.limit:
+                if current + cost <= window.limit:
+                    retry = period * (1 - (window.limit - current - cost) / previous) - elapsed
+                else:
+                    retry = 2 * period - elapsed - period * (window.limit - cost) / current
+            return math.ceil(estimate), period - elapsed, math.ceil(retry)
+        
+        counter = self._live(counters, window.key, now)
+        if commit:
+            if counter is None:
+                counter = self._create(counters, window.key, now + period)
+            counter.count += cost
+        count = counter.count if counter else 0
+        reset = counter.expires_at - now if counter else period
+        return count, reset, reset if count + cost > window.limit else 0
+    
+    def _live(self, counters: Dict[str, _Counter], key: str, now: int) -> Optional[_Counter]:
+        counter = counters.get(key)
+        if counter is None:
+            return None
+        if counter.expires_at <= now:
+            return None
+        if counters is self.quota_counters:
+            counters.move_to_end(key)  # Ordre LRU des quotas
+        return counter
+    
+    def _create(self, counters: Dict[str, _Counter], key: str, expires_at: int) -> _Counter:
+        counter = counters[key] = _Counter(0, expires_at)
+        self._schedule(key, counter)
+        # Les compteurs expirés ont déjà été retirés par la roue (consume) ; l'entrée
+        # évincée garde sa case dans la roue, ignorée à l'échéance
+        if counters is self.quota_counters:
+            if len(counters) > self.max_quota_keys:
+                counters.popitem(last=False)  # Quota du client inactif depuis le plus longtemps
+        elif len(counters) > self.max_keys:
+            del counters[next(iter(counters))]  # Plus ancien compteur de débit créé
+        return counter
+    
+    def _schedule(self, key: str, counter: _Counter):
+        # Échéance arrondie à la seconde supérieure : le compteur est expiré quand la case est traitée
+        counter.scheduled = counter.expires_at // WHEEL_TICK_MS + 1
+        self.wheel.schedule(key, counter.scheduled)
+    
+    def _expire(self, now: int):
+        for key in self.wheel.advance(now // WHEEL_TICK_MS):
+            counters = self.quota_counters if key in self.quota_counters else self.counters
+            counter = counters.get(key)
+            # Ignorée si la clé a été évincée puis recréée (une autre case la porte)
+            if counter is None or counter.scheduled > self.wheel.tick:
+                continue
+            if counter.expires_at <= now:
+                del counters[key]
+            else:
+                self._schedule(key, counter)  # Échéance repoussée (TAT gcra)
+    
+    def clear(self):
+        self.counters.clear()
+        self.quota_counters.clear()
+        self.wheel = TimingWheel(self.clock() // WHEEL_TICK_MS)
+
+
+# Fallback mémoire (par worker)
+_memory_store = MemoryRateLimitStore()
+_rate_limit_script = None  # Script enregistré sur le client Redis partagé
+
+
 def init_rate_limit_redis(redis_url: Optional[str] = None, redis_db: int = 0):
     """
     Initialise Redis pour le rate limiting (optionnel)
+    Réutilise le pool asynchrone partagé avec le cache
     
     Args:
         redis_url: URL Redis (ex: redis://localhost:6379)
         redis_db: Numéro de base de données Redis
     """
-    global _redis_client
+    global _redis_enabled, _rate_limit_script
     
+    _rate_limit_script = None
     if not REDIS_AVAILABLE:
         return False
     
     if not redis_url:
         return False
     
-    try:
-        _redis_client = redis.from_url(redis_url, db=redis_db, decode_responses=True)
-        _redis_client.ping()
-        return True
-    except Exception:
-        _redis_client = None
-        return False
+    _redis_enabled = init_redis_pool(redis_url, redis_db)
+    return _redis_enabled
+
+
+def _get_redis():
+    """Retourne le client Redis asynchrone partagé si le rate limiting l'utilise"""
+    return get_redis_client() if _redis_enabled else None
+
+
+def _storage_key(window: RateWindow) -> str:
+    # Préfixe par algorithme : un changement d'algorithme ne relit pas un TAT comme un compteur
+    if window.algorithm == "fixed":
+        return RATE_LIMIT_KEY_PREFIX + window.key
+    return f"{RATE_LIMIT_KEY_PREFIX}{window.algorithm}:{window.key}"
 
 
-def _get_rate_limit_counter(cache_key: str) -> Optional[Dict]:
-    """Récupère un compteur depuis Redis ou mémoire"""
-    if _redis_client:
+async def consume_rate_limits(windows: List[RateWindow], cost: int = 1, force: bool = False) -> Tuple[int, List[Dict]]:
+    """
+    Vérifie et consomme plusieurs fenêtres en une opération atomique
+    (un seul appel de script Redis, ou le store mémoire)
+    
+    Args:
+        windows: Fenêtres à vérifier
+        cost: Unités consommées si toutes les fenêtres l'acceptent (0 = simple lecture,
+              négatif = remboursement)
+        force: Appliquer le coût sans refuser (ajustement une fois la requête traitée)
+    
+    Returns:
+        (index 1-based de la première fenêtre dépassée ou 0 si acceptée,
+         état de chaque fenêtre : limit, count, remaining, reset_after et
+         retry_after en secondes)
+    """
+    global _rate_limit_script
+    
+    keys = [_storage_key(window) for window in windows]
+    result = None
+    redis_client = _get_redis()
+    if redis_client:
         try:
-            data = _redis_client.get(cache_key)
-            if data:
-                return json.loads(data)
+            if _rate_limit_script is None:
+                _rate_limit_script = redis_client.register_script(RATE_LIMIT_SCRIPT)
+            args = [cost, int(force)] + [
+                value for window in windows
+                for value in (window.limit, window.period, window.algorithm, window.capacity)
+            ]
+            denied, counts, resets_ms, retries_ms = await _rate_limit_script(keys=keys, args=args, client=redis_client)
+            result = (
+                int(denied),
+                [int(count) for count in counts],
+                [int(reset) / 1000 for reset in resets_ms],
+                [int(retry) / 1000 for retry in retries_ms],
+            )
         except Exception:
-            pass
+            pass  # Fallback mémoire
     
-    # Fallback mémoire
-    return rate_limit_cache.get(cache_key)
+    if result is None:
+        result = _memory_store.consume(
+            [window._replace(key=key) for window, key in zip(windows, keys)], cost, force
+        )
+    
+    denied, counts, resets, retries = result
+    states = [
+        {
+            "limit": window.limit,
+            "count": count,
+            "remaining": max(0, window.capacity - count),
+            "reset_after": reset_after,
+            "retry_after": retry_after,
+        }
+        for window, count, reset_after, retry_after in zip(windows, counts, resets, retries)
+    ]
+    return denied, states
 
 
-def _set_rate_limit_counter(cache_key: str, counter_data: Dict, ttl_seconds: Optional[int] = None):
-    """Stocke un compteur dans Redis ou mémoire"""
-    if _redis_client and ttl_seconds:
-        try:
-            _redis_client.setex(cache_key, ttl_seconds, json.dumps(counter_data))
-            return
-        except Exception:
-            pass
+def set_rate_limit_algorithm(algorithm: str):
+    """
+    Choisit l'algorithme des fenêtres courtes (minute par plan et par IP)
     
-    # Fallback mémoire
-    rate_limit_cache[cache_key] = counter_data
+    Args:
+        algorithm: "fixed", "sliding" ou "gcra"
+    """
+    global RATE_LIMIT_ALGORITHM
     
-    # Nettoyer le cache mémoire si trop grand
-    if len(rate_limit_cache) > 10000:
-        expired_keys = [
-            k for k, v in rate_limit_cache.items()
-            if datetime.fromisoformat(v.get("reset_time", "2000-01-01")) < datetime.now()
-        ]
-        for k in expired_keys[:1000]:
-            del rate_limit_cache[k]
+    if algorithm not in RATE_LIMIT_ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm} (expected one of {', '.join(RATE_LIMIT_ALGORITHMS)})")
+    RATE_LIMIT_ALGORITHM = algorithm
 
 
 def get_client_identifier(request: Request) -> str:
@@ -131,6 +570,19 @@ def get_client_identifier(request: Request) -> str:
     return f"ip:{client_ip}"
 
 
+def get_customer_identifier(request: Request) -> Optional[str]:
+    """
+    Identifiant propre à l'abonné, ou None
+    
+    Derrière RapidAPI, X-RapidAPI-Proxy-Secret est commun à tous les abonnés :
+    seul X-RapidAPI-User (ajouté par le proxy) les distingue.
+    """
+    user = request.headers.get("X-RapidAPI-User")
+    if user:
+        return f"user:{hashlib.sha256(user.encode()).hexdigest()[:16]}"
+    return None
+
+
 def get_plan_from_request(request: Request) -> str:
     """
     Détermine le plan de l'utilisateur depuis les headers RapidAPI
@@ -147,165 +599,104 @@ def get_plan_from_request(request: Request) -> str:
     return plan
 
 
-def check_rate_limit(
-    request: Request,
-    limit_type: str = "monthly"
-) -> Tuple[bool, Optional[Dict]]:
+# La fenêtre minute suit RATE_LIMIT_ALGORITHM, les autres restent fixes
+IP_WINDOWS = [
+    ("minute", IP_LIMITS["per_minute"], 60),
+    ("hour", IP_LIMITS["per_hour"], 3600),
+    ("day", IP_LIMITS["per_day"], 86400),
+]
+# Fenêtres consommées par rate_limit_middleware, dans l'ordre (étiquettes des refus dans /metrics)
+MIDDLEWARE_WINDOWS = [f"ip_{period}" for period, _, _ in IP_WINDOWS] + ["monthly", "daily", "per_minute"]
+
+
+def get_plan_window(request: Request, limit_type: str = "monthly") -> Tuple[str, Optional[RateWindow]]:
     """
-    Vérifie si la requête respecte les limites de rate limiting
+    Fenêtre de quota du plan pour ce client
     
     Args:
-        request: Requête FastAPI
         limit_type: Type de limite ("monthly", "daily", "per_minute")
     
     Returns:
-        Tuple (is_allowed, rate_limit_info)
-        rate_limit_info contient: limit, remaining, reset_time
+        (plan, fenêtre) ; fenêtre None pour per_minute sans identifiant d'abonné
+        (un seau commun à tous les clients du proxy les bloquerait tous)
     """
     client_id = get_client_identifier(request)
     plan = get_plan_from_request(request)
-    
-    # Récupérer les limites du plan
     plan_limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["BASIC"])
     
-    # Déterminer la limite selon le type
-    if limit_type == "monthly":
-        limit = plan_limits["monthly"]
-        window = timedelta(days=30)
-        key_suffix = "monthly"
-    elif limit_type == "daily":
-        # Calculer la limite quotidienne : monthly / 30, arrondi au supérieur pour être plus généreux
-        if plan_limits.get("daily") is not None:
-            limit = plan_limits["daily"]
-        else:
-            # Arrondir au supérieur pour éviter les limites trop restrictives
-            import math
-            limit = math.ceil(plan_limits["monthly"] / 30)
-        window = timedelta(days=1)
-        key_suffix = "daily"
-    elif limit_type == "per_minute":
-        limit = plan_limits["per_minute"]
-        window = timedelta(minutes=1)
-        key_suffix = "minute"
-    else:
-        limit = plan_limits["monthly"]
-        window = timedelta(days=30)
-        key_suffix = "monthly"
-    
-    # Clé de cache pour ce client et cette fenêtre
-    cache_key = f"{client_id}:{key_suffix}"
-    
-    # Récupérer les compteurs actuels
-    now = datetime.now()
-    
-    # Récupérer depuis Redis ou mémoire
-    counter_data = _get_rate_limit_counter(cache_key)
-    
-    if counter_data:
-        reset_time = datetime.fromisoformat(counter_data["reset_time"])
-        
-        # Si la fenêtre est expirée, réinitialiser
-        if now >= reset_time:
-            counter_data = {
-                "count": 0,
-                "reset_time": (now + window).isoformat(),
-                "first_request": now.isoformat()
-            }
-        else:
-            counter_data["count"] = counter_data.get("count", 0) + 1
-    else:
-        # Première requête pour ce client
-        counter_data = {
-            "count": 1,
-            "reset_time": (now + window).isoformat(),
-            "first_request": now.isoformat()
-        }
-    
-    # Sauvegarder dans Redis ou mémoire avec TTL
-    ttl_seconds = int(window.total_seconds())
-    _set_rate_limit_counter(cache_key, counter_data, ttl_seconds)
-    
-    # Nettoyer le cache si trop grand (garder seulement les 10000 dernières entrées)
-    if len(rate_limit_cache) > 10000:
-        # Supprimer les entrées expirées
-        expired_keys = [
-            k for k, v in rate_limit_cache.items()
-            if datetime.fromisoformat(v["reset_time"]) < now
-        ]
-        for k in expired_keys[:1000]:  # Supprimer max 1000 à la fois
-            del rate_limit_cache[k]
-    
-    # Vérifier si la limite est dépassée
-    count = counter_data["count"]
-    remaining = max(0, limit - count)
-    reset_time = datetime.fromisoformat(counter_data["reset_time"])
-    
-    rate_limit_info = {
-        "limit": limit,
-        "remaining": remaining,
-        "reset_time": reset_time.isoformat(),
+    if limit_type == "daily":
+        # Limite quotidienne : monthly / 30, arrondi au supérieur pour être plus généreux
+        limit = plan_limits["daily"] if plan_limits.get("daily") is not None else math.ceil(plan_limits["monthly"] / 30)
+        return plan, RateWindow(f"{client_id}:daily", limit, 86400, quota=True)
+    if limit_type == "per_minute":
+        customer_id = get_customer_identifier(request)
+        if customer_id is None:
+            return plan, None
+        return plan, RateWindow(
+            f"{customer_id}:per_minute", plan_limits["per_minute"], 60,
+            RATE_LIMIT_ALGORITHM, plan_limits.get("burst", 0)
+        )
+    return plan, RateWindow(f"{client_id}:monthly", plan_limits["monthly"], 30 * 86400, quota=True)
+
+
+def get_ip_windows(request: Request) -> List[RateWindow]:
+    """Fenêtres anti-abus par IP (minute, heure, jour)"""
+    client_ip = request.client.host if request.client else "unknown"
+    windows = [RateWindow(f"ip:{client_ip}:{period}", limit, seconds) for period, limit, seconds in IP_WINDOWS]
+    windows[0] = windows[0]._replace(algorithm=RATE_LIMIT_ALGORITHM, burst=IP_LIMITS["burst"])
+    return windows
+
+
+def _reset_time(reset_after: float) -> str:
+    return (datetime.now() + timedelta(seconds=reset_after)).isoformat()
+
+
+def _plan_info(plan: str, state: Dict) -> Dict:
+    return {
+        "limit": state["limit"],
+        "remaining": state["remaining"],
+        "reset_time": _reset_time(state["reset_after"]),
         "plan": plan
     }
+
+
+def _ip_info(period: str, state: Dict) -> Dict:
+    return {
+        "limit": state["limit"],
+        "period": period,
+        "reset_time": _reset_time(state["reset_after"])
+    }
+
+
+async def check_rate_limit(
+    request: Request,
+    limit_type: str = "monthly",
+    cost: int = 1
+) -> Tuple[bool, Optional[Dict]]:
+    """
+    Vérifie si la requête respecte les limites de rate limiting
     
-    if count > limit:
-        return False, rate_limit_info
+    Args:
+        request: Requête FastAPI
+        limit_type: Type de limite ("monthly", "daily", "per_minute")
+        cost: Unités consommées (0 = consultation sans consommer)
     
-    return True, rate_limit_info
+    Returns:
+        Tuple (is_allowed, rate_limit_info)
+        rate_limit_info contient: limit, remaining, reset_time
+    """
+    plan, window = get_plan_window(request, limit_type)
+    denied, [state] = await consume_rate_limits([window], cost)
+    return not denied, _plan_info(plan, state)
 
 
-def check_ip_rate_limit(request: Request) -> Tuple[bool, Optional[Dict]]:
+async def check_ip_rate_limit(request: Request) -> Tuple[bool, Optional[Dict]]:
     """
-    Vérifie les limites par IP (protection anti-abus)
+    Vérifie les limites par IP (protection anti-abus), les trois fenêtres en un appel
     """
-    client_ip = request.client.host if request.client else "unknown"
-    
-    # Vérifier les limites par minute, heure, jour
-    for period, limit in [
-        ("minute", IP_LIMITS["per_minute"]),
-        ("hour", IP_LIMITS["per_hour"]),
-        ("day", IP_LIMITS["per_day"]),
-    ]:
-        if period == "minute":
-            window = timedelta(minutes=1)
-        elif period == "hour":
-            window = timedelta(hours=1)
-        else:
-            window = timedelta(days=1)
-        
-        cache_key = f"ip:{client_ip}:{period}"
-        now = datetime.now()
-        
-        # Récupérer depuis Redis ou mémoire
-        counter_data = _get_rate_limit_counter(cache_key)
-        
-        if counter_data:
-            reset_time = datetime.fromisoformat(counter_data["reset_time"])
-            
-            if now >= reset_time:
-                counter_data = {
-                    "count": 0,
-                    "reset_time": (now + window).isoformat()
-                }
-            else:
-                counter_data["count"] = counter_data.get("count", 0) + 1
-        else:
-            counter_data = {
-                "count": 1,
-                "reset_time": (now + window).isoformat()
-            }
-        
-        # Sauvegarder avec TTL
-        ttl_seconds = int(window.total_seconds())
-        _set_rate_limit_counter(cache_key, counter_data, ttl_seconds)
-        
-        # Vérifier limite
-        if counter_data["count"] > limit:
-            return False, {
-                "limit": limit,
-                "period": period,
-                "reset_time": counter_data["reset_time"]
-            }
-    
+    denied, states = await consume_rate_limits(get_ip_windows(request))
+    if denied:
+        return False, _ip_info(IP_WINDOWS[denied - 1][0], states[denied - 1])
     return True, None
 
 
@@ -325,39 +716,57 @@ def get_rate_limit_headers(rate_limit_info: Dict) -> Dict[str, str]:
 async def rate_limit_middleware(request: Request, call_next):
     """
     Middleware FastAPI pour le rate limiting
+    
+    Fenêtres IP (minute, heure, jour), quotas du plan (mensuel, quotidien) et
+    débit par minute du plan (abonnés identifiés par X-RapidAPI-User) vérifiés
+    et consommés en un seul appel atomique.
+    Une fois la requête traitée, les quotas mensuel et quotidien sont ajustés
+    à son coût réel (pages OCRisées, temps d'OCR ; voir QUOTA_COSTS).
     """
     # Skip rate limiting pour les endpoints publics
-    public_paths = ["/docs", "/redoc", "/openapi.json", "/health", "/"]
+    public_paths = ["/docs", "/redoc", "/openapi.json", "/health", "/metrics", "/"]
     if request.url.path in public_paths or request.url.path.startswith("/v1/languages"):
         response = await call_next(request)
         return response
     
-    # Vérifier les limites par IP (protection anti-abus)
-    ip_allowed, ip_info = check_ip_rate_limit(request)
-    if not ip_allowed:
+    ip_windows = get_ip_windows(request)
+    plan, monthly_window = get_plan_window(request, "monthly")
+    _, daily_window = get_plan_window(request, "daily")
+    _, minute_window = get_plan_window(request, "per_minute")
+    windows = ip_windows + [monthly_window, daily_window]
+    if minute_window is not None:
+        windows.append(minute_window)  # Débit du plan, seulement par abonné identifié
+    denied, states = await consume_rate_limits(windows)
+    ip_states, (monthly_state, daily_state) = states[:len(ip_windows)], states[len(ip_windows):len(ip_windows) + 2]
+    rate_limit_info = _plan_info(plan, monthly_state)
+    daily_info = _plan_info(plan, daily_state)
+    request.state.plan = plan  # Étiquette plan des métriques de latence
+    if denied:
+        log_rate_limit_rejection(MIDDLEWARE_WINDOWS[denied - 1])
+    
+    # Limites par IP (protection anti-abus)
+    if 0 < denied <= len(ip_windows):
+        period = IP_WINDOWS[denied - 1][0]
+        retry_after = math.ceil(ip_states[denied - 1]["retry_after"])
         return JSONResponse(
             status_code=429,
             content={
                 "error": "Too Many Requests",
-                "message": f"Rate limit exceeded. Max {ip_info['limit']} requests per {ip_info['period']}.",
-                "retry_after": int((datetime.fromisoformat(ip_info["reset_time"]) - datetime.now()).total_seconds())
+                "message": f"Rate limit exceeded. Max {ip_states[denied - 1]['limit']} requests per {period}.",
+                "retry_after": retry_after
             },
-            headers={"Retry-After": str(int((datetime.fromisoformat(ip_info["reset_time"]) - datetime.now()).total_seconds()))}
+            headers={"Retry-After": str(retry_after)}
         )
     
-    # Vérifier les limites par plan (mensuel principalement)
-    allowed, rate_limit_info = check_rate_limit(request, limit_type="monthly")
-    
-    if not allowed:
-        reset_time = datetime.fromisoformat(rate_limit_info["reset_time"])
-        retry_after = int((reset_time - datetime.now()).total_seconds())
-        
+    # Quota mensuel du plan
+    if denied == len(ip_windows) + 1:
+        retry_after = math.ceil(monthly_state["retry_after"])
         return JSONResponse(
             status_code=429,
             content={
                 "error": "Quota Exceeded",
-                "message": f"Monthly quota exceeded for plan {rate_limit_info['plan']}. Limit: {rate_limit_info['limit']} requests/month.",
-                "plan": rate_limit_info["plan"],
+                "message": f"Monthly quota exceeded for plan {plan}. Limit: {rate_limit_info['limit']} requests/month.",
+                "plan": plan,
                 "limit": rate_limit_info["limit"],
                 "reset_time": rate_limit_info["reset_time"],
                 "retry_after": retry_after
@@ -368,18 +777,15 @@ async def rate_limit_middleware(request: Request, call_next):
             }
         )
     
-    # Vérifier aussi les limites quotidiennes
-    daily_allowed, daily_info = check_rate_limit(request, limit_type="daily")
-    if not daily_allowed:
-        reset_time = datetime.fromisoformat(daily_info["reset_time"])
-        retry_after = int((reset_time - datetime.now()).total_seconds())
-        
+    # Quota quotidien du plan
+    if denied == len(ip_windows) + 2:
+        retry_after = math.ceil(daily_state["retry_after"])
         return JSONResponse(
             status_code=429,
             content={
                 "error": "Daily Quota Exceeded",
-                "message": f"Daily quota exceeded for plan {daily_info['plan']}.",
-                "plan": daily_info["plan"],
+                "message": f"Daily quota exceeded for plan {plan}.",
+                "plan": plan,
                 "limit": daily_info["limit"],
                 "reset_time": daily_info["reset_time"],
                 "retry_after": retry_after
@@ -390,22 +796,52 @@ async def rate_limit_middleware(request: Request, call_next):
             }
         )
     
-    # Appeler le handler suivant
-    response = await call_next(request)
+    # Débit par minute du plan
+    if denied:
+        minute_state = states[-1]
+        retry_after = math.ceil(minute_state["retry_after"])
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": "Too Many Requests",
+                "message": f"Rate limit exceeded for plan {plan}. Max {minute_state['limit']} requests per minute.",
+                "plan": plan,
+                "retry_after": retry_after
+            },
+            headers={
+                **get_rate_limit_headers(rate_limit_info),
+                "Retry-After": str(retry_after)
+            }
+        )
+    
+    # Appeler le handler suivant (qui enregistre l'OCR effectué dans usage)
+    usage = QuotaUsage()
+    token = _quota_usage.set(usage)
+    tenant_token = _request_tenant.set((get_client_identifier(request), plan))
+    try:
+        response = await call_next(request)
+    finally:
+        _request_tenant.reset(tenant_token)
+        _quota_usage.reset(token)
+    
+    # Ajuster les quotas au coût réel : un PDF de 40 pages OCRisé compte 40 unités
+    cost = usage.cost
+    if cost != QUOTA_COSTS["request"]:
+        _, (monthly_state, daily_state) = await consume_rate_limits(
+            [monthly_window, daily_window], cost - QUOTA_COSTS["request"], force=True
+        )
+        rate_limit_info = _plan_info(plan, monthly_state)
+        daily_info = _plan_info(plan, daily_state)
+    response.headers["X-RateLimit-Cost"] = str(cost)
     
     # Ajouter les headers de rate limiting à la réponse (mensuel)
-    if rate_limit_info:
-        rate_limit_headers = get_rate_limit_headers(rate_limit_info)
-        for key, value in rate_limit_headers.items():
-            response.headers[key] = value
-    
-    # Ajouter aussi les headers quotidiens
-    if daily_info:
-        daily_headers = get_rate_limit_headers(daily_info)
-        # Préfixer avec Daily- pour différencier
-        response.headers["X-RateLimit-Daily-Limit"] = daily_headers["X-RateLimit-Limit"]
-        response.headers["X-RateLimit-Daily-Remaining"] = daily_headers["X-RateLimit-Remaining"]
-        response.headers["X-RateLimit-Daily-Reset"] = daily_headers["X-RateLimit-Reset"]
+    for key, value in get_rate_limit_headers(rate_limit_info).items():
+        response.headers[key] = value
+    
+    # Ajouter aussi les headers quotidiens, préfixés Daily- pour différencier
+    daily_headers = get_rate_limit_headers(daily_info)
+    response.headers["X-RateLimit-Daily-Limit"] = daily_headers["X-RateLimit-Limit"]
+    response.headers["X-RateLimit-Daily-Remaining"] = daily_headers["X-RateLimit-Remaining"]
+    response.headers["X-RateLimit-Daily-Reset"] = daily_headers["X-RateLimit-Reset"]
     
     return response
-
@@ -0,0 +1,124 @@
+"""
+Pool de connexions Redis asynchrone partagé
+Utilisé par le cache, le rate limiting et l'idempotence (un seul pool par worker)
+"""
+
+from typing import Optional, Dict, Any
+
+# Tentative d'import Redis (client asyncio)
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Valeurs par défaut du pool
+REDIS_MAX_CONNECTIONS = 20  # Taille max du pool par worker
+REDIS_POOL_TIMEOUT = 5  # Attente max (s) d'une connexion libre quand le pool est plein
+REDIS_HEALTH_CHECK_INTERVAL = 30  # PING automatique (s) des connexions inactives
+REDIS_SOCKET_TIMEOUT = 2  # Timeout (s) des opérations réseau
+
+_pool: Optional["aioredis.BlockingConnectionPool"] = None
+_client: Optional["aioredis.Redis"] = None
+_pool_url: Optional[str] = None
+
+
+def init_redis_pool(
+    redis_url: Optional[str],
+    redis_db: int = 0,
+    max_connections: int = REDIS_MAX_CONNECTIONS,
+    pool_timeout: float = REDIS_POOL_TIMEOUT,
+    health_check_interval: int = REDIS_HEALTH_CHECK_INTERVAL
+) -> bool:
+    """
+    Initialise le pool Redis partagé (idempotent pour une même URL)
+
+    La création est paresseuse : aucune connexion n'est ouverte ici,
+    utiliser ping_redis_pool() au démarrage pour vérifier la disponibilité.
+
+    Args:
+        redis_url: URL Redis (ex: redis://localhost:6379)
+        redis_db: Numéro de base de données Redis
+        max_connections: Nombre max de connexions simultanées
+        pool_timeout: Attente max d'une connexion libre (secondes)
+        health_check_interval: Intervalle de health check des connexions (secondes)
+
+    Returns:
+        True si le pool est disponible
+    """
+    global _pool, _client, _pool_url
+
+    if not REDIS_AVAILABLE or not redis_url:
+        return False
+
+    pool_url = f"{redis_url}#{redis_db}"
+    if _client is not None and _pool_url == pool_url:
+        return True
+
+    try:
+        _pool = aioredis.BlockingConnectionPool.from_url(
+            redis_url,
+            db=redis_db,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            health_check_interval=health_check_interval,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            decode_responses=True
+        )
+        _client = aioredis.Redis(connection_pool=_pool)
+        _pool_url = pool_url
+        return True
+    except Exception:
+        _pool = None
+        _client = None
+        _pool_url = None
+        return False
+
+
+def get_redis_client() -> Optional["aioredis.Redis"]:
+    """Retourne le client Redis asynchrone partagé (None si non configuré)"""
+    return _client
+
+
+async def ping_redis_pool() -> bool:
+    """Vérifie que Redis répond via le pool partagé"""
+    if _client is None:
+        return False
+    try:
+        return bool(await _client.ping())
+    except Exception:
+        return False
+
+
+async def close_redis_pool():
+    """Ferme toutes les connexions du pool (arrêt de l'application)"""
+    global _pool, _client, _pool_url
+
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except Exception:
+            pass
+    if _pool is not None:
+        try:
+            await _pool.disconnect()
+        except Exception:
+            pass
+
+    _pool = None
+    _client = None
+    _pool_url = None
+
+
+def get_redis_pool_info() -> Dict[str, Any]:
+    """Retourne des informations sur l'état du pool"""
+    if _pool is None:
+        return {"configured": False}
+
+    return {
+        "configured": True,
+        "max_connections": _pool.max_connections,
+        "idle_connections": len(getattr(_pool, "_available_connections", [])),
+        "in_use_connections": len(getattr(_pool, "_in_use_connections", [])),
+    }
@@ -9,9 +9,11 @@ from .client import OCRFactureAPI
 from .exceptions import (
     OCRFactureAPIError,
     OCRFactureAuthError,
+    OCRFactureNotFoundError,
     OCRFactureRateLimitError,
     OCRFactureValidationError,
     OCRFactureServerError,
+    OCRFactureOverloadedError,
 )
 
 __version__ = "2.0.0"
@@ -19,8 +21,10 @@ __all__ = [
     "OCRFactureAPI",
     "OCRFactureAPIError",
     "OCRFactureAuthError",
+    "OCRFactureNotFoundError",
     "OCRFactureRateLimitError",
     "OCRFactureValidationError",
     "OCRFactureServerError",
+    "OCRFactureOverloadedError",
 ]
 
@@ -3,6 +3,7 @@ Client principal pour l'API OCR Facture France
 """
 
 import base64
+import hashlib
 import requests
 from typing import Optional, List, Dict, Any, Union, BinaryIO
 from pathlib import Path
@@ -11,9 +12,11 @@ import json
 from .exceptions import (
     OCRFactureAPIError,
     OCRFactureAuthError,
+    OCRFactureNotFoundError,
     OCRFactureRateLimitError,
     OCRFactureValidationError,
     OCRFactureServerError,
+    OCRFactureOverloadedError,
 )
 
 
@@ -95,6 +98,12 @@ class OCRFactureAPI:
                     status_code=401,
                     response=response.json() if response.content else None
                 )
+            elif response.status_code == 404:
+                raise OCRFactureNotFoundError(
+                    f"Ressource introuvable: {endpoint}",
+                    status_code=404,
+                    response=response.json() if response.content else None
+                )
             elif response.status_code == 429:
                 retry_after = int(response.headers.get("Retry-After", 60))
                 raise OCRFactureRateLimitError(
@@ -109,6 +118,14 @@ class OCRFactureAPI:
                     status_code=422,
                     response=response.json() if response.content else None
                 )
+            elif response.status_code == 503 and "Retry-After" in response.headers:
+                # Délestage : l'API indique quand l'OCR aura de nouveau de la capacité
+                raise OCRFactureOverloadedError(
+                    "Service OCR saturé. Réessayer après Retry-After secondes.",
+                    status_code=503,
+                    retry_after=int(response.headers["Retry-After"]),
+                    response=response.json() if response.content else None
+                )
             elif response.status_code >= 500:
                 raise OCRFactureServerError(
                     f"Erreur serveur: {response.status_code}",
@@ -142,16 +159,22 @@ class OCRFactureAPI:
         file_path: Union[str, Path, BinaryIO],
         language: str = "fra",
         check_compliance: bool = False,
-        idempotency_key: Optional[str] = None
+        idempotency_key: Optional[str] = None,
+        lookup_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Extrait les données d'une facture depuis un fichier
         
+        Le fichier est d'abord haché localement : si l'API a déjà un résultat
+        pour ce document, il est renvoyé sans upload.
+        
         Args:
             file_path: Chemin vers le fichier (str/Path) ou objet fichier ouvert
             language: Code langue pour OCR (fra, eng, deu, spa, ita, por). Défaut: fra
             check_compliance: Activer validation conformité FR (défaut: False)
-            idempotency_key: Clé d'idempotence (UUID recommandé, optionnel)
+            idempotency_key: Clé d'idempotence (UUID recommandé, optionnel).
+                L'upload est alors toujours envoyé pour que l'API enregistre la clé.
+            lookup_cache: Chercher le résultat par hash avant l'upload (défaut: True)
             
         Returns:
             Résultat OCR avec données extraites
@@ -170,6 +193,11 @@ class OCRFactureAPI:
             should_close = False
         
         try:
+            if lookup_cache and not idempotency_key:
+                cached_result = self._lookup_file_result(file_obj)
+                if cached_result and (not check_compliance or cached_result.get("compliance")):
+                    return cached_result
+            
             files = {"file": file_obj}
             data = {
                 "language": language,
@@ -191,6 +219,44 @@ class OCRFactureAPI:
             if should_close:
                 file_obj.close()
     
+    def get_result_by_hash(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """
+        Récupère le résultat OCR en cache d'un document à partir de son SHA256
+        
+        Args:
+            sha256: Hash SHA256 du fichier (hexadécimal)
+            
+        Returns:
+            Résultat OCR, ou None si le document n'a pas encore été traité
+        """
+        try:
+            return self._request("GET", f"/v1/ocr/result/{sha256.lower()}")
+        except OCRFactureNotFoundError:
+            return None
+    
+    def _lookup_file_result(self, file_obj: BinaryIO) -> Optional[Dict[str, Any]]:
+        """
+        Hache un fichier par blocs et cherche son résultat en cache
+        
+        Le fichier est replacé à sa position initiale. Une erreur de recherche
+        (hors authentification et quota) n'empêche pas l'upload.
+        """
+        try:
+            position = file_obj.tell()
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: file_obj.read(1024 * 1024), b""):
+                sha256.update(chunk)
+            file_obj.seek(position)
+        except (AttributeError, OSError, TypeError):
+            return None  # Flux non repositionnable ou ouvert en mode texte : upload direct
+        
+        try:
+            return self.get_result_by_hash(sha256.hexdigest())
+        except (OCRFactureAuthError, OCRFactureRateLimitError):
+            raise
+        except OCRFactureAPIError:
+            return None
+    
     def extract_from_base64(
         self,
         base64_string: str,
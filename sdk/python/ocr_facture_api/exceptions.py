@@ -15,6 +15,11 @@ class OCRFactureAuthError(OCRFactureAPIError):
     pass
 
 
+class OCRFactureNotFoundError(OCRFactureAPIError):
+    """Ressource introuvable (404)"""
+    pass
+
+
 class OCRFactureRateLimitError(OCRFactureAPIError):
     """Erreur de rate limiting (429)"""
     def __init__(self, message: str, retry_after: int = None, **kwargs):
@@ -32,6 +37,13 @@ class OCRFactureServerError(OCRFactureAPIError):
     pass
 
 
+class OCRFactureOverloadedError(OCRFactureServerError):
+    """OCR saturé côté serveur (503) : réessayer après retry_after secondes"""
+    def __init__(self, message: str, retry_after: int = None, **kwargs):
+        self.retry_after = retry_after
+        super().__init__(message, **kwargs)
+
+
 
 
 
@@ -2,6 +2,9 @@
 Tests unitaires pour le client SDK Python
 """
 
+import hashlib
+import io
+import re
 import pytest
 import responses
 from unittest.mock import Mock, patch, mock_open
@@ -9,7 +12,9 @@ from ocr_facture_api import OCRFactureAPI
 from ocr_facture_api.exceptions import (
     OCRFactureAPIError,
     OCRFactureAuthError,
+    OCRFactureOverloadedError,
     OCRFactureRateLimitError,
+    OCRFactureServerError,
     OCRFactureValidationError,
 )
 
@@ -154,6 +159,24 @@ class TestOCRFactureAPI:
             
             assert exc_info.value.retry_after == 60
     
+    @responses.activate
+    def test_overloaded_error(self, api):
+        """Test un 503 avec Retry-After (délestage OCR) expose le délai à respecter"""
+        responses.add(
+            responses.POST,
+            "https://ocr-facture-api-production.up.railway.app/v1/ocr/upload",
+            json={"detail": "Service OCR saturé, réessayer dans 12 s"},
+            status=503,
+            headers={"Retry-After": "12"}
+        )
+        
+        with patch("builtins.open", mock_open(read_data=b"fake image data")):
+            with pytest.raises(OCRFactureOverloadedError) as exc_info:
+                api.extract_from_file("test.pdf", lookup_cache=False)
+            
+            assert exc_info.value.retry_after == 12
+            assert isinstance(exc_info.value, OCRFactureServerError)
+    
     @responses.activate
     def test_validation_error(self, api):
         """Test gestion erreur de validation"""
@@ -302,4 +325,56 @@ class TestOCRFactureAPI:
         # Vérifier que le header Idempotency-Key a été envoyé
         request = responses.calls[0].request
         assert request.headers.get("Idempotency-Key") == "test-uuid-123"
-
+    
+    @responses.activate
+    def test_extract_from_file_uses_cached_result(self, api, mock_response_success):
+        """Test un document déjà traité est récupéré par hash, sans upload"""
+        file_data = b"fake pdf data"
+        sha256 = hashlib.sha256(file_data).hexdigest()
+        responses.add(
+            responses.GET,
+            f"https://ocr-facture-api-production.up.railway.app/v1/ocr/result/{sha256}",
+            json={**mock_response_success, "cached": True},
+            status=200
+        )
+        
+        file_obj = io.BytesIO(file_data)
+        result = api.extract_from_file(file_obj)
+        
+        assert result["cached"] is True
+        assert len(responses.calls) == 1
+        assert file_obj.tell() == 0
+    
+    @responses.activate
+    def test_extract_from_file_uploads_when_not_cached(self, api, mock_response_success):
+        """Test un document inconnu (404) est uploadé"""
+        responses.add(
+            responses.GET,
+            re.compile(r"https://ocr-facture-api-production\.up\.railway\.app/v1/ocr/result/[0-9a-f]{64}"),
+            json={"detail": "Aucun résultat en cache pour ce document"},
+            status=404
+        )
+        responses.add(
+            responses.POST,
+            "https://ocr-facture-api-production.up.railway.app/v1/ocr/upload",
+            json=mock_response_success,
+            status=200
+        )
+        
+        result = api.extract_from_file(io.BytesIO(b"fake pdf data"))
+        
+        assert result["cached"] is False
+        assert [call.request.method for call in responses.calls] == ["GET", "POST"]
+        assert responses.calls[1].request.body  # Fichier replacé au début avant l'upload
+    
+    @responses.activate
+    def test_get_result_by_hash_not_found(self, api):
+        """Test get_result_by_hash renvoie None pour un document inconnu"""
+        responses.add(
+            responses.GET,
+            "https://ocr-facture-api-production.up.railway.app/v1/ocr/result/" + "0" * 64,
+            json={"detail": "Aucun résultat en cache pour ce document"},
+            status=404
+        )
+        
+        assert api.get_result_by_hash("0" * 64) is None
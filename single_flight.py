@@ -0,0 +1,127 @@
+"""
+Single-flight : déduplication des calculs OCR concurrents sur un même fichier
+
+- Dans un worker : les requêtes concurrentes attendent le résultat du premier appel
+- Entre workers : verrou Redis court (SET NX EX), les autres workers attendent
+  que le résultat apparaisse dans le cache partagé
+"""
+
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis_pool import get_redis_client
+from monitoring import log_ocr_coalesced
+
+LOCK_TTL_SECONDS = 60  # Durée max d'un calcul OCR avant expiration du verrou
+POLL_INTERVAL_SECONDS = 0.05  # Premier intervalle d'attente du résultat (puis x2)
+POLL_MAX_INTERVAL_SECONDS = 0.5
+
+# Calculs en cours dans ce worker (clé -> Future partagé)
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def single_flight(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    lookup: Callable[[], Awaitable[Optional[Any]]],
+    on_wait: Optional[Callable[[], None]] = None
+) -> Any:
+    """
+    Exécute compute() une seule fois pour une clé donnée, même sous concurrence
+
+    Args:
+        key: Clé de déduplication (hash du fichier)
+        compute: Coroutine qui calcule et met en cache le résultat
+        lookup: Coroutine qui lit le résultat depuis le cache partagé (None si absent)
+        on_wait: Appelé quand la requête attend le calcul d'une autre (ce worker ou un autre)
+
+    Returns:
+        Résultat de compute() (ou celui calculé par une autre requête)
+    """
+    future = _inflight.get(key)
+    if future is not None:
+        log_ocr_coalesced("local")
+        if on_wait is not None:
+            on_wait()
+        # shield : l'annulation d'un client en attente n'annule pas le calcul partagé
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    # Évite l'avertissement "exception was never retrieved" si personne n'attend
+    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    _inflight[key] = future
+    try:
+        result = await _compute_with_redis_lock(key, compute, lookup, on_wait)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _compute_with_redis_lock(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    lookup: Callable[[], Awaitable[Optional[Any]]],
+    on_wait: Optional[Callable[[], None]] = None
+) -> Any:
+    """Prend le verrou Redis de la clé, ou attend le résultat du worker qui le détient"""
+    redis_client = get_redis_client()
+    if redis_client is None:
+        return await compute()
+
+    lock_key = f"ocr_lock:{key}"
+    token = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LOCK_TTL_SECONDS
+    delay = POLL_INTERVAL_SECONDS
+    waiting = False
+
+    while True:
+        try:
+            acquired = await redis_client.set(lock_key, token, nx=True, ex=LOCK_TTL_SECONDS)
+        except Exception:
+            # Redis indisponible : calcul local sans coordination
+            return await compute()
+
+        if acquired:
+            try:
+                return await compute()
+            finally:
+                await _release_lock(redis_client, lock_key, token)
+
+        # Un autre worker calcule : attendre son résultat dans le cache
+        if not waiting:
+            waiting = True
+            log_ocr_coalesced("distributed")
+            if on_wait is not None:
+                on_wait()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_INTERVAL_SECONDS)
+
+        result = await lookup()
+        if result is not None:
+            return result
+        if loop.time() >= deadline:
+            # Le détenteur du verrou ne répond plus : calculer nous-mêmes
+            return await compute()
+
+
+async def _release_lock(redis_client, lock_key: str, token: str):
+    """Libère le verrou s'il nous appartient toujours (best effort)"""
+    try:
+        if await redis_client.get(lock_key) == token:
+            await redis_client.delete(lock_key)
+    except Exception:
+        pass  # Le verrou expirera de lui-même
+
+
+def get_inflight_count() -> int:
+    """Nombre de calculs OCR en cours dans ce worker"""
+    return len(_inflight)
@@ -0,0 +1,193 @@
+"""
+Journal des requêtes lentes : les N plus lentes par route sur une fenêtre glissante
+
+Chaque fiche décrit la requête sans conserver le document : route, statut,
+durée, durée par étape (Server-Timing) et, pour chaque document traité, son
+SHA256, sa taille, son nombre de pages, les dimensions des images OCRisées, la
+langue, les décisions de prétraitement et l'issue du cache. Le SHA256 permet de
+retrouver la facture chez le client pour la rejouer hors ligne.
+
+La fenêtre glissante est approchée par deux générations de window/2 secondes :
+une requête n'est comparée qu'au seuil de la génération courante (un test par
+requête tant qu'elle n'entre pas dans le classement). Les fiches retenues
+peuvent aussi être ajoutées à un journal JSON lines sur disque, écrit par un
+thread dédié (file bornée) : la requête n'attend jamais le disque.
+"""
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueListener
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUESTS_PER_ENDPOINT = 10
+SLOW_REQUESTS_WINDOW_SECONDS = 3600
+SLOW_REQUESTS_JOURNAL_MAX_MB = 50  # Au-delà, le journal est renommé en .1 (une seule archive)
+SLOW_REQUESTS_JOURNAL_QUEUE_SIZE = 1000  # Fiches en attente d'écriture max avant perte
+MAX_TRACKED_ENDPOINTS = 200
+
+
+class _JournalFileHandler(logging.Handler):
+    """Sérialise et ajoute les fiches au journal (thread du QueueListener), renommé en .1 au-delà de max_bytes"""
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def emit(self, record: logging.LogRecord):
+        line = json.dumps(record.msg) + "\n"
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Journal des requêtes lentes non écrit ({self.path}): {e}")
+
+
+class SlowRequestJournal:
+    """Classement des requêtes les plus lentes par route (tas de taille bornée par génération)"""
+
+    def __init__(
+        self,
+        per_endpoint: int = SLOW_REQUESTS_PER_ENDPOINT,
+        window_seconds: float = SLOW_REQUESTS_WINDOW_SECONDS,
+        journal_path: Optional[str] = None,
+        journal_max_mb: float = SLOW_REQUESTS_JOURNAL_MAX_MB
+    ):
+        self.per_endpoint = per_endpoint
+        self.window_seconds = window_seconds
+        self.journal_path = journal_path or None
+        self.journal_max_bytes = int(journal_max_mb * 1024 * 1024)
+        self._generation_seconds = window_seconds / 2
+        self._current: Dict[str, list] = {}  # route -> tas de (durée, n°, fiche)
+        self._previous: Dict[str, list] = {}
+        self._generation_started = time.monotonic()
+        self._sequence = itertools.count()  # Départage les durées égales (les fiches ne se comparent pas)
+        self.journal_dropped = 0
+        self._journal_queue: Optional[queue.Queue] = None
+        self._journal_writer: Optional[QueueListener] = None
+        if self.journal_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+            self._journal_queue = queue.Queue(maxsize=SLOW_REQUESTS_JOURNAL_QUEUE_SIZE)
+            self._journal_writer = QueueListener(
+                self._journal_queue, _JournalFileHandler(self.journal_path, self.journal_max_bytes)
+            )
+            self._journal_writer.start()
+
+    def _rotate(self, now: float):
+        elapsed = now - self._generation_started
+        if elapsed < self._generation_seconds:
+            return
+        # Au-delà de deux générations sans rotation, la précédente est elle aussi périmée
+        self._previous = self._current if elapsed < self.window_seconds else {}
+        self._current = {}
+        self._generation_started = now
+
+    def offer(self, endpoint: str, duration: float, build_record: Callable[[], Dict[str, Any]]) -> bool:
+        """
+        Retient la requête si elle est parmi les plus lentes de sa route
+
+        Args:
+            endpoint: Route (cardinalité bornée, ex: /v1/ocr/upload)
+            duration: Durée de la requête en secondes
+            build_record: Construit la fiche, appelé seulement si la requête est retenue
+
+        Returns:
+            True si la requête est retenue
+        """
+        self._rotate(time.monotonic())
+        heap = self._current.get(endpoint)
+        if heap is None:
+            if len(self._current) >= MAX_TRACKED_ENDPOINTS:
+                return False
+            heap = self._current[endpoint] = []
+        if len(heap) >= self.per_endpoint and duration <= heap[0][0]:
+            return False
+
+        record = {
+            "timestamp": time.time(),
+            "endpoint": endpoint,
+            "duration_ms": round(duration * 1000, 2),
+            **build_record(),
+        }
+        entry = (duration, next(self._sequence), record)
+        if len(heap) >= self.per_endpoint:
+            heapq.heapreplace(heap, entry)
+        else:
+            heapq.heappush(heap, entry)
+        if self._journal_writer is not None:
+            self._append_to_journal(record)
+        return True
+
+    def _append_to_journal(self, record: Dict[str, Any]):
+        # Sérialisation et écriture dans le thread du writer ; file pleine : fiche perdue et comptée
+        try:
+            self._journal_queue.put_nowait(logging.makeLogRecord({"msg": record}))
+        except queue.Full:
+            self.journal_dropped += 1
+
+    def close(self):
+        """Écrit les fiches en attente et arrête le writer du journal"""
+        if self._journal_writer is not None:
+            self._journal_writer.stop()
+            self._journal_writer = None
+
+    def slowest(self, endpoint: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Fiches de la fenêtre, les plus lentes d'abord, par route"""
+        self._rotate(time.monotonic())
+        oldest = time.time() - self.window_seconds
+        limit = limit or self.per_endpoint
+        routes = [endpoint] if endpoint else sorted(set(self._current) | set(self._previous))
+        result = {}
+        for route in routes:
+            entries = self._current.get(route, []) + self._previous.get(route, [])
+            records = [record for _, _, record in sorted(entries, key=lambda entry: -entry[0])
+                       if record["timestamp"] >= oldest]
+            if records:
+                result[route] = records[:limit]
+        return result
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "per_endpoint": self.per_endpoint,
+            "window_seconds": self.window_seconds,
+            "journal_path": self.journal_path,
+            "journal_dropped": self.journal_dropped,
+        }
+
+
+_journal: Optional[SlowRequestJournal] = None
+
+
+def init_slow_request_journal(
+    per_endpoint: int = SLOW_REQUESTS_PER_ENDPOINT,
+    window_seconds: float = SLOW_REQUESTS_WINDOW_SECONDS,
+    journal_path: Optional[str] = None,
+    journal_max_mb: float = SLOW_REQUESTS_JOURNAL_MAX_MB
+):
+    """Active le journal des requêtes lentes (désactivé si per_endpoint <= 0)"""
+    global _journal
+    close_slow_request_journal()
+    _journal = SlowRequestJournal(per_endpoint, window_seconds, journal_path, journal_max_mb) if per_endpoint > 0 else None
+
+
+def get_slow_request_journal() -> Optional[SlowRequestJournal]:
+    return _journal
+
+
+def close_slow_request_journal():
+    """Écrit les fiches en attente du journal sur disque"""
+    if _journal is not None:
+        _journal.close()
+
+
+atexit.register(close_slow_request_journal)
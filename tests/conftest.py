@@ -21,6 +21,10 @@ def setup_test_env(monkeypatch):
     # Initialiser le cache mémoire pour les tests
     from cache_redis import init_cache_backend
     init_cache_backend(force_memory=True)
+    
+    # Compteurs de rate limiting remis à zéro entre les tests (même client "testclient" partout)
+    from rate_limiting import _memory_store
+    _memory_store.clear()
 
 
 
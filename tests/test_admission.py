@@ -0,0 +1,264 @@
+"""
+Tests pour le contrôle d'admission de l'OCR (délestage 503 + Retry-After, files équitables par tenant)
+"""
+
+import asyncio
+import base64
+import io
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, OCROverloadedError, init_admission_control
+
+
+class TestAdmissionController:
+    """Tests pour AdmissionController"""
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_wait_exceeds_slo(self):
+        """Test l'OCR est refusé dès que l'attente estimée dépasserait le SLO, avec un Retry-After exact"""
+        now = [0.0]
+        controller = AdmissionController(capacity=2, latency_slo=20.0, seconds_per_page=2.0, clock=lambda: now[0])
+        release = asyncio.Event()
+
+        async def job(pages):
+            async with controller.slot(pages):
+                await release.wait()
+
+        tasks = [asyncio.create_task(job(1)) for _ in range(2)]  # Créneaux occupés
+        tasks += [asyncio.create_task(job(3)) for _ in range(2)]  # 6 pages en file
+        await asyncio.sleep(0)
+        now[0] = 1.0
+
+        # Attente : (1 + 1 s restantes + 6 pages x 2 s) / 2 créneaux = 7 s ; 7 + 8 x 2 s = 23 s > 20 s
+        assert controller.estimate_wait() == 7.0
+        with pytest.raises(OCROverloadedError) as exc_info:
+            async with controller.slot(pages=8):
+                pass
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers["Retry-After"] == "3"
+        assert controller.rejected == 1
+
+        # Une page passe encore : 7 + 2 <= 20
+        tasks.append(asyncio.create_task(job(1)))
+        await asyncio.sleep(0)
+        assert controller.admitted == 5
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert controller.estimate_wait() == 0.0
+
+    def test_built_outside_event_loop(self):
+        """Test un contrôleur construit hors boucle (import de main) sert plusieurs boucles successives"""
+        controller = AdmissionController(capacity=1)
+
+        async def contended():
+            async def job():
+                async with controller.slot():
+                    await asyncio.sleep(0)
+            await asyncio.gather(job(), job())
+
+        for _ in range(2):
+            asyncio.run(contended())
+        assert controller.admitted == 4 and not controller.running and not controller.queued
+
+    @pytest.mark.asyncio
+    async def test_free_slot_admits_large_document(self):
+        """Test un document plus long que le SLO est accepté si un créneau est libre"""
+        controller = AdmissionController(capacity=1, latency_slo=5.0, seconds_per_page=2.0)
+        async with controller.slot(pages=40):
+            assert len(controller.running) == 1
+        assert controller.rejected == 0
+
+    @pytest.mark.asyncio
+    async def test_seconds_per_page_is_measured(self):
+        """Test l'estimation du temps par page suit les durées mesurées"""
+        now = [0.0]
+        controller = AdmissionController(capacity=1, seconds_per_page=2.0, clock=lambda: now[0])
+        for _ in range(30):
+            async with controller.slot(pages=2):
+                now[0] += 1.0  # 0,5 s par page
+        assert controller.seconds_per_page == pytest.approx(0.5, abs=0.01)
+
+
+class TestFairQueueing:
+    """Tests de l'ordonnancement équitable des OCR entre tenants"""
+
+    @staticmethod
+    async def _run(controller, submissions):
+        """Soumet les OCR (tenant, plan, pages) dans l'ordre, créneau occupé, et renvoie l'ordre de service"""
+        order = []
+        blocker = asyncio.Event()
+
+        async def job(tenant, plan, pages):
+            async with controller.slot(pages, tenant=tenant, plan=plan):
+                order.append(tenant)
+                await asyncio.sleep(0)
+
+        async def hold():
+            async with controller.slot(1):
+                await blocker.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        tasks = []
+        for submission in submissions:
+            tasks.append(asyncio.create_task(job(*submission)))
+            await asyncio.sleep(0)
+        blocker.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    @pytest.mark.asyncio
+    async def test_small_tenant_overtakes_backlog(self):
+        """Test une facture BASIC isolée passe avant le lot d'un client ULTRA arrivé avant elle"""
+        controller = AdmissionController(capacity=1, latency_slo=1e6)
+        order = await self._run(controller, [("ultra", "ULTRA", 4)] * 10 + [("basic", "BASIC", 1)])
+        assert order.index("basic") <= 1
+
+        stats = {entry["tenant"]: entry for entry in controller.tenant_stats()}
+        assert stats["ultra"]["served"] == 10 and stats["basic"]["served"] == 1
+        assert stats["ultra"]["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_backlogged_tenants_share_by_weight(self):
+        """Test deux tenants chargés sont servis au prorata des poids de leurs plans (MEGA 8, BASIC 1)"""
+        controller = AdmissionController(capacity=1, latency_slo=1e6)
+        submissions = []
+        for _ in range(20):
+            submissions += [("basic", "BASIC", 1), ("mega", "MEGA", 1)]
+        order = await self._run(controller, submissions)
+        assert order[:18].count("mega") == 16
+
+    @pytest.mark.asyncio
+    async def test_cancelled_job_leaves_queue(self):
+        """Test un OCR annulé en file (client déconnecté) ne bloque ni ne compte plus"""
+        controller = AdmissionController(capacity=1, latency_slo=1e6)
+        release = asyncio.Event()
+
+        async def job(tenant):
+            async with controller.slot(2, tenant=tenant, plan="PRO"):
+                await release.wait()
+
+        running = asyncio.create_task(job("a"))
+        queued = asyncio.create_task(job("b"))
+        await asyncio.sleep(0)
+        assert controller.queued == 1 and controller.queued_pages == 2
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert controller.queued == 0 and controller.queued_pages == 0
+
+        release.set()
+        await running
+        assert controller.running == {}
+        assert controller.info()["plans"]["PRO"]["served"] == 1
+
+    @pytest.mark.asyncio
+    async def test_estimate_counts_only_work_ahead(self):
+        """Test l'attente estimée d'un tenant léger ignore le lot en file d'un autre tenant"""
+        controller = AdmissionController(capacity=1, latency_slo=30.0, seconds_per_page=2.0)
+        release = asyncio.Event()
+
+        async def job(tenant, plan, pages):
+            async with controller.slot(pages, tenant=tenant, plan=plan):
+                await release.wait()
+
+        tasks = [asyncio.create_task(job("bulk", "BASIC", 5)) for _ in range(3)]
+        await asyncio.sleep(0)
+        # 10 pages en file pour "bulk" : un nouveau lot de bulk serait refusé, une page d'un autre tenant passe
+        assert controller.check(5, tenant="bulk", weight=1) is not None
+        assert controller.check(1, tenant="other", weight=1) is None
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+
+def _png_base64(color: str) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (60, 60), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestAdmissionEndpoints:
+    """Tests du délestage sur les endpoints OCR"""
+
+    def test_cache_hits_admitted_while_saturated(self):
+        """Test un OCR est refusé en 503 + Retry-After, un résultat en cache est toujours servi"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}}
+        controller = init_admission_control(capacity=1, latency_slo=5.0)
+        try:
+            with patch.object(main.settings, "debug_mode", True), \
+                 patch("main.perform_ocr", return_value=ocr_result) as mock_ocr:
+                assert client.post("/v1/ocr/base64", data={"image_base64": _png_base64("navy")}).status_code == 200
+
+                # Un OCR de 60 s occupe l'unique créneau
+                controller.running[-1] = (controller.clock(), 60.0)
+                hit = client.post("/v1/ocr/base64", data={"image_base64": _png_base64("navy")})
+                shed = client.post("/v1/ocr/base64", data={"image_base64": _png_base64("olive")})
+                legacy = client.post("/ocr/base64", data={"image_base64": _png_base64("olive")})
+                health = client.get("/health").json()
+
+            assert hit.status_code == 200 and hit.json()["cached"] is True
+            assert shed.status_code == 503
+            assert 55 <= int(shed.headers["Retry-After"]) <= 60
+            assert legacy.status_code == 503
+            assert mock_ocr.call_count == 1
+            assert health["ocr_admission"]["rejected"] == 2
+        finally:
+            init_admission_control()
+
+    def test_batch_stops_with_503_when_saturated(self):
+        """Test un lot refusé par le délestage répond 503 + Retry-After sans OCRiser ses fichiers"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        controller = init_admission_control(capacity=1, latency_slo=5.0)
+        try:
+            controller.running[-1] = (controller.clock(), 60.0)  # Un OCR de 60 s occupe l'unique créneau
+            batch = {"files": [_png_base64("maroon"), _png_base64("coral")], "language": "fra"}
+            with patch.object(main.settings, "debug_mode", True), \
+                 patch("main.perform_ocr") as mock_ocr:
+                v1 = client.post("/v1/ocr/batch", json=batch)
+                legacy = client.post("/ocr/batch", json=batch)
+
+            for response in (v1, legacy):
+                assert response.status_code == 503
+                assert 55 <= int(response.headers["Retry-After"]) <= 60
+            assert mock_ocr.call_count == 0
+        finally:
+            init_admission_control()
+
+    def test_admin_queues_endpoint(self):
+        """Test les files par tenant sont exposées sur /admin/ocr/queues, protégé par la clé admin"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "PRO"})
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}}
+        init_admission_control(capacity=1)
+        try:
+            with patch.object(main.settings, "debug_mode", True), \
+                 patch.object(main.settings, "admin_api_key", "secret"), \
+                 patch("main.perform_ocr", return_value=ocr_result):
+                assert client.post("/v1/ocr/base64", data={"image_base64": _png_base64("teal")}).status_code == 200
+                assert client.get("/admin/ocr/queues").status_code == 403
+                queues = client.get("/admin/ocr/queues", headers={"X-Admin-Key": "secret"}).json()
+                health = client.get("/health").json()
+
+            assert queues["tenants"][0]["tenant"] == "ip:testclient"
+            assert queues["tenants"][0]["plan"] == "PRO" and queues["tenants"][0]["served"] == 1
+            assert queues["plans"]["PRO"]["weight"] == 2
+            assert "tenants" not in health["ocr_admission"]
+        finally:
+            init_admission_control()
@@ -0,0 +1,112 @@
+"""
+Tests pour la résolution du cache par lot dans les endpoints batch
+"""
+
+import pytest
+import base64
+import io
+import sys
+import os
+from unittest.mock import patch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _png_base64(color: str) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 40), color).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestBatchEndpoints:
+    """Tests pour /ocr/batch et /v1/ocr/batch"""
+
+    @pytest.mark.parametrize("path", ["/ocr/batch", "/v1/ocr/batch"])
+    def test_only_misses_are_ocred(self, path):
+        """Test les hits sont résolus d'un coup, les absents et doublons OCRisés une fois"""
+        from fastapi.testclient import TestClient
+        from cache_redis import init_cache_backend
+        import main
+
+        init_cache_backend(force_memory=True)
+        client = TestClient(main.app)
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}}
+        colors = ["white", "black"] if path == "/ocr/batch" else ["red", "green"]
+
+        with patch.object(main.settings, "debug_mode", True), \
+             patch("main.perform_ocr", return_value=ocr_result) as mock_ocr, \
+             patch("main.get_many_cached", wraps=main.get_many_cached) as mock_get_many:
+            client.post(path, json={"files": [_png_base64(colors[0])]})
+            mock_get_many.reset_mock()
+
+            files = [_png_base64(colors[0]), _png_base64(colors[1]), _png_base64(colors[1]), "data:image/png;base64,abc"]
+            response = client.post(path, json={"files": files})
+
+        body = response.json()
+        assert response.status_code == 200
+        assert [r["success"] for r in body["results"]] == [True, True, True, False]
+        assert [r["cached"] for r in body["results"][:3]] == [True, False, True]
+        assert body["total_cached"] == 2
+        assert mock_ocr.call_count == 2  # 1er appel + une seule fois pour le doublon absent
+        assert mock_get_many.call_count == 1
+
+    def test_misses_written_in_one_pipeline(self):
+        """Test les résultats des absents sont écrits en un seul pipeline, avant la fin du single-flight"""
+        from fastapi.testclient import TestClient
+        from cache_redis import init_cache_backend
+        from single_flight import get_inflight_count
+        import main
+
+        init_cache_backend(force_memory=True)
+        client = TestClient(main.app)
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}}
+        writes = []
+
+        async def record_set_many(items, ttl_hours=None):
+            writes.append((sorted(items), get_inflight_count()))
+
+        files = [_png_base64("navy"), _png_base64("teal"), _png_base64("olive")]
+        with patch.object(main.settings, "debug_mode", True), \
+             patch("main.perform_ocr", return_value=ocr_result), \
+             patch("main.set_cached") as mock_set, \
+             patch("main.set_many_cached", side_effect=record_set_many):
+            response = client.post("/v1/ocr/batch", json={"files": files})
+
+        assert response.status_code == 200
+        assert mock_set.call_count == 0
+        assert len(writes) == 1
+        keys, inflight = writes[0]
+        assert len(keys) == 3 and all(key.startswith("ocr_result:") for key in keys)
+        assert inflight == 3  # Verrous single-flight toujours tenus pendant l'écriture
+
+    @pytest.mark.asyncio
+    async def test_crossed_batches_share_computations(self):
+        """Test deux lots qui attendent chacun un calcul de l'autre ne se bloquent pas mutuellement"""
+        import asyncio
+        import time
+        from cache_redis import init_cache_backend
+        import main
+
+        init_cache_backend(force_memory=True)
+
+        def slow_ocr(*args, **kwargs):
+            time.sleep(0.05)
+            return {"text": "FACTURE", "language": "fra", "data": {}}
+
+        documents = {name: base64.b64decode(_png_base64(color).split(",")[1]) for name, color in [("x", "purple"), ("y", "orange")]}
+        hashes = {name: main.get_file_hash(data) for name, data in documents.items()}
+        writers = [main.BatchResultWriter(list(hashes.values())) for _ in range(2)]
+
+        def compute(writer, name):
+            return asyncio.ensure_future(main.get_or_compute_ocr_result(hashes[name], documents[name], "fra", False, writer))
+
+        with patch("main.perform_ocr", side_effect=slow_ocr) as mock_ocr:
+            # Le lot 1 calcule x, le lot 2 calcule y, puis chacun attend le calcul de l'autre
+            tasks = [compute(writers[0], "x"), compute(writers[1], "y"), compute(writers[0], "y"), compute(writers[1], "x")]
+            results = await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+        assert all(result["data"]["text"] == "FACTURE" for result in results)
+        assert mock_ocr.call_count == 2
+        assert list(writers[0].results) == [hashes["x"]]
+        assert list(writers[1].results) == [hashes["y"]]
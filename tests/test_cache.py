@@ -3,6 +3,7 @@ Tests pour le système de cache
 """
 
 import pytest
+import asyncio
 from unittest.mock import Mock, patch
 import sys
 import os
@@ -12,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from cache_redis import (
     MemoryCacheBackend,
+    DiskCacheBackend,
     get_cached,
     set_cached,
     delete_cached,
@@ -24,58 +26,63 @@ from cache_redis import (
 class TestMemoryCacheBackend:
     """Tests pour le cache mémoire"""
     
-    def test_set_and_get(self):
+    @pytest.mark.asyncio
+    async def test_set_and_get(self):
         """Test stockage et récupération"""
         cache = MemoryCacheBackend()
         
-        cache.set("test_key", {"data": "test_value"})
-        result = cache.get("test_key")
+        await cache.set("test_key", {"data": "test_value"})
+        result = await cache.get("test_key")
         
         assert result is not None
         assert result["data"] == "test_value"
     
-    def test_cache_expiration(self):
+    @pytest.mark.asyncio
+    async def test_cache_expiration(self):
         """Test expiration du cache"""
         cache = MemoryCacheBackend()
         
         # Utiliser un TTL très court pour le test
-        cache.set("test_key", {"data": "test_value"}, ttl_hours=0.0001)  # ~0.36 secondes
+        await cache.set("test_key", {"data": "test_value"}, ttl_hours=0.0001)  # ~0.36 secondes
         
         # Attendre que le cache expire
         import time
         time.sleep(0.5)
         
-        result = cache.get("test_key")
+        result = await cache.get("test_key")
         assert result is None
     
-    def test_delete(self):
+    @pytest.mark.asyncio
+    async def test_delete(self):
         """Test suppression d'une clé"""
         cache = MemoryCacheBackend()
         
-        cache.set("test_key", {"data": "test_value"})
-        cache.delete("test_key")
+        await cache.set("test_key", {"data": "test_value"})
+        await cache.delete("test_key")
         
-        result = cache.get("test_key")
+        result = await cache.get("test_key")
         assert result is None
     
-    def test_clear(self):
+    @pytest.mark.asyncio
+    async def test_clear(self):
         """Test vidage du cache"""
         cache = MemoryCacheBackend()
         
-        cache.set("key1", {"data": "value1"})
-        cache.set("key2", {"data": "value2"})
-        cache.clear()
+        await cache.set("key1", {"data": "value1"})
+        await cache.set("key2", {"data": "value2"})
+        await cache.clear()
         
-        assert cache.get("key1") is None
-        assert cache.get("key2") is None
+        assert await cache.get("key1") is None
+        assert await cache.get("key2") is None
     
-    def test_cache_size_limit(self):
+    @pytest.mark.asyncio
+    async def test_cache_size_limit(self):
         """Test limite de taille du cache"""
         cache = MemoryCacheBackend()
         
         # Ajouter plus de 1000 entrées
         for i in range(1100):
-            cache.set(f"key_{i}", {"data": f"value_{i}"})
+            await cache.set(f"key_{i}", {"data": f"value_{i}"})
         
         # Le cache devrait avoir été nettoyé (max 1000)
         assert len(cache.cache) <= 1000
@@ -84,32 +91,35 @@ class TestMemoryCacheBackend:
 class TestCacheFunctions:
     """Tests pour les fonctions de cache"""
     
-    def test_get_set_cached(self):
+    @pytest.mark.asyncio
+    async def test_get_set_cached(self):
         """Test fonctions get_cached et set_cached"""
         # Initialiser avec mémoire
         init_cache_backend(force_memory=True)
         
-        set_cached("test_key", {"data": "test_value"})
-        result = get_cached("test_key")
+        await set_cached("test_key", {"data": "test_value"})
+        result = await get_cached("test_key")
         
         assert result is not None
         assert result["data"] == "test_value"
     
-    def test_delete_cached(self):
+    @pytest.mark.asyncio
+    async def test_delete_cached(self):
         """Test fonction delete_cached"""
         init_cache_backend(force_memory=True)
         
-        set_cached("test_key", {"data": "test_value"})
-        delete_cached("test_key")
+        await set_cached("test_key", {"data": "test_value"})
+        await delete_cached("test_key")
         
-        result = get_cached("test_key")
+        result = await get_cached("test_key")
         assert result is None
     
-    def test_get_cache_info(self):
+    @pytest.mark.asyncio
+    async def test_get_cache_info(self):
         """Test récupération d'infos sur le cache"""
         init_cache_backend(force_memory=True)
         
-        info = get_cache_info()
+        info = await get_cache_info()
         
         assert "backend_type" in info
         assert "redis_available" in info
@@ -117,3 +127,242 @@ class TestCacheFunctions:
 
 
 
+
+class TestRedisPool:
+    """Tests pour le pool Redis asynchrone partagé"""
+    
+    @pytest.mark.asyncio
+    async def test_pool_is_shared_and_bounded(self):
+        """Test pool unique, taille bornée"""
+        import redis_pool
+        
+        try:
+            assert redis_pool.init_redis_pool("redis://127.0.0.1:1", max_connections=3)
+            client = redis_pool.get_redis_client()
+            # Même URL : le pool existant est réutilisé
+            assert redis_pool.init_redis_pool("redis://127.0.0.1:1")
+            assert redis_pool.get_redis_client() is client
+            
+            info = redis_pool.get_redis_pool_info()
+            assert info["configured"] is True
+            assert info["max_connections"] == 3
+        finally:
+            await redis_pool.close_redis_pool()
+        
+        assert redis_pool.get_redis_client() is None
+    
+    @pytest.mark.asyncio
+    async def test_fallback_memory_if_redis_unreachable(self):
+        """Test bascule sur le cache mémoire si Redis ne répond pas"""
+        from cache_redis import RedisCacheBackend, verify_cache_backend
+        import redis_pool
+        
+        try:
+            init_cache_backend(redis_url="redis://127.0.0.1:1")
+            assert isinstance(get_cache_backend(), RedisCacheBackend)
+            
+            assert await verify_cache_backend() is False
+            assert isinstance(get_cache_backend(), MemoryCacheBackend)
+        finally:
+            await redis_pool.close_redis_pool()
+
+
+class TestDiskCacheBackend:
+    """Tests pour le cache disque persistant (SQLite WAL)"""
+    
+    @pytest.mark.asyncio
+    async def test_set_get_and_persistence(self, tmp_path):
+        """Test les valeurs survivent à un redémarrage (nouvelle instance)"""
+        path = str(tmp_path / "cache.sqlite3")
+        cache = DiskCacheBackend(path)
+        await cache.set("ocr_result:abc", {"result": {"text": "FACTURE"}})
+        
+        restarted = DiskCacheBackend(path)
+        assert await restarted.get("ocr_result:abc") == {"result": {"text": "FACTURE"}}
+        
+        await restarted.delete("ocr_result:abc")
+        assert await cache.get("ocr_result:abc") is None
+    
+    @pytest.mark.asyncio
+    async def test_ttl_expiration_and_sweep(self, tmp_path):
+        """Test une entrée expirée n'est plus lue puis est supprimée par le nettoyage"""
+        cache = DiskCacheBackend(str(tmp_path / "cache.sqlite3"))
+        await cache.set("expired", {"v": 1}, ttl_hours=-1)
+        await cache.set("valid", {"v": 2})
+        
+        assert await cache.get("expired") is None
+        assert cache.sweep() == 1
+        assert cache.stats()["entries"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_size_bounded_eviction(self, tmp_path):
+        """Test l'éviction supprime les entrées les plus proches de l'expiration"""
+        cache = DiskCacheBackend(str(tmp_path / "cache.sqlite3"), max_size_mb=1)
+        payload = "x" * 100_000
+        for i in range(15):
+            await cache.set(f"key_{i}", {"data": payload}, ttl_hours=1 + i)
+        
+        cache.sweep()
+        
+        stats = cache.stats()
+        assert stats["size_bytes"] <= stats["max_size_bytes"]
+        assert await cache.get("key_0") is None
+        assert await cache.get("key_14") is not None
+    
+    @pytest.mark.asyncio
+    async def test_eviction_in_batches(self, tmp_path, monkeypatch):
+        """Test la réduction de taille supprime par lots (LIMIT) jusqu'à 90% de la limite"""
+        import cache_redis
+        
+        monkeypatch.setattr(cache_redis, "DISK_CACHE_SWEEP_BATCH", 2)
+        cache = DiskCacheBackend(str(tmp_path / "cache.sqlite3"), max_size_mb=1)
+        for i in range(15):
+            await cache.set(f"key_{i}", {"data": "x" * 100_000}, ttl_hours=1 + i)
+        
+        assert cache.sweep() == 6
+        assert cache.stats()["size_bytes"] <= 0.9 * cache.stats()["max_size_bytes"]
+        assert await cache.get("key_5") is None
+        assert await cache.get("key_6") is not None
+    
+    def test_sweep_queries_use_expiry_index(self, tmp_path):
+        """Test le nettoyage ne parcourt pas la table (valeurs stockées) mais l'index d'expiration"""
+        cache = DiskCacheBackend(str(tmp_path / "cache.sqlite3"))
+        conn = cache._connection()
+        for query in (
+            "DELETE FROM cache WHERE expires_at <= 0",
+            "SELECT COALESCE(SUM(size), 0) FROM cache",
+            "SELECT key, size FROM cache WHERE pinned = 0 ORDER BY expires_at LIMIT 500",
+        ):
+            plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query))
+            assert "cache_expiry" in plan and "TEMP B-TREE" not in plan
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_workers(self, tmp_path):
+        """Test plusieurs workers (connexions distinctes) écrivent dans le même fichier"""
+        path = str(tmp_path / "cache.sqlite3")
+        workers = [DiskCacheBackend(path) for _ in range(3)]
+        
+        await asyncio.gather(*(
+            worker.set(f"key_{w}_{i}", {"worker": w, "i": i})
+            for w, worker in enumerate(workers) for i in range(20)
+        ))
+        
+        assert workers[0].stats()["entries"] == 60
+        assert await workers[2].get("key_0_19") == {"worker": 0, "i": 19}
+    
+    @pytest.mark.asyncio
+    async def test_init_uses_disk_without_redis(self, tmp_path):
+        """Test sans Redis, le cache disque configuré remplace le cache mémoire"""
+        init_cache_backend(redis_url=None, disk_path=str(tmp_path / "cache.sqlite3"))
+        try:
+            assert isinstance(get_cache_backend(), DiskCacheBackend)
+            info = await get_cache_info()
+            assert info["backend_type"] == "DiskCacheBackend"
+            assert info["disk"]["entries"] == 0
+        finally:
+            init_cache_backend(force_memory=True)
+
+
+class TestBatchOperations:
+    """Tests pour get_many / set_many (un aller-retour par lot)"""
+    
+    @pytest.mark.asyncio
+    async def test_memory_get_many_set_many(self):
+        """Test lot en mémoire, ordre des clés conservé"""
+        cache = MemoryCacheBackend()
+        await cache.set_many({"a": {"v": 1}, "c": {"v": 3}})
+        
+        assert await cache.get_many(["a", "b", "c"]) == [{"v": 1}, None, {"v": 3}]
+    
+    @pytest.mark.asyncio
+    async def test_disk_get_many_set_many(self, tmp_path):
+        """Test lot sur disque (une requête SQL, une transaction)"""
+        cache = DiskCacheBackend(str(tmp_path / "cache.sqlite3"))
+        await cache.set_many({"a": {"v": 1}, "c": {"v": 3}})
+        await cache.set("expired", {"v": 0}, ttl_hours=-1)
+        
+        assert await cache.get_many(["c", "b", "a", "expired"]) == [{"v": 3}, None, {"v": 1}, None]
+        assert await cache.get_many([]) == []
+    
+    @pytest.mark.asyncio
+    async def test_redis_mget_and_pipeline(self):
+        """Test Redis : un seul MGET pour la lecture et un pipeline pour l'écriture"""
+        from benchmarks.redis_standin import RedisStandIn
+        from cache_redis import RedisCacheBackend
+        import redis_pool
+        
+        standin = RedisStandIn().start()
+        try:
+            cache = RedisCacheBackend(standin.url)
+            await cache.set_many({f"k{i}": {"v": i} for i in range(10)}, ttl_hours=1)
+            before = standin.commands_processed
+            values = await cache.get_many([f"k{i}" for i in range(12)])
+            
+            assert values[:10] == [{"v": i} for i in range(10)]
+            assert values[10:] == [None, None]
+            assert standin.commands_processed - before == 1
+            assert 3500 < standin.data["k0"][1] - __import__("time").monotonic() <= 3600
+        finally:
+            await redis_pool.close_redis_pool()
+            standin.stop()
+
+
+class TestAddIfAbsent:
+    """Tests pour add (SET NX) : une seule réservation par clé"""
+    
+    @pytest.mark.asyncio
+    async def test_memory_add(self):
+        """Test add ne remplace pas une clé présente, mais remplace une clé expirée"""
+        cache = MemoryCacheBackend()
+        assert await cache.add("lock", {"owner": "a"}) is True
+        assert await cache.add("lock", {"owner": "b"}) is False
+        assert await cache.get("lock") == {"owner": "a"}
+        
+        await cache.set("expired", {"owner": "a"}, ttl_hours=-1)
+        assert await cache.add("expired", {"owner": "b"}) is True
+    
+    @pytest.mark.asyncio
+    async def test_disk_add_shared_between_instances(self, tmp_path):
+        """Test deux workers sur le même fichier : un seul add réussit"""
+        path = str(tmp_path / "cache.sqlite3")
+        first, second = DiskCacheBackend(path), DiskCacheBackend(path)
+        
+        assert await first.add("lock", {"owner": "a"}, ttl_hours=1) is True
+        assert await second.add("lock", {"owner": "b"}, ttl_hours=1) is False
+        
+        await first.set("expired", {"owner": "a"}, ttl_hours=-1)
+        assert await second.add("expired", {"owner": "b"}) is True
+        assert await first.get("expired") == {"owner": "b"}
+    
+    @pytest.mark.asyncio
+    async def test_redis_add(self):
+        """Test Redis : SET NX EX"""
+        from benchmarks.redis_standin import RedisStandIn
+        from cache_redis import RedisCacheBackend
+        import redis_pool
+        
+        standin = RedisStandIn().start()
+        try:
+            cache = RedisCacheBackend(standin.url)
+            assert await cache.add("lock", {"owner": "a"}, ttl_hours=60 / 3600) is True
+            assert await cache.add("lock", {"owner": "b"}, ttl_hours=60 / 3600) is False
+            assert await cache.get("lock") == {"owner": "a"}
+            assert 55 < standin.data["lock"][1] - __import__("time").monotonic() <= 60
+        finally:
+            await redis_pool.close_redis_pool()
+            standin.stop()
+    
+    @pytest.mark.asyncio
+    async def test_memory_eviction_keeps_recent_writes(self):
+        """Test l'éviction supprime les entrées écrites le plus tôt"""
+        cache = MemoryCacheBackend()
+        await cache.set("old", {"v": 0})
+        for i in range(1000):
+            await cache.set(f"k{i}", {"v": i})
+        await cache.set("old", {"v": 1})  # Réécrite : redevient récente
+        await cache.set("new", {"v": 2})
+        
+        assert len(cache.cache) <= 1000
+        assert await cache.get("old") == {"v": 1}
+        assert await cache.get("k0") is None
+        assert await cache.get("k999") == {"v": 999}
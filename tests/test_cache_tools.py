@@ -0,0 +1,129 @@
+"""
+Tests pour l'export, l'import et le pré-chauffage du cache
+"""
+
+import pytest
+import io
+import gzip
+import json
+import time
+import sys
+import os
+from unittest.mock import patch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_redis import MemoryCacheBackend, DiskCacheBackend
+from cache_tools import export_cache, import_cache, prewarm_documents, iter_document_paths
+
+
+def _png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (50, 50), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestExportImport:
+    """Tests pour l'export et l'import d'archives de cache"""
+
+    @pytest.mark.asyncio
+    async def test_roundtrip_keeps_remaining_ttl(self, tmp_path):
+        """Test export mémoire -> import disque, TTL restant conservé"""
+        source = MemoryCacheBackend()
+        await source.set("ocr_result:aaa", {"result": {"text": "A"}}, ttl_hours=2)
+        await source.set("ocr_page:fra:bbb", {"text": "page"}, ttl_hours=1)
+        await source.set("rate_limit:ip:1", {"count": 3})
+
+        archive = io.BytesIO()
+        await export_cache(archive, backend=source)
+        archive.seek(0)
+
+        target = DiskCacheBackend(str(tmp_path / "cache.sqlite3"))
+        counts = await import_cache(archive, backend=target)
+
+        assert counts == {"imported": 2, "expired": 0, "skipped": 0}
+        assert await target.get("ocr_result:aaa") == {"result": {"text": "A"}}
+        assert await target.get("rate_limit:ip:1") is None
+
+        ttls = {key: ttl for key, _, ttl in [entry async for entry in target.scan()]}
+        assert 7100 < ttls["ocr_result:aaa"] <= 7200
+        assert 3500 < ttls["ocr_page:fra:bbb"] <= 3600
+
+    @pytest.mark.asyncio
+    async def test_import_filters_hashes_and_drops_expired(self):
+        """Test filtre par hash de fichier, entrées expirées (ou à moins d'1 s) depuis l'export, lots décodés"""
+        lines = [
+            {"format": "ocr-facture-cache", "version": 1, "exported_at": time.time() - 600},
+            {"key": "ocr_result:keep", "value": {"v": 1}, "ttl": 3600},
+            {"key": "ocr_result:other", "value": {"v": 2}, "ttl": 3600},
+            {"key": "ocr_phash:keep", "value": {"v": 3}, "ttl": 300},
+            {"key": "ocr_page:fra:keep", "value": {"v": 4}, "ttl": 600.5},  # Redis refuserait EX 0
+        ]
+        archive = io.BytesIO(gzip.compress("\n".join(json.dumps(line) for line in lines).encode()))
+
+        target = MemoryCacheBackend()
+        with patch("cache_tools.IMPORT_BATCH_SIZE", 2):
+            counts = await import_cache(archive, only_hashes={"keep"}, backend=target)
+
+        assert counts == {"imported": 1, "expired": 2, "skipped": 1}
+        assert await target.get("ocr_result:keep") == {"v": 1}
+
+    @pytest.mark.asyncio
+    async def test_invalid_archive(self):
+        """Test un fichier qui n'est pas une archive de cache est refusé"""
+        with pytest.raises(ValueError):
+            await import_cache(io.BytesIO(b"not a gzip file"), backend=MemoryCacheBackend())
+
+
+class TestPrewarm:
+    """Tests pour le pré-chauffage du cache"""
+
+    @pytest.mark.asyncio
+    async def test_prewarm_skips_cached_documents(self, tmp_path):
+        """Test chaque document est OCRisé une fois, les suivants viennent du cache"""
+        from cache_redis import init_cache_backend
+
+        init_cache_backend(force_memory=True)
+        for color in ("white", "black", "red"):
+            (tmp_path / f"{color}.png").write_bytes(_png(color))
+        (tmp_path / "notes.txt").write_text("ignoré")
+
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}}
+        with patch("main.perform_ocr", return_value=ocr_result) as mock_ocr:
+            paths = list(iter_document_paths([str(tmp_path)]))
+            first = await prewarm_documents(paths, concurrency=2)
+            second = await prewarm_documents(paths + [("upload.png", _png("blue"))], concurrency=2)
+
+        assert len(paths) == 3
+        assert first == {"processed": 3, "cached": 0, "failed": 0}
+        assert second == {"processed": 1, "cached": 3, "failed": 0}
+        assert mock_ocr.call_count == 4
+
+
+class TestAdminEndpoints:
+    """Tests pour les endpoints d'administration du cache"""
+
+    def test_admin_requires_key(self):
+        """Test endpoints désactivés sans clé configurée, 403 avec une mauvaise clé"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        with patch.object(main.settings, "admin_api_key", None):
+            assert client.get("/admin/cache/export").status_code == 404
+        with patch.object(main.settings, "admin_api_key", "secret"):
+            assert client.get("/admin/cache/export", headers={"X-Admin-Key": "wrong"}).status_code == 403
+
+    def test_admin_export_streams_archive(self):
+        """Test l'export admin renvoie une archive lisible"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app)
+        with patch.object(main.settings, "admin_api_key", "secret"):
+            response = client.get("/admin/cache/export", headers={"X-Admin-Key": "secret"})
+
+        assert response.status_code == 200
+        header = json.loads(gzip.decompress(response.content).decode().splitlines()[0])
+        assert header["format"] == "ocr-facture-cache"
@@ -0,0 +1,123 @@
+"""
+Tests pour le store d'idempotence partagé (marqueur "en cours" + référence au résultat)
+"""
+
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import idempotency
+from cache_redis import init_cache_backend, get_cached
+from idempotency import claim_idempotency_key, complete_idempotency_key, release_idempotency_key
+
+
+@pytest.fixture(autouse=True)
+def memory_backend():
+    init_cache_backend(force_memory=True)
+    yield
+
+
+class TestIdempotencyStore:
+    """Tests pour la réservation des Idempotency-Key"""
+    
+    @pytest.mark.asyncio
+    async def test_completed_key_stores_reference_only(self):
+        """Test une clé traitée ne garde que les hash des résultats"""
+        assert await claim_idempotency_key("key-1") is None
+        await complete_idempotency_key("key-1", ["abc123"])
+        
+        entry = await claim_idempotency_key("key-1")
+        assert entry == {"state": "done", "file_hashes": ["abc123"]}
+        assert await get_cached("idempotency:key-1") == entry
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_waits_for_inflight_request(self):
+        """Test un doublon reçu pendant le traitement attend sa fin au lieu de retraiter"""
+        assert await claim_idempotency_key("key-2") is None
+        duplicate = asyncio.create_task(claim_idempotency_key("key-2"))
+        await asyncio.sleep(0.1)
+        assert not duplicate.done()
+        
+        await complete_idempotency_key("key-2", ["abc123"])
+        entry = await asyncio.wait_for(duplicate, timeout=2)
+        assert entry["state"] == "done"
+    
+    @pytest.mark.asyncio
+    async def test_failed_request_lets_duplicate_retry(self):
+        """Test après un échec, le doublon en attente reprend la clé"""
+        assert await claim_idempotency_key("key-3") is None
+        duplicate = asyncio.create_task(claim_idempotency_key("key-3"))
+        await asyncio.sleep(0.1)
+        
+        await release_idempotency_key("key-3")
+        assert await asyncio.wait_for(duplicate, timeout=2) is None
+    
+    @pytest.mark.asyncio
+    async def test_release_after_complete_is_noop(self):
+        """Test la libération après succès ne supprime pas la référence"""
+        assert await claim_idempotency_key("key-4") is None
+        await complete_idempotency_key("key-4", ["abc123"])
+        await release_idempotency_key("key-4")
+        
+        assert (await get_cached("idempotency:key-4"))["state"] == "done"
+    
+    @pytest.mark.asyncio
+    async def test_expired_marker_is_taken_over(self, monkeypatch):
+        """Test un worker arrêté en plein traitement ne bloque la clé que PENDING_TTL_SECONDS"""
+        monkeypatch.setattr(idempotency, "PENDING_TTL_SECONDS", 0.2)
+        assert await claim_idempotency_key("key-5") is None
+        monkeypatch.setattr(idempotency, "_claims", {})  # Simule un autre worker
+        
+        assert await asyncio.wait_for(claim_idempotency_key("key-5"), timeout=2) is None
+    
+    @pytest.mark.asyncio
+    async def test_pending_marker_survives_cache_eviction(self):
+        """Test le marqueur "en cours" n'est pas évincé par la limite de taille du cache mémoire"""
+        from cache_redis import set_many_cached
+        
+        assert await claim_idempotency_key("key-6") is None
+        await set_many_cached({f"ocr_result:{i}": {"text": "x"} for i in range(1500)})
+        
+        duplicate = asyncio.create_task(claim_idempotency_key("key-6"))
+        await asyncio.sleep(0.1)
+        assert not duplicate.done()
+        await complete_idempotency_key("key-6", ["abc123"])
+        assert (await asyncio.wait_for(duplicate, timeout=2))["state"] == "done"
+    
+    def test_pending_marker_survives_disk_trim(self, tmp_path):
+        """Test la réduction de taille du cache disque garde les réservations"""
+        from cache_redis import DiskCacheBackend
+        
+        backend = DiskCacheBackend(str(tmp_path / "cache.db"), max_size_mb=1)
+        backend._add_sync("idempotency:key-7", {"state": "pending"}, 60 / 3600)
+        for i in range(30):
+            backend._set_sync(f"ocr_result:{i}", {"text": "x" * 50_000}, 24)
+        
+        assert backend.sweep() > 0
+        assert backend._get_sync("idempotency:key-7") == {"state": "pending"}
+
+
+class TestDuplicateResponse:
+    """Tests pour la réponse 409 des doublons"""
+    
+    @pytest.mark.parametrize("entry, message", [
+        ({"state": "pending"}, "toujours en cours"),
+        ({"state": "done", "file_hashes": []}, "déjà été traitée"),
+    ])
+    def test_duplicate_uses_detail_shape(self, entry, message):
+        """Test un doublon répond 409 au format {"detail": ...} des autres erreurs, traité ou en cours"""
+        from unittest.mock import patch
+        from fastapi.testclient import TestClient
+        import main
+        
+        client = TestClient(main.app, headers={"Idempotency-Key": "key-8"})
+        with patch.object(main.settings, "debug_mode", True), \
+             patch("main.claim_idempotency_key", return_value=entry):
+            response = client.post("/v1/ocr/batch", json={"files": []})
+        
+        assert response.status_code == 409
+        assert list(response.json()) == ["detail"]
+        assert message in response.json()["detail"]
@@ -0,0 +1,64 @@
+"""
+Tests pour la surveillance de la boucle asyncio (retard, détection des appels bloquants)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loop_watchdog import LoopWatchdog
+from monitoring import get_metrics, log_event_loop_block, metrics
+
+
+def _blocking_sirene_call(seconds: float):
+    time.sleep(seconds)  # Appel synchrone dans la boucle, comme requests.post sans threadpool
+
+
+class TestLoopWatchdog:
+    """Tests du retard de boucle et des blocages"""
+
+    @pytest.mark.asyncio
+    async def test_blocking_call_logged_once_with_stack(self):
+        """Test un appel bloquant est journalisé une seule fois, avec sa pile, et apparaît dans le retard"""
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+        blocks_before = metrics["event_loop_blocks"]
+        lag_count_before = metrics["event_loop_lag"].count
+
+        with patch("loop_watchdog.log_event_loop_block", wraps=log_event_loop_block) as logged:
+            watchdog.start()
+            try:
+                await asyncio.sleep(0.05)
+                _blocking_sirene_call(0.3)
+                await asyncio.sleep(0.05)
+            finally:
+                await watchdog.stop()
+
+        assert logged.call_count == 1
+        blocked_seconds, stack = logged.call_args.args
+        assert blocked_seconds > 0.05
+        assert "_blocking_sirene_call" in stack[-1] and "time.sleep" in stack[-1]
+        assert metrics["event_loop_blocks"] - blocks_before == 1
+        assert metrics["event_loop_lag"].count > lag_count_before
+        assert metrics["event_loop_lag"].max >= 200  # ms
+        assert get_metrics()["event_loop"]["blocks"] == metrics["event_loop_blocks"]
+
+    @pytest.mark.asyncio
+    async def test_idle_loop_not_reported(self):
+        """Test une boucle libre n'est jamais signalée ; sans seuil, aucun thread de surveillance"""
+        watchdog = LoopWatchdog(interval=0.01, threshold=0.05)
+        with patch("loop_watchdog.log_event_loop_block") as logged:
+            watchdog.start()
+            await asyncio.sleep(0.2)
+            await watchdog.stop()
+        logged.assert_not_called()
+
+        lag_only = LoopWatchdog(interval=0.01, threshold=0)
+        lag_only.start()
+        assert lag_only._thread is None
+        await lag_only.stop()
@@ -0,0 +1,114 @@
+"""
+Tests pour le suivi mémoire (taille des caches, instantanés tracemalloc, pic mémoire par requête, endpoints admin)
+"""
+
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compliance
+from memory_profiling import (
+    begin_request_memory, diff_snapshots, end_request_memory, registry_sizes, start_tracing, stop_tracing,
+    take_snapshot
+)
+from monitoring import request_peak_memory
+
+_retained = []  # Allocations gardées vivantes entre deux instantanés (fuite simulée)
+
+
+@pytest.fixture
+def tracing():
+    was_tracing = tracemalloc.is_tracing()
+    start_tracing()
+    yield
+    _retained.clear()
+    if not was_tracing:
+        stop_tracing()
+
+
+class TestRegistrySizes:
+    """Tests de la taille des caches et registres en mémoire"""
+
+    def test_reports_compliance_caches(self):
+        """Test les caches Sirene et le rate limiting Sirene sont comptés (entrées, horodatages, octets)"""
+        entries = {f"{i:09d}": {"siren": f"{i:09d}", "nom": "x" * 100} for i in range(50)}
+        calls = {"minute": [datetime.now()] * 7}
+        with patch.dict(compliance._sirene_results_cache, entries), patch.dict(compliance._sirene_rate_limit, calls):
+            shallow = registry_sizes()
+            deep = registry_sizes(deep=True)
+
+        assert shallow["compliance.sirene_results_cache"]["entries"] >= 50
+        assert "approx_bytes" not in shallow["compliance.sirene_results_cache"]
+        assert deep["compliance.sirene_results_cache"]["approx_bytes"] > 50 * 100
+        assert shallow["compliance.sirene_rate_limit"]["timestamps"] >= 7
+        assert {"idempotency.claims", "compliance.token_cache", "single_flight.inflight"} <= set(shallow)
+
+
+class TestSnapshots:
+    """Tests des instantanés tracemalloc"""
+
+    def test_diff_points_to_growing_allocation(self, tracing):
+        """Test la différence entre deux instantanés désigne la ligne qui retient de la mémoire"""
+        base = take_snapshot()
+        _retained.extend(bytearray(4096) for _ in range(500))
+        diff = diff_snapshots(base, group_by="filename", limit=5)
+
+        assert diff["base"] == base and diff["target"] != base
+        top = diff["top"][0]
+        assert top["location"].endswith("test_memory_profiling.py")
+        assert top["size_diff_bytes"] >= 500 * 4096
+
+    def test_snapshot_requires_tracing(self):
+        """Test sans traçage, un instantané est refusé"""
+        if tracemalloc.is_tracing():
+            pytest.skip("tracemalloc démarré hors du test (PYTHONTRACEMALLOC)")
+        with pytest.raises(RuntimeError):
+            take_snapshot()
+
+    def test_request_peak(self, tracing):
+        """Test le pic mesuré couvre une allocation temporaire libérée avant la fin de la requête"""
+        started = begin_request_memory()
+        temporary = bytearray(5 * 1024 * 1024)
+        del temporary
+        peak = end_request_memory(started)
+        assert peak >= 5 * 1024 * 1024
+        assert end_request_memory(None) is None
+
+
+class TestMemoryEndpoints:
+    """Tests des endpoints /admin/memory"""
+
+    def test_tracing_snapshot_and_diff(self):
+        """Test démarrage du traçage, instantané, diff, rapport et histogramme de pic par route"""
+        from fastapi.testclient import TestClient
+        import main
+
+        was_tracing = tracemalloc.is_tracing()
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA", "X-Admin-Key": "admin"})
+        with patch.object(main.settings, "debug_mode", True), patch.object(main.settings, "admin_api_key", "admin"):
+            try:
+                if not was_tracing:
+                    assert client.post("/admin/memory/snapshot").status_code == 409
+                assert client.post("/admin/memory/tracing").json()["tracing"] is True
+                snapshot = client.post("/admin/memory/snapshot", params={"limit": 3}).json()
+                assert len(snapshot["top"]) <= 3
+
+                client.get("/v1/quota")
+                diff = client.get("/admin/memory/diff", params={"base": snapshot["id"]}).json()
+                assert diff["base"] == snapshot["id"] and "top" in diff
+                assert client.get("/admin/memory/diff", params={"base": "nope"}).status_code == 404
+                assert client.get("/admin/memory/diff", params={"base": snapshot["id"], "group_by": "x"}).status_code == 400
+
+                report = client.get("/admin/memory", params={"deep": True}).json()
+                assert report["tracing"] is True and report["snapshots"]
+                assert "approx_bytes" in report["registries"]["idempotency.claims"]
+                assert ("/v1/quota",) in request_peak_memory.series
+            finally:
+                if not was_tracing:
+                    assert client.delete("/admin/memory/tracing").json()["tracing"] is False
@@ -0,0 +1,334 @@
+"""
+Tests pour les métriques de monitoring (histogrammes de latence, exposition Prometheus, Server-Timing, logging non bloquant,
+agrégation entre workers)
+"""
+
+import base64
+import io
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Optional
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monitoring import (
+    HISTOGRAM_SUB_BUCKETS, DroppingQueueHandler, JsonMessage, LatencyHistogram, PrometheusHistogram, SpanRecorder,
+    _request_spans, external_request_duration, get_request_timings, get_metrics, log_cache_hit, log_cache_miss,
+    log_request, merge_snapshots, metrics, render_prometheus, snapshot_metrics, time_external_request, time_stage
+)
+import cluster_metrics
+
+
+class TestLatencyHistogram:
+    """Tests pour LatencyHistogram"""
+
+    def test_percentiles_within_bucket_precision(self):
+        """Test les percentiles lus sur les buckets restent à ~3 % des valeurs exactes"""
+        rng = random.Random(42)
+        samples = [rng.lognormvariate(4, 1.2) for _ in range(20000)]
+        histogram = LatencyHistogram()
+        for sample in samples:
+            histogram.record(sample)
+
+        ordered = sorted(samples)
+        for quantile, value in zip((0.50, 0.95, 0.99), histogram.percentiles(0.50, 0.95, 0.99)):
+            exact = ordered[int(len(ordered) * quantile)]
+            assert value == pytest.approx(exact, rel=2 / HISTOGRAM_SUB_BUCKETS)
+        assert histogram.count == len(samples)
+        assert histogram.percentiles(1.0)[0] == max(samples)
+
+    def test_empty_and_extreme_values(self):
+        """Test histogramme vide, valeur nulle et latences très longues"""
+        histogram = LatencyHistogram()
+        assert histogram.summary()["p99_ms"] is None
+
+        for value in (0.0, 0.05, 3_600_000.0):
+            histogram.record(value)
+        assert histogram.percentiles(0.0)[0] == pytest.approx(1e-6, rel=2 / HISTOGRAM_SUB_BUCKETS)
+        assert histogram.percentiles(1.0)[0] == 3_600_000.0
+        assert len(histogram.buckets) == 3
+
+
+class TestLatencyMetrics:
+    """Tests des histogrammes par route et classe de statut"""
+
+    def test_latency_grouped_by_route_template(self):
+        """Test les latences sont regroupées par route et classe de statut, URL sans route sous unmatched"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        metrics["latency_by_route"].clear()
+        with patch.object(main.settings, "debug_mode", True):
+            for _ in range(3):
+                client.get("/v1/quota")
+            client.post("/v1/ocr/base64", data={})
+            client.get("/nowhere/1")
+            client.get("/nowhere/2")
+            by_route = client.get("/v1/metrics").json()["metrics"]["latency_by_route"]
+        assert by_route["/v1/quota"]["2xx"]["count"] == 3
+        assert by_route["/v1/ocr/base64"]["4xx"]["count"] == 1
+        assert by_route["unmatched"]["4xx"]["count"] == 2
+        assert by_route["/v1/quota"]["2xx"]["p99_ms"] >= by_route["/v1/quota"]["2xx"]["p50_ms"]
+
+
+class TestPrometheusExposition:
+    """Tests de l'exposition Prometheus (/metrics)"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test les buckets sont cumulés (le inclusif), avec _sum, _count et labels échappés"""
+        histogram = PrometheusHistogram("test_seconds", "Test", ("route",), buckets=(0.1, 1.0), register=False)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'a"b')
+        lines = histogram.render()
+
+        assert lines[:2] == ["# HELP ocr_api_test_seconds Test", "# TYPE ocr_api_test_seconds histogram"]
+        assert 'ocr_api_test_seconds_bucket{route="a\\"b",le="0.1"} 2' in lines
+        assert 'ocr_api_test_seconds_bucket{route="a\\"b",le="1.0"} 3' in lines
+        assert 'ocr_api_test_seconds_bucket{route="a\\"b",le="+Inf"} 4' in lines
+        assert 'ocr_api_test_seconds_sum{route="a\\"b"} 3.65' in lines
+        assert 'ocr_api_test_seconds_count{route="a\\"b"} 4' in lines
+
+    def test_external_request_outcome(self):
+        """Test la latence des API externes est classée par issue (response, timeout, error)"""
+        class ReadTimeout(Exception):
+            pass
+
+        before = dict(external_request_duration.series)
+        with time_external_request("vies"):
+            pass
+        with pytest.raises(ReadTimeout):
+            with time_external_request("vies"):
+                raise ReadTimeout()
+
+        def count(outcome):
+            series = external_request_duration.series.get(("vies", outcome))
+            previous = before.get(("vies", outcome))
+            return sum(series[0]) - (sum(previous[0]) if previous else 0)
+
+        assert count("response") == 1
+        assert count("timeout") == 1
+
+    def test_metrics_endpoint(self):
+        """Test /metrics : format texte, latence par route et plan, refus 429, jeton Bearer"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "BASIC", "X-RapidAPI-User": "metrics-test"})
+        with patch.object(main.settings, "debug_mode", True):
+            statuses = [client.get("/v1/quota").status_code for _ in range(5)]
+        assert statuses.count(429) >= 1
+
+        with patch.object(main.settings, "metrics_bearer_token", "scrape-token"):
+            assert client.get("/metrics").status_code == 401
+            response = client.get("/metrics", headers={"Authorization": "Bearer scrape-token"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'ocr_api_request_duration_seconds_count{route="/v1/quota",plan="BASIC",status="2xx"}' in body
+        assert 'ocr_api_rate_limit_rejections_total{window="per_minute"}' in body
+        assert "# TYPE ocr_api_cache_requests_total counter" in body
+
+
+class TestClusterMetrics:
+    """Tests de l'agrégation des métriques entre workers"""
+
+    def test_merged_histogram_equals_single_histogram(self):
+        """Test fusionner les histogrammes de deux workers donne les percentiles de toutes les mesures"""
+        rng = random.Random(7)
+        samples = [rng.lognormvariate(3, 1) for _ in range(4000)]
+        combined, worker_a, worker_b = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for i, sample in enumerate(samples):
+            combined.record(sample)
+            (worker_a if i % 3 else worker_b).record(sample)
+
+        merged = LatencyHistogram()
+        merged.merge(json.loads(json.dumps(worker_a.to_dict())))
+        merged.merge(json.loads(json.dumps(worker_b.to_dict())))
+        merged.merge(LatencyHistogram().to_dict())  # Worker sans requête
+
+        assert merged.buckets == combined.buckets
+        assert merged.percentiles(0.5, 0.99) == combined.percentiles(0.5, 0.99)
+        assert (merged.count, merged.min, merged.max) == (combined.count, combined.min, combined.max)
+
+    def test_requests_by_endpoint_keyed_by_route(self):
+        """Test un compteur par route, pas un par URL (/v1/ocr/result/{sha256} : un hash par requête)"""
+        route = "/v1/ocr/result/{sha256}"
+        before = metrics["requests_by_endpoint"].get(route, 0)
+        for digest in ("a" * 64, "b" * 64):
+            log_request(_fake_request(f"/v1/ocr/result/{digest}", route=route), 0.01, 404, f"/v1/ocr/result/{digest}")
+
+        assert metrics["requests_by_endpoint"][route] == before + 2
+        assert not any(key.startswith("/v1/ocr/result/a") for key in snapshot_metrics()["requests_by_endpoint"])
+
+    def test_counters_and_prometheus_series_summed(self):
+        """Test compteurs, routes et séries Prometheus de deux instantanés sont additionnés"""
+        log_request(_fake_request("/v1/quota", route="/v1/quota"), 0.02, 200, "/v1/quota")
+        external_request_duration.observe(0.2, "sirene", "response")
+        snapshot = json.loads(json.dumps(snapshot_metrics()))
+        merged = merge_snapshots([snapshot, snapshot])
+
+        report = get_metrics(merged)
+        assert report["requests"]["total"] == 2 * metrics["requests_total"]
+        assert report["by_endpoint"]["/v1/quota"] == 2 * metrics["requests_by_endpoint"]["/v1/quota"]
+        assert report["latency"]["count"] == 2 * metrics["latency"].count
+
+        local_count = sum(external_request_duration.series[("sirene", "response")][0])
+        line = 'ocr_api_external_request_seconds_count{service="sirene",outcome="response"}'
+        assert f"{line} {2 * local_count}" in render_prometheus(merged).splitlines()
+
+    @pytest.mark.asyncio
+    async def test_shared_directory_backend(self, tmp_path):
+        """Test sans Redis : instantanés dans le répertoire partagé, workers arrêtés ignorés et supprimés"""
+        cluster_metrics.init_cluster_metrics(shared_dir=str(tmp_path), flush_interval=10, worker_ttl=60)
+        try:
+            with patch("cluster_metrics.get_redis_client", return_value=None):
+                peer = {"updated_at": time.time(), "snapshot": json.loads(json.dumps(snapshot_metrics()))}
+                (tmp_path / "other-host_1.json").write_text(json.dumps(peer))
+                stale = tmp_path / "other-host_2.json"
+                stale.write_text(json.dumps(peer))
+                os.utime(stale, (time.time() - 120, time.time() - 120))
+
+                assert await cluster_metrics.publish_snapshot()
+                own_file = tmp_path / (cluster_metrics.worker_id().replace(":", "_") + ".json")
+                assert own_file.exists()
+
+                local_total = metrics["requests_total"]
+                report = await cluster_metrics.get_cluster_metrics()
+        finally:
+            cluster_metrics.init_cluster_metrics()
+
+        assert report["cluster"] == {"workers": 2, "backend": "directory"}
+        assert report["requests"]["total"] == local_total + peer["snapshot"]["counters"]["requests_total"]
+        assert not stale.exists()
+
+    @pytest.mark.asyncio
+    async def test_prometheus_only_sums_published_snapshots(self, tmp_path):
+        """Test /metrics additionne les instantanés publiés : identique sur chaque worker, sans le direct"""
+        cluster_metrics.init_cluster_metrics(shared_dir=str(tmp_path), flush_interval=10, worker_ttl=60)
+        try:
+            with patch("cluster_metrics.get_redis_client", return_value=None):
+                peer = {"updated_at": time.time(), "snapshot": json.loads(json.dumps(snapshot_metrics()))}
+                (tmp_path / "other-host_1.json").write_text(json.dumps(peer))
+                assert await cluster_metrics.publish_snapshot()
+                published = json.loads(json.dumps(snapshot_metrics()))
+
+                first = await cluster_metrics.render_cluster_prometheus()
+                external_request_duration.observe(0.05, "sirene", "response")  # Pas encore publié
+                second = await cluster_metrics.render_cluster_prometheus()
+        finally:
+            cluster_metrics.init_cluster_metrics()
+
+        assert first == second == render_prometheus(merge_snapshots([published, peer["snapshot"]]))
+
+
+class TestServerTiming:
+    """Tests du découpage par étape (Server-Timing, bloc timings)"""
+
+    @pytest.mark.asyncio
+    async def test_spans_recorded_from_threadpool(self):
+        """Test les étapes mesurées dans le threadpool sont rattachées à la requête en cours"""
+        from starlette.concurrency import run_in_threadpool
+
+        @time_stage("unit_stage")
+        def work():
+            return 42
+
+        token = _request_spans.set(SpanRecorder())
+        try:
+            assert await run_in_threadpool(work) == 42
+            await run_in_threadpool(work)
+            recorder = _request_spans.get()
+            assert recorder.spans["unit_stage"][1] == 2
+            assert recorder.server_timing(0.5).endswith("total;dur=500.0")
+        finally:
+            _request_spans.reset(token)
+        assert get_request_timings() is None
+
+    def test_server_timing_header_and_timings_block(self):
+        """Test Server-Timing sur chaque réponse, timings dans OCRResponse seulement si demandé"""
+        from fastapi.testclient import TestClient
+        import main
+
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        ocr_result = {"text": "FACTURE N° 42", "language": "fra", "data": {}}
+        buffer = io.BytesIO()
+        Image.new("RGB", (60, 60), "maroon").save(buffer, format="PNG")
+        image = base64.b64encode(buffer.getvalue()).decode()
+        with patch.object(main.settings, "debug_mode", True), \
+             patch("main.perform_ocr", return_value=ocr_result):
+            fresh = client.post("/v1/ocr/base64", data={"image_base64": image, "include_timings": "true"})
+            cached = client.post("/v1/ocr/base64", data={"image_base64": image})
+
+        stages = {entry.split(";")[0].strip() for entry in fresh.headers["Server-Timing"].split(",")}
+        assert {"cache_get", "ocr_queue", "extraction", "cache_set", "total"} <= stages
+        assert set(fresh.json()["timings"]) == stages - {"total"}
+
+        assert cached.json()["cached"] is True and cached.json()["timings"] is None
+        assert "extraction" not in cached.headers["Server-Timing"]
+        assert "cache_get;dur=" in cached.headers["Server-Timing"]
+
+
+def _fake_request(path: str = "/v1/ocr/upload", route: Optional[str] = None) -> Request:
+    scope = {
+        "type": "http", "method": "POST", "path": path, "query_string": b"",
+        "headers": [(b"user-agent", b"pytest")], "client": ("203.0.113.7", 5000),
+    }
+    if route is not None:
+        scope["route"] = SimpleNamespace(path=route)  # Posé par le routeur FastAPI
+    return Request(scope)
+
+
+class TestLoggingPipeline:
+    """Tests du logging non bloquant (file bornée, sérialisation différée, échantillonnage)"""
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test un writer bloqué ne bloque pas la requête : les logs au-delà de la file sont perdus et comptés"""
+        log_queue = queue.Queue(maxsize=2)
+        test_logger = logging.getLogger("ocr_facture_api.test_queue")
+        test_logger.propagate = False
+        handler = DroppingQueueHandler(log_queue)
+        test_logger.addHandler(handler)
+        dropped_before = metrics["logs_dropped"]
+        try:
+            for i in range(5):
+                test_logger.warning(JsonMessage({"i": i}))
+        finally:
+            test_logger.removeHandler(handler)
+
+        assert log_queue.qsize() == 2
+        assert metrics["logs_dropped"] - dropped_before == 3
+        # Sérialisation laissée au writer : le message est encore un JsonMessage
+        record = log_queue.get_nowait()
+        assert isinstance(record.msg, JsonMessage)
+        assert record.getMessage() == '{"i": 0}'
+
+    def test_disabled_debug_skips_serialisation(self):
+        """Test les logs debug du cache ne construisent rien quand le niveau debug est désactivé"""
+        with patch("monitoring.JsonMessage") as json_message:
+            log_cache_hit("/v1/ocr/upload")
+            log_cache_miss("/v1/ocr/upload")
+        json_message.assert_not_called()
+
+    def test_success_logs_sampled_errors_kept(self, caplog):
+        """Test avec un échantillonnage à 0, seules les erreurs sont journalisées ; les métriques comptent tout"""
+        total_before = metrics["requests_total"]
+        with patch("monitoring.LOG_SUCCESS_SAMPLE_RATE", 0.0), caplog.at_level(logging.INFO, logger="ocr_facture_api"):
+            log_request(_fake_request(), 0.01, 200, "/v1/ocr/upload")
+            log_request(_fake_request(), 0.01, 503, "/v1/ocr/upload")
+
+        messages = [record.getMessage() for record in caplog.records if record.name == "ocr_facture_api"]
+        assert len(messages) == 1 and '"status_code": 503' in messages[0] and '"level": "ERROR"' in messages[0]
+        assert metrics["requests_total"] - total_before == 2
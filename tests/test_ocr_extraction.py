@@ -135,6 +135,113 @@ class TestOCRProcessing:
         assert result["language"] == "eng"
 
 
+def _make_pdf(page_texts):
+    """Crée un PDF avec une page par texte"""
+    import fitz
+    pdf_document = fitz.open()
+    for text in page_texts:
+        page = pdf_document.new_page()
+        page.insert_text((72, 72), text)
+    data = pdf_document.tobytes()
+    pdf_document.close()
+    return data
+
+
+class TestPDFPageCache:
+    """Tests pour le cache OCR par page des PDF multi-pages"""
+    
+    @pytest.mark.asyncio
+    @patch('main.pytesseract')
+    async def test_unchanged_pages_reuse_cache(self, mock_tesseract):
+        """Test seules les pages modifiées d'un PDF renvoyé sont OCRisées"""
+        from main import perform_ocr_with_page_cache
+        from cache_redis import init_cache_backend
+        
+        init_cache_backend(force_memory=True)
+        mock_tesseract.get_tesseract_version.return_value = "5.0.0"
+        mock_tesseract.image_to_string.side_effect = lambda image, lang: f"page {image.size}"
+        mock_tesseract.image_to_data.return_value = {}
+        
+        annexes = [f"Annexe {i}" for i in range(4)]
+        first = _make_pdf(["Facture du 01/03/2024"] + annexes)
+        corrected = _make_pdf(["Facture du 02/03/2024"] + annexes)
+        
+        result = await perform_ocr_with_page_cache(first, "fra", is_pdf=True)
+        assert result["pages_processed"] == 5
+        assert result["pages_from_cache"] == 0
+        assert "new_pages" not in result
+        assert mock_tesseract.image_to_string.call_count == 5
+        
+        result = await perform_ocr_with_page_cache(corrected, "fra", is_pdf=True)
+        assert result["pages_processed"] == 5
+        assert result["pages_from_cache"] == 4
+        assert mock_tesseract.image_to_string.call_count == 6
+        assert result["text"].count("--- Page") == 5
+    
+    def test_page_hashes_differ_by_content(self):
+        """Test le hash d'une page dépend de son contenu, et se calcule sans rendu"""
+        from main import compute_pdf_page_hashes
+        
+        with patch('main.render_pdf_page', side_effect=AssertionError("rendu")):
+            hashes = compute_pdf_page_hashes(_make_pdf(["A", "B", "A"]))
+        assert len(hashes) == 3
+        assert hashes[0] == hashes[2]
+        assert hashes[0] != hashes[1]
+    
+    def test_scanned_pages_hashed_by_embedded_image(self):
+        """Test deux pages scannées (une image chacune, même flux de contenu) ont des hash distincts"""
+        import fitz
+        from main import compute_pdf_page_hashes
+        
+        pdf_document = fitz.open()
+        for color in ("white", "gray", "white"):
+            buffer = io.BytesIO()
+            Image.new("RGB", (80, 60), color).save(buffer, format="PNG")
+            pdf_document.new_page().insert_image(fitz.Rect(0, 0, 400, 300), stream=buffer.getvalue())
+        data = pdf_document.tobytes()
+        pdf_document.close()
+        
+        hashes = compute_pdf_page_hashes(data)
+        assert hashes[0] != hashes[1]
+    
+    @pytest.mark.asyncio
+    @patch('main.pytesseract')
+    async def test_fully_cached_pdf_is_not_rendered(self, mock_tesseract):
+        """Test un PDF dont toutes les pages sont en cache n'est ni rendu ni OCRisé"""
+        from main import perform_ocr_with_page_cache
+        from cache_redis import init_cache_backend
+        
+        init_cache_backend(force_memory=True)
+        mock_tesseract.get_tesseract_version.return_value = "5.0.0"
+        mock_tesseract.image_to_string.return_value = "page"
+        mock_tesseract.image_to_data.return_value = {}
+        data = _make_pdf(["Relevé 1", "Relevé 2"])
+        
+        await perform_ocr_with_page_cache(data, "fra", is_pdf=True)
+        with patch('main.render_pdf_page', side_effect=AssertionError("rendu")):
+            result = await perform_ocr_with_page_cache(data, "fra", is_pdf=True)
+        assert result["pages_from_cache"] == 2
+        assert mock_tesseract.image_to_string.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_pdf_pages_admitted_without_pymupdf(self):
+        """Test sans PyMuPDF (pas de hash de page), le créneau OCR couvre toutes les pages du PDF"""
+        import main
+        
+        admitted = []
+        
+        class RecordingController:
+            def slot(self, pages, tenant, plan):
+                admitted.append(pages)
+                raise main.OCROverloadedError(1)
+        
+        with patch('main.FITZ_AVAILABLE', False), \
+             patch('main.get_admission_controller', return_value=RecordingController()):
+            with pytest.raises(main.OCROverloadedError):
+                await main.perform_ocr_with_page_cache(_make_pdf(["1", "2", "3"]), "fra", is_pdf=True)
+        assert admitted == [3]
+
+
 class TestConfidenceScores:
     """Tests pour les scores de confiance"""
     
@@ -0,0 +1,163 @@
+"""
+Tests pour le cache par hash perceptuel (factures quasi identiques)
+"""
+
+import pytest
+import io
+import random
+import sys
+import os
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from perceptual_cache import (
+    BKTree,
+    PerceptualIndex,
+    compute_document_signatures,
+    hamming_distance,
+    thumbnails_match,
+)
+
+INVOICE_LINES = [
+    "FACTURE N 2024-001",
+    "Date 12/03/2024",
+    "Client Dupont SARL",
+    "Total HT 100,00",
+    "TVA 20,00",
+    "Total TTC 120,00 EUR",
+]
+
+
+def _invoice_image(lines=INVOICE_LINES, size=(1240, 1754)) -> Image.Image:
+    """Crée une image de facture simple (A4, 150 dpi)"""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=24)
+    draw.rectangle([80, 80, 1160, 250], outline="black", width=4)
+    for i, line in enumerate(lines):
+        draw.text((100, 350 + i * 45), line, fill="black", font=font)
+    return image
+
+
+def _encode(image: Image.Image, fmt: str = "PNG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+class TestDHash:
+    """Tests pour le calcul du dHash"""
+
+    def test_reencoded_image_matches(self):
+        """Test la même facture ré-encodée en JPEG est reconnue"""
+        image = _invoice_image()
+        [(original_hash, original_thumb)] = compute_document_signatures(_encode(image))
+        [(jpeg_hash, jpeg_thumb)] = compute_document_signatures(_encode(image, "JPEG", quality=30))
+
+        assert hamming_distance(original_hash, jpeg_hash) <= 10
+        assert thumbnails_match(original_thumb, jpeg_thumb)
+
+    def test_same_template_different_amount_rejected(self):
+        """Test deux factures du même modèle avec un montant différent ne matchent pas"""
+        other_lines = INVOICE_LINES[:-1] + ["Total TTC 180,00 EUR"]
+        [(first_hash, first_thumb)] = compute_document_signatures(_encode(_invoice_image()))
+        [(second_hash, second_thumb)] = compute_document_signatures(_encode(_invoice_image(other_lines)))
+
+        # Le dHash seul ne les distingue pas : la vérification des vignettes si
+        assert hamming_distance(first_hash, second_hash) <= 10
+        assert not thumbnails_match(first_thumb, second_thumb)
+
+    def test_different_layout_is_far(self):
+        """Test deux documents différents sont éloignés"""
+        second = Image.new("RGB", (1240, 1754), "white")
+        ImageDraw.Draw(second).rectangle([600, 0, 1240, 900], fill="black")
+
+        [(a, _)] = compute_document_signatures(_encode(_invoice_image()))
+        [(b, _)] = compute_document_signatures(_encode(second))
+        assert hamming_distance(a, b) > 30
+
+    def test_invalid_data_returns_none(self):
+        """Test un fichier illisible ne produit pas de signature"""
+        assert compute_document_signatures(b"not an image") is None
+
+
+class TestBKTree:
+    """Tests pour le BK-tree"""
+
+    def test_search_matches_brute_force(self):
+        """Test la recherche donne les mêmes résultats qu'un parcours complet"""
+        rng = random.Random(42)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+
+        query = hashes[10] ^ 0b1011  # 3 bits différents
+        expected = sorted(i for i, h in enumerate(hashes) if hamming_distance(query, h) <= 5)
+        found = sorted(value for _, value in tree.search(query, 5))
+        assert found == expected
+        assert 10 in found
+
+
+class TestPerceptualIndex:
+    """Tests pour l'index perceptuel"""
+
+    def test_find_requires_same_page_count(self):
+        """Test un PDF avec un nombre de pages différent ne matche pas"""
+        index = PerceptualIndex(max_distance=4)
+        index.add((0b1111, 0b0000), "doc_a")
+
+        assert index.candidates((0b1110, 0b0001)) == [("doc_a", 1)]
+        assert index.candidates((0b1111,)) == []
+        assert index.candidates((0b1111, 0b0000), exclude="doc_a") == []
+
+    def test_bounded_size(self):
+        """Test l'index est borné et garde les entrées récentes"""
+        index = PerceptualIndex(max_distance=0, max_entries=10)
+        for i in range(25):
+            index.add((i << 8,), f"doc_{i}")
+
+        assert len(index) <= 10
+        assert index.candidates((24 << 8,)) == [("doc_24", 0)]
+        assert index.candidates((0,)) == []
+
+
+class TestLookupCachedResult:
+    """Tests pour la recherche dans le cache de l'API (exact puis perceptuel)"""
+
+    @pytest.mark.asyncio
+    async def test_perceptual_match_reuses_cached_result(self):
+        """Test une facture ré-encodée réutilise l'OCR en cache"""
+        import perceptual_cache
+        from main import lookup_cached_result, set_cached_result, get_file_hash
+
+        image = _invoice_image()
+        original = _encode(image)
+        rescanned = _encode(image, "JPEG", quality=50)
+        original_hash = get_file_hash(original)
+
+        perceptual_cache.init_perceptual_index(True)
+        try:
+            await set_cached_result(original_hash, {"data": {"text": "FACTURE"}})
+            await perceptual_cache.index_document(original_hash, compute_document_signatures(original), 1)
+
+            result, match = await lookup_cached_result(get_file_hash(rescanned), rescanned, False)
+            assert match == "perceptual"
+            assert result == {"data": {"text": "FACTURE"}}
+
+            # Le fichier re-scanné est désormais un hit exact
+            result, match = await lookup_cached_result(get_file_hash(rescanned), rescanned, False)
+            assert match == "exact"
+        finally:
+            perceptual_cache.init_perceptual_index(False)
+
+    @pytest.mark.asyncio
+    async def test_disabled_index_is_miss(self):
+        """Test sans index perceptuel, un fichier inconnu est un miss"""
+        from main import lookup_cached_result
+
+        data = _encode(_invoice_image(["FACTURE inconnue"]))
+        result, match = await lookup_cached_result("unknown_hash_perceptual", data, False)
+        assert result is None
+        assert match is None
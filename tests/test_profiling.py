@@ -0,0 +1,151 @@
+"""
+Tests pour le profilage à la demande (jetons X-Profile, échantillonneur, endpoints admin)
+"""
+
+import base64
+import io
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+from profiling import StackSampler, create_profile_token, init_profiling, verify_profile_token
+
+
+@pytest.fixture
+def signing_key():
+    init_profiling("secret")
+    yield "secret"
+    init_profiling(None)
+
+
+def _busy_invoice_ocr(seconds: float = 0.15):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    return {"text": "FACTURE", "language": "fra", "data": {}}
+
+
+class TestProfileToken:
+    """Tests des jetons X-Profile"""
+
+    def test_valid_token(self, signing_key):
+        """Test un jeton délivré est accepté"""
+        assert verify_profile_token(create_profile_token(60)["token"])
+
+    def test_rejected_tokens(self, signing_key):
+        """Test signature modifiée, jeton expiré, validité trop longue et format invalide sont refusés"""
+        expires, signature = create_profile_token(60)["token"].split(".")
+        assert not verify_profile_token(f"{expires}.{'0' * len(signature)}")
+        assert not verify_profile_token(f"{int(expires) + 1}.{signature}")
+
+        past = int(time.time()) - 1
+        assert not verify_profile_token(f"{past}.{profiling._signature(past)}")
+        far = int(time.time()) + 10 * profiling.MAX_TOKEN_TTL_SECONDS
+        assert not verify_profile_token(f"{far}.{profiling._signature(far)}")
+        assert not verify_profile_token("garbage")
+
+    def test_non_ascii_token(self, signing_key):
+        """Test un jeton non ASCII est refusé sans lever d'exception, y compris via le middleware"""
+        from fastapi.testclient import TestClient
+        import main
+
+        init_profiling(signing_key)  # main l'initialise avec ADMIN_API_KEY à l'import
+        future = int(time.time()) + 60
+        assert not verify_profile_token(f"{future}.é")
+
+        response = TestClient(main.app).get("/health", headers={"X-Profile": f"{future}.é".encode()})
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+
+    def test_disabled_without_key(self):
+        """Test sans clé admin, aucun jeton n'est délivré ni accepté"""
+        init_profiling(None)
+        with pytest.raises(ValueError):
+            create_profile_token()
+        assert not verify_profile_token("1.abc")
+
+
+class TestStackSampler:
+    """Tests de l'échantillonneur de piles"""
+
+    def test_samples_worker_threads(self):
+        """Test les piles d'un thread de calcul apparaissent au format collapsed stacks"""
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        worker = threading.Thread(target=_busy_invoice_ocr, name="ocr-worker")
+        worker.start()
+        worker.join()
+        sampler.stop()
+
+        assert sampler.samples > 10
+        lines = sampler.collapsed().splitlines()
+        busy = [line for line in lines if line.startswith("ocr-worker;") and "_busy_invoice_ocr (test_profiling.py" in line]
+        assert busy
+        stack, count = busy[0].rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+
+    def test_attached_only_skips_other_threads(self):
+        """Test un profil de requête n'échantillonne que les threads rattachés"""
+        sampler = StackSampler(interval=0.001, attached_only=True)
+        sampler.start()
+        attached = threading.Thread(target=sampler.run_attached, args=(_busy_invoice_ocr,), name="request-worker")
+        other = threading.Thread(target=_busy_invoice_ocr, name="other-tenant")
+        attached.start()
+        other.start()
+        attached.join()
+        other.join()
+        sampler.stop()
+
+        collapsed = sampler.collapsed()
+        assert "request-worker;" in collapsed
+        assert "other-tenant;" not in collapsed
+
+
+class TestProfileEndpoints:
+    """Tests du profilage par header X-Profile et des endpoints /admin/profile"""
+
+    def test_profiled_request_and_admin_endpoints(self, signing_key):
+        """Test une requête avec X-Profile valide est profilée (OCR du threadpool inclus), les autres non"""
+        from fastapi.testclient import TestClient
+        import main
+
+        init_profiling(signing_key)  # main l'initialise avec ADMIN_API_KEY à l'import
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        buffer = io.BytesIO()
+        Image.new("RGB", (60, 60), "purple").save(buffer, format="PNG")
+        image = base64.b64encode(buffer.getvalue()).decode()
+        admin = {"X-Admin-Key": signing_key}
+
+        # OCR d'un autre client pendant la requête profilée
+        other_tenant = threading.Thread(target=_busy_invoice_ocr, args=(1.0,), name="other-tenant")
+
+        with patch.object(main.settings, "debug_mode", True), \
+             patch.object(main.settings, "admin_api_key", signing_key), \
+             patch("main.perform_ocr", side_effect=lambda *args, **kwargs: _busy_invoice_ocr()):
+            token = client.get("/admin/profile/token", params={"ttl": 60}, headers=admin).json()["token"]
+            unprofiled = client.get("/v1/quota", headers={"X-Profile": "1.forged"})
+            other_tenant.start()
+            profiled = client.post("/v1/ocr/base64", data={"image_base64": image}, headers={"X-Profile": token})
+            other_tenant.join()
+            profile_id = profiled.headers["X-Profile-Id"]
+            collapsed = client.get(f"/admin/profile/{profile_id}", headers=admin).text
+            listed = client.get("/admin/profile", headers=admin).json()["profiles"]
+            session = client.post("/admin/profile", params={"seconds": 0.2}, headers=admin)
+            missing = client.get("/admin/profile/unknown", headers=admin)
+
+        assert "X-Profile-Id" not in unprofiled.headers
+        assert profiled.status_code == 200
+        assert "_busy_invoice_ocr (test_profiling.py" in collapsed
+        assert "other-tenant;" not in collapsed
+        assert listed[0]["id"] == profile_id and listed[0]["label"] == "POST /v1/ocr/base64"
+        assert session.status_code == 200 and session.headers["X-Profile-Id"]
+        assert missing.status_code == 404
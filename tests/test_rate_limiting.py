@@ -38,7 +38,8 @@ class TestRateLimiting:
         plan = get_plan_from_request(request)
         assert plan == "BASIC"
     
-    def test_check_rate_limit_basic(self):
+    @pytest.mark.asyncio
+    async def test_check_rate_limit_basic(self):
         """Test rate limiting pour plan BASIC"""
         request = Mock()
         request.headers = {"X-RapidAPI-Plan": "BASIC"}
@@ -46,12 +47,13 @@ class TestRateLimiting:
         request.client.host = "127.0.0.1"
         
         # Première requête devrait passer
-        allowed, info = check_rate_limit(request, limit_type="monthly")
+        allowed, info = await check_rate_limit(request, limit_type="monthly")
         assert allowed is True
         assert info["plan"] == "BASIC"
         assert info["limit"] == PLAN_LIMITS["BASIC"]["monthly"]
     
-    def test_check_rate_limit_exceeded(self):
+    @pytest.mark.asyncio
+    async def test_check_rate_limit_exceeded(self):
         """Test dépassement de limite"""
         request = Mock()
         request.headers = {"X-RapidAPI-Plan": "BASIC"}
@@ -61,24 +63,25 @@ class TestRateLimiting:
         # Dépasser la limite mensuelle
         limit = PLAN_LIMITS["BASIC"]["monthly"]
         for _ in range(limit + 1):
-            allowed, info = check_rate_limit(request, limit_type="monthly")
+            allowed, info = await check_rate_limit(request, limit_type="monthly")
         
         assert allowed is False
         assert info["remaining"] == 0
     
-    def test_check_ip_rate_limit(self):
+    @pytest.mark.asyncio
+    async def test_check_ip_rate_limit(self):
         """Test rate limiting par IP"""
         request = Mock()
         request.client = Mock()
         request.client.host = "192.168.1.100"
         
         # Première requête devrait passer
-        allowed, info = check_ip_rate_limit(request)
+        allowed, info = await check_ip_rate_limit(request)
         assert allowed is True
         
         # Dépasser la limite par minute (20 req/min)
         for _ in range(21):
-            allowed, info = check_ip_rate_limit(request)
+            allowed, info = await check_ip_rate_limit(request)
         
         assert allowed is False
 
@@ -86,14 +89,15 @@ class TestRateLimiting:
 class TestRateLimitHeaders:
     """Tests pour les headers de rate limiting"""
     
-    def test_rate_limit_info_structure(self):
+    @pytest.mark.asyncio
+    async def test_rate_limit_info_structure(self):
         """Test structure des infos de rate limiting"""
         request = Mock()
         request.headers = {"X-RapidAPI-Plan": "PRO"}
         request.client = Mock()
         request.client.host = "127.0.0.1"
         
-        allowed, info = check_rate_limit(request, limit_type="monthly")
+        allowed, info = await check_rate_limit(request, limit_type="monthly")
         
         assert "limit" in info
         assert "remaining" in info
@@ -107,3 +111,358 @@ class TestRateLimitHeaders:
 
 
 
+class TestAtomicRateLimit:
+    """Tests pour la vérification atomique de toutes les fenêtres"""
+    
+    @pytest.mark.asyncio
+    async def test_denied_request_consumes_nothing(self):
+        """Test une requête refusée par une fenêtre n'incrémente aucune autre fenêtre"""
+        from rate_limiting import RateWindow, consume_rate_limits
+        
+        windows = [RateWindow("test:atomic:a", 5, 60), RateWindow("test:atomic:b", 2, 60)]
+        results = [await consume_rate_limits(windows) for _ in range(4)]
+        
+        assert [denied for denied, _ in results] == [0, 0, 2, 2]
+        _, states = results[-1]
+        assert [state["count"] for state in states] == [2, 2]
+        assert states[1]["remaining"] == 0
+        assert 0 < states[0]["reset_after"] <= 60
+    
+    @pytest.mark.asyncio
+    async def test_redis_script_is_atomic_and_single_round_trip(self):
+        """Test Redis : un appel de script par requête, aucun incrément perdu sous concurrence"""
+        pytest.importorskip("lupa")
+        import asyncio
+        import rate_limiting
+        import redis_pool
+        from benchmarks.redis_standin import RedisStandIn
+        from rate_limiting import RateWindow, consume_rate_limits
+        
+        standin = RedisStandIn().start()
+        try:
+            rate_limiting.init_rate_limit_redis(standin.url)
+            windows = [RateWindow("client:minute", 30, 60), RateWindow("client:day", 1000, 86400)]
+            await consume_rate_limits(windows)  # Chargement du script (EVALSHA -> EVAL)
+            
+            before = dict(standin.command_counts)
+            results = await asyncio.gather(*(consume_rate_limits(windows) for _ in range(50)))
+            
+            assert standin.command_counts["EVALSHA"] - before["EVALSHA"] == 50
+            assert standin.command_counts.get("GET", 0) == before.get("GET", 0)
+            assert sum(1 for denied, _ in results if not denied) == 29
+            assert standin.data["rate_limit:client:minute"][0] == "30"
+            assert 55 < standin.data["rate_limit:client:day"][1] - __import__("time").monotonic() <= 86400
+        finally:
+            rate_limiting.init_rate_limit_redis(None)
+            rate_limiting._redis_enabled = False
+            await redis_pool.close_redis_pool()
+            standin.stop()
+
+
+class TestMemoryRateLimitStore:
+    """Tests pour le store mémoire (roue temporelle, compteurs compacts)"""
+    
+    def test_timing_wheel_matches_brute_force(self):
+        """Test chaque clé expire exactement à son échéance, y compris après cascade"""
+        import random
+        from rate_limiting import TimingWheel
+        
+        rng = random.Random(7)
+        wheel = TimingWheel(tick=1000)
+        deadlines = {f"k{i}": 1000 + rng.choice([1, 2, 63, 64, 65, 4095, 4096, 5000, 86400, 30 * 86400])
+                     + rng.randint(0, 3) for i in range(300)}
+        for key, deadline in deadlines.items():
+            assert wheel.schedule(key, deadline)
+        
+        fired = {}
+        checkpoints = sorted(set(deadlines.values()) | {1000 + 30 * 86400 + 10})
+        for tick in checkpoints:
+            for key in wheel.advance(tick):
+                fired[key] = tick
+        
+        assert fired == deadlines
+        assert wheel.size == 0
+    
+    def test_expired_counters_are_removed_without_scan(self):
+        """Test les compteurs expirés disparaissent au fil du temps (horloge simulée)"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        now = [0]
+        store = MemoryRateLimitStore(clock=lambda: now[0])
+        for i in range(1000):
+            store.consume([RateWindow(f"ip:{i}:minute", 20, 60), RateWindow(f"ip:{i}:hour", 200, 3600)])
+        assert len(store.counters) == 2000
+        
+        now[0] = 61_000
+        denied, counts, _, _ = store.consume([RateWindow("ip:0:minute", 20, 60)])
+        assert len(store.counters) == 1001  # Fenêtres minute expirées, sauf celle recréée
+        assert (denied, counts) == (0, [1])
+        
+        now[0] = 3_601_000
+        store.consume([RateWindow("ip:new:minute", 20, 60)])
+        assert set(store.counters) == {"ip:new:minute"}
+    
+    def test_bounded_under_ip_flood(self):
+        """Test le nombre de compteurs reste borné face à un flood d'IP distinctes"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        store = MemoryRateLimitStore(max_keys=100, clock=lambda: 0)
+        for i in range(1000):
+            store.consume([RateWindow(f"ip:{i}:day", 1000, 86400)])
+        
+        assert len(store.counters) == 100
+        assert "ip:999:day" in store.counters
+        assert "ip:0:day" not in store.counters
+    
+    def test_ip_flood_does_not_evict_quotas(self):
+        """Test un flood d'IP distinctes n'évince pas les quotas vivants du plan"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        store = MemoryRateLimitStore(max_keys=100, clock=lambda: 0)
+        monthly = RateWindow("api_key:abc:monthly", 1000, 30 * 86400, quota=True)
+        store.consume([monthly], cost=7)
+        for i in range(1000):
+            store.consume([RateWindow(f"ip:{i}:day", 1000, 86400)])
+        
+        assert len(store.counters) == 100
+        assert store.consume([monthly], cost=0)[1] == [7]
+    
+    def test_quota_counters_bounded_under_identifier_flood(self):
+        """Test les quotas restent bornés face à un flood d'identifiants distincts, sans évincer un client actif"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        store = MemoryRateLimitStore(max_quota_keys=100, clock=lambda: 0)
+        active = RateWindow("api_key:active:monthly", 1000, 30 * 86400, quota=True)
+        store.consume([active], cost=5)
+        for i in range(1000):
+            store.consume([RateWindow(f"ip:{i}:monthly", 400, 30 * 86400, quota=True),
+                           RateWindow(f"ip:{i}:daily", 14, 86400, quota=True)])
+            if i % 10 == 0:
+                store.consume([active], cost=0)  # Client actif pendant le flood
+        
+        assert len(store.quota_counters) == 100
+        assert "ip:0:monthly" not in store.quota_counters
+        assert store.consume([active], cost=0)[1] == [5]
+
+
+class TestRateLimitAlgorithms:
+    """Tests pour les algorithmes gcra et fenêtre glissante"""
+    
+    @staticmethod
+    def _edge_client(algorithm: str, limit: int = 10, burst: int = 0):
+        """Client : une requête à 0 s, puis une toutes les 100 ms de 59 s à 61 s (fin de fenêtre)"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        now = [0]
+        store = MemoryRateLimitStore(clock=lambda: now[0])
+        window = RateWindow("client:minute", limit, 60, algorithm, burst)
+        store.consume([window])
+        accepted = 0
+        for now[0] in range(59_000, 61_000, 100):
+            denied, _, _, _ = store.consume([window])
+            accepted += not denied
+        return accepted
+    
+    def test_window_edge_burst(self):
+        """Test la fenêtre fixe accepte ~2x limit en 2 s autour de la réinitialisation, pas gcra ni sliding"""
+        assert self._edge_client("fixed") == 19
+        assert self._edge_client("sliding") == 9
+        assert self._edge_client("gcra", burst=3) == 3
+    
+    def test_gcra_burst_then_smoothed(self):
+        """Test gcra : burst requêtes d'affilée puis une requête par intervalle"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        now = [0]
+        store = MemoryRateLimitStore(clock=lambda: now[0])
+        window = RateWindow("client:minute", 60, 60, "gcra", 5)
+        results = [store.consume([window]) for _ in range(6)]
+        
+        assert [denied for denied, _, _, _ in results] == [0, 0, 0, 0, 0, 1]
+        _, counts, _, retries = results[-1]
+        assert counts == [5]
+        assert retries == [1.0]  # Une requête par seconde (60/min)
+        
+        now[0] = 1000
+        assert store.consume([window])[0] == 0
+        assert store.consume([window])[0] == 1
+    
+    def test_sliding_window_weights_previous_window(self):
+        """Test la fenêtre précédente compte au prorata du temps restant"""
+        from rate_limiting import MemoryRateLimitStore, RateWindow
+        
+        now = [59_000]
+        store = MemoryRateLimitStore(clock=lambda: now[0])
+        window = RateWindow("client:minute", 10, 60, "sliding")
+        assert all(store.consume([window])[0] == 0 for _ in range(10))
+        
+        now[0] = 60_000
+        denied, _, _, [retry_after] = store.consume([window])
+        assert denied == 1
+        assert retry_after == 6.0  # 10 x (54/60) + 1 <= 10
+        
+        now[0] = 90_000  # Fenêtre précédente pondérée à 50 %
+        assert [store.consume([window])[0] for _ in range(6)] == [0, 0, 0, 0, 0, 1]
+    
+    @pytest.mark.asyncio
+    async def test_redis_script_matches_memory_store(self):
+        """Test le script Redis applique les mêmes algorithmes que le store mémoire"""
+        pytest.importorskip("lupa")
+        import rate_limiting
+        import redis_pool
+        from benchmarks.redis_standin import RedisStandIn
+        from rate_limiting import RateWindow, consume_rate_limits
+        
+        standin = RedisStandIn().start()
+        try:
+            rate_limiting.init_rate_limit_redis(standin.url)
+            gcra = [RateWindow("script:gcra", 10, 60, "gcra", 4)]
+            sliding = [RateWindow("script:sliding", 5, 3600, "sliding")]
+            gcra_results = [await consume_rate_limits(gcra) for _ in range(6)]
+            sliding_results = [await consume_rate_limits(sliding) for _ in range(7)]
+            
+            assert [denied for denied, _ in gcra_results] == [0, 0, 0, 0, 1, 1]
+            assert 5 < gcra_results[-1][1][0]["retry_after"] <= 6  # Intervalle de 6 s
+            assert gcra_results[3][1][0]["remaining"] == 0
+            assert [denied for denied, _ in sliding_results] == [0] * 5 + [1, 1]
+            assert any(key.startswith("rate_limit:gcra:") for key in standin.data)
+        finally:
+            rate_limiting.init_rate_limit_redis(None)
+            rate_limiting._redis_enabled = False
+            await redis_pool.close_redis_pool()
+            standin.stop()
+    
+    @pytest.mark.asyncio
+    async def test_middleware_enforces_plan_per_minute_burst(self):
+        """Test le middleware refuse au-delà de la rafale du plan avec Retry-After"""
+        from starlette.requests import Request
+        from starlette.responses import Response
+        from rate_limiting import PLAN_LIMITS, rate_limit_middleware
+        
+        scope = {
+            "type": "http", "method": "POST", "path": "/v1/ocr/upload", "query_string": b"",
+            "headers": [(b"x-rapidapi-plan", b"PRO"), (b"x-rapidapi-proxy-secret", b"burst-test"),
+                        (b"x-rapidapi-user", b"alice")],
+            "client": ("10.9.8.7", 50000), "server": ("test", 80), "scheme": "http",
+        }
+        
+        async def call_next(request):
+            return Response(b"{}")
+        
+        burst = PLAN_LIMITS["PRO"]["burst"]
+        responses = []
+        for i in range(burst + 1):
+            scope["client"] = (f"10.9.8.{i}", 50000)  # Une IP par requête : seule la fenêtre du plan compte
+            responses.append(await rate_limit_middleware(Request(scope), call_next))
+        
+        assert [response.status_code for response in responses] == [200] * burst + [429]
+        assert int(responses[-1].headers["Retry-After"]) == 60 // PLAN_LIMITS["PRO"]["per_minute"]
+        
+        # Autre abonné derrière le même secret de proxy : seau distinct
+        scope["headers"] = scope["headers"][:2] + [(b"x-rapidapi-user", b"bob")]
+        assert (await rate_limit_middleware(Request(scope), call_next)).status_code == 200
+    
+    @pytest.mark.asyncio
+    async def test_per_minute_skipped_without_customer_id(self):
+        """Test sans X-RapidAPI-User, pas de débit par minute du plan (le secret du proxy est commun à tous)"""
+        from starlette.requests import Request
+        from starlette.responses import Response
+        from rate_limiting import PLAN_LIMITS, rate_limit_middleware
+        
+        async def call_next(request):
+            return Response(b"{}")
+        
+        statuses = []
+        for i in range(PLAN_LIMITS["BASIC"]["burst"] + 2):
+            statuses.append((await rate_limit_middleware(Request({
+                "type": "http", "method": "POST", "path": "/v1/ocr/upload", "query_string": b"",
+                "headers": [(b"x-rapidapi-plan", b"BASIC"), (b"x-rapidapi-proxy-secret", b"shared-proxy")],
+                "client": (f"10.9.9.{i}", 50000), "server": ("test", 80), "scheme": "http",
+            }), call_next)).status_code)
+        
+        assert statuses == [200] * len(statuses)
+    
+    def test_plan_burst_covers_per_minute(self):
+        """Test un client qui respecte le débit annoncé du plan n'est jamais refusé par la rafale gcra"""
+        from rate_limiting import PLAN_LIMITS
+        
+        assert all(limits["burst"] >= limits["per_minute"] for limits in PLAN_LIMITS.values())
+
+
+class TestQuotaCost:
+    """Tests pour les quotas pondérés par le coût réel (pages, temps d'OCR)"""
+    
+    @staticmethod
+    def _scope(secret: bytes) -> dict:
+        return {
+            "type": "http", "method": "POST", "path": "/v1/ocr/upload", "query_string": b"",
+            "headers": [(b"x-rapidapi-plan", b"MEGA"), (b"x-rapidapi-proxy-secret", secret)],
+            "client": ("10.1.2.3", 50000), "server": ("test", 80), "scheme": "http",
+        }
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("pages, ocr_seconds, cost", [(0, 0.0, 1), (40, 2.0, 40), (1, 12.0, 3)])
+    async def test_middleware_charges_real_cost(self, pages, ocr_seconds, cost):
+        """Test les quotas mensuel et quotidien sont ajustés au coût de la requête traitée"""
+        from starlette.requests import Request
+        from starlette.responses import Response
+        from rate_limiting import PLAN_LIMITS, rate_limit_middleware, record_ocr_usage
+        
+        async def call_next(request):
+            if pages:
+                record_ocr_usage(pages, ocr_seconds)
+            return Response(b"{}")
+        
+        response = await rate_limit_middleware(Request(self._scope(f"cost-{cost}".encode())), call_next)
+        
+        assert response.headers["X-RateLimit-Cost"] == str(cost)
+        assert int(response.headers["X-RateLimit-Remaining"]) == PLAN_LIMITS["MEGA"]["monthly"] - cost
+        assert int(response.headers["X-RateLimit-Daily-Remaining"]) == PLAN_LIMITS["MEGA"]["daily"] - cost
+    
+    @pytest.mark.asyncio
+    async def test_overdraft_blocks_next_request(self):
+        """Test un gros document peut dépasser le quota restant ; la requête suivante est refusée"""
+        from starlette.requests import Request
+        from starlette.responses import Response
+        from rate_limiting import PLAN_LIMITS, rate_limit_middleware, record_ocr_usage
+        
+        async def big_pdf(request):
+            record_ocr_usage(PLAN_LIMITS["MEGA"]["daily"] + 10, 0.0)
+            return Response(b"{}")
+        
+        first = await rate_limit_middleware(Request(self._scope(b"overdraft")), big_pdf)
+        second = await rate_limit_middleware(Request(self._scope(b"overdraft")), big_pdf)
+        
+        assert first.status_code == 200
+        assert first.headers["X-RateLimit-Daily-Remaining"] == "0"
+        assert second.status_code == 429
+        assert second.body and b"Daily Quota Exceeded" in second.body
+    
+    def test_pdf_pages_charged_and_cache_hit_cheaper(self):
+        """Test un PDF OCRisé coûte ses pages, le même PDF servi depuis le cache une unité"""
+        fitz = pytest.importorskip("fitz")
+        from fastapi.testclient import TestClient
+        import main
+        
+        pdf = fitz.open()
+        for _ in range(4):
+            pdf.new_page().insert_text((72, 72), "FACTURE")
+        data = pdf.tobytes()
+        ocr_result = {"text": "FACTURE", "language": "fra", "data": {}, "pages_processed": 4, "pages_from_cache": 0}
+        
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        with patch.object(main.settings, "debug_mode", True), \
+             patch("main.perform_ocr", return_value=dict(ocr_result)):
+            ocr = client.post("/v1/ocr/upload", files={"file": ("facture.pdf", data, "application/pdf")})
+            hit = client.post("/v1/ocr/upload", files={"file": ("facture.pdf", data, "application/pdf")})
+            quota = client.get("/v1/quota")
+            quota_again = client.get("/v1/quota")
+        
+        assert ocr.status_code == 200 and hit.json()["cached"] is True
+        assert ocr.headers["X-RateLimit-Cost"] == "4"
+        assert hit.headers["X-RateLimit-Cost"] == "1"
+        # La consultation du quota coûte une requête, sans consommer davantage
+        remaining = quota.json()["monthly"]["remaining"]
+        assert remaining == PLAN_LIMITS["MEGA"]["monthly"] - 4 - 1 - 1
+        assert quota_again.json()["monthly"]["remaining"] == remaining - 1
+        assert quota.headers["X-RateLimit-Remaining"] == str(remaining)
@@ -0,0 +1,131 @@
+"""
+Tests pour la déduplication des calculs OCR concurrents (single-flight)
+"""
+
+import pytest
+import asyncio
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import single_flight as run_single_flight, get_inflight_count
+from monitoring import metrics
+
+
+class FakeAsyncRedis:
+    """Client Redis asynchrone minimal (SET NX, GET, DELETE)"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestLocalSingleFlight:
+    """Tests pour la déduplication dans un même worker"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_compute_once(self):
+        """Test plusieurs requêtes concurrentes = un seul calcul"""
+        calls = []
+        coalesced_before = metrics["ocr_coalesced_local"]
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"result": "ok"}
+
+        async def lookup():
+            return None
+
+        with patch("single_flight.get_redis_client", return_value=None):
+            results = await asyncio.gather(*(
+                run_single_flight("hash_a", compute, lookup) for _ in range(5)
+            ))
+
+        assert len(calls) == 1
+        assert all(r == {"result": "ok"} for r in results)
+        assert metrics["ocr_coalesced_local"] - coalesced_before == 4
+        assert get_inflight_count() == 0
+
+    @pytest.mark.asyncio
+    async def test_error_is_shared_and_not_cached(self):
+        """Test une erreur est propagée aux requêtes en attente, puis un nouvel essai recalcule"""
+        calls = []
+
+        async def failing_compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("OCR failed")
+
+        async def lookup():
+            return None
+
+        with patch("single_flight.get_redis_client", return_value=None):
+            results = await asyncio.gather(
+                run_single_flight("hash_b", failing_compute, lookup),
+                run_single_flight("hash_b", failing_compute, lookup),
+                return_exceptions=True
+            )
+            assert all(isinstance(r, ValueError) for r in results)
+            assert len(calls) == 1
+
+            with pytest.raises(ValueError):
+                await run_single_flight("hash_b", failing_compute, lookup)
+            assert len(calls) == 2
+
+
+class TestDistributedSingleFlight:
+    """Tests pour la déduplication entre workers (verrou Redis)"""
+
+    @pytest.mark.asyncio
+    async def test_waits_for_other_worker_result(self):
+        """Test un autre worker détient le verrou : attendre son résultat dans le cache"""
+        redis_client = FakeAsyncRedis()
+        redis_client.data["ocr_lock:hash_c"] = "other-worker"
+        coalesced_before = metrics["ocr_coalesced_distributed"]
+        lookups = []
+
+        async def compute():
+            raise AssertionError("ne doit pas calculer")
+
+        async def lookup():
+            lookups.append(1)
+            return {"result": "from_other_worker"} if len(lookups) >= 2 else None
+
+        with patch("single_flight.get_redis_client", return_value=redis_client), \
+             patch("single_flight.POLL_INTERVAL_SECONDS", 0.001):
+            result = await run_single_flight("hash_c", compute, lookup)
+
+        assert result == {"result": "from_other_worker"}
+        assert metrics["ocr_coalesced_distributed"] - coalesced_before == 1
+
+    @pytest.mark.asyncio
+    async def test_lock_acquired_and_released(self):
+        """Test le verrou est pris pendant le calcul puis libéré"""
+        redis_client = FakeAsyncRedis()
+
+        async def compute():
+            assert "ocr_lock:hash_d" in redis_client.data
+            return {"result": "ok"}
+
+        async def lookup():
+            return None
+
+        with patch("single_flight.get_redis_client", return_value=redis_client):
+            result = await run_single_flight("hash_d", compute, lookup)
+
+        assert result == {"result": "ok"}
+        assert "ocr_lock:hash_d" not in redis_client.data
@@ -0,0 +1,143 @@
+"""
+Tests pour le journal des requêtes lentes (classement par route, fenêtre glissante, journal disque, endpoint admin)
+"""
+
+import io
+import json
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from slow_requests import SlowRequestJournal, get_slow_request_journal, init_slow_request_journal
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    fake = FakeClock()
+    with patch("slow_requests.time", fake):
+        yield fake
+
+
+class TestSlowRequestJournal:
+    """Tests du classement des requêtes lentes"""
+
+    def test_keeps_slowest_per_endpoint(self, clock):
+        """Test seules les N plus lentes de chaque route sont gardées ; la fiche n'est construite que si retenue"""
+        journal = SlowRequestJournal(per_endpoint=3, window_seconds=60)
+        built = []
+
+        def record(i):
+            def build():
+                built.append(i)
+                return {"i": i}
+            return build
+
+        for i, duration in enumerate([0.5, 0.1, 0.9, 0.3, 0.05, 1.2]):
+            journal.offer("/v1/ocr/upload", duration, record(i))
+        journal.offer("/v1/quota", 0.01, record(99))
+
+        slowest = journal.slowest()
+        assert [entry["i"] for entry in slowest["/v1/ocr/upload"]] == [5, 2, 0]
+        assert slowest["/v1/quota"][0]["duration_ms"] == 10.0
+        assert 4 not in built  # Plus rapide que le seuil : aucune fiche construite
+        assert journal.slowest("/v1/ocr/upload", limit=1)["/v1/ocr/upload"][0]["i"] == 5
+
+    def test_rolling_window(self, clock):
+        """Test une requête lente sort du classement après la fenêtre, les plus récentes prennent le relais"""
+        journal = SlowRequestJournal(per_endpoint=1, window_seconds=60)
+        journal.offer("/v1/ocr/upload", 5.0, lambda: {"name": "old"})
+
+        clock.now += 40  # Génération suivante : l'ancienne fiche reste visible
+        journal.offer("/v1/ocr/upload", 1.0, lambda: {"name": "recent"})
+        names = [entry["name"] for entry in journal.slowest(limit=2)["/v1/ocr/upload"]]
+        assert names == ["old", "recent"]
+
+        clock.now += 25  # Plus de 60 s : la fiche lente est périmée
+        assert [entry["name"] for entry in journal.slowest(limit=2)["/v1/ocr/upload"]] == ["recent"]
+
+        clock.now += 200
+        assert journal.slowest() == {}
+
+    def test_on_disk_journal(self, clock, tmp_path):
+        """Test les fiches retenues sont ajoutées au journal JSON lines (thread dédié), renommé au-delà de la taille max"""
+        path = tmp_path / "journal" / "slow.jsonl"
+        journal = SlowRequestJournal(per_endpoint=2, window_seconds=60, journal_path=str(path), journal_max_mb=200 / 1024 / 1024)
+        for i in range(4):
+            journal.offer("/v1/ocr/upload", 1.0 + i, lambda i=i: {"file_hash": f"{i:064x}"})
+        journal.close()  # Fiches écrites par le thread du journal
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        archived = [json.loads(line) for line in (tmp_path / "journal" / "slow.jsonl.1").read_text().splitlines()]
+        assert [entry["file_hash"][-1] for entry in archived + lines] == ["0", "1", "2", "3"]
+
+    def test_disabled(self):
+        """Test SLOW_REQUESTS_PER_ENDPOINT=0 désactive le journal"""
+        init_slow_request_journal(per_endpoint=0)
+        try:
+            assert get_slow_request_journal() is None
+        finally:
+            init_slow_request_journal()
+
+
+def _png(size=(120, 80)) -> bytes:
+    buffer = io.BytesIO()
+    image = Image.new("RGB", size, "white")
+    image.putpixel((7, 5), (1, 2, 3))  # Document propre à ce test (pas de hit laissé par un autre)
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TestSlowRequestEndpoint:
+    """Tests de la description des documents et de /admin/slow-requests"""
+
+    def test_records_document_description(self):
+        """Test la fiche décrit le document (hash, dimensions, langue, prétraitement, cache) sans son contenu"""
+        from fastapi.testclient import TestClient
+        import main
+
+        init_slow_request_journal(per_endpoint=5)
+        client = TestClient(main.app, headers={"X-RapidAPI-Plan": "MEGA"})
+        data = _png()
+        with patch.object(main.settings, "debug_mode", True), \
+             patch.object(main.settings, "admin_api_key", "admin"), \
+             patch.multiple(
+                 "main.pytesseract",
+                 get_tesseract_version=lambda: "5.3",
+                 get_languages=lambda: ["eng", "fra"],
+                 image_to_string=lambda *args, **kwargs: "FACTURE\nTotal TTC: 100,00",
+                 image_to_data=lambda *args, **kwargs: {"text": [], "conf": []},
+             ):
+            for _ in range(2):
+                response = client.post("/v1/ocr/upload", files={"file": ("slow.png", data, "image/png")}, data={"language": "fra"})
+                assert response.status_code == 200
+            assert client.get("/admin/slow-requests").status_code == 403
+            report = client.get("/admin/slow-requests", params={"endpoint": "/v1/ocr/upload"}, headers={"X-Admin-Key": "admin"}).json()
+        init_slow_request_journal()
+
+        records = report["endpoints"]["/v1/ocr/upload"]
+        by_cache = {record["documents"][0]["cache"]: record for record in records}
+        computed = by_cache["miss"]["documents"][0]
+        assert computed["file_hash"] == main.get_file_hash(data)
+        assert computed["size_bytes"] == len(data)
+        assert computed["dimensions"] == [[120, 80]]
+        assert computed["language"] == "fra" and computed["ocr_language"] == "fra" and computed["pages"] == 1
+        assert computed["preprocessing"]["applied"] is True
+        assert "tesseract" in by_cache["miss"]["stages_ms"]
+        assert by_cache["exact"]["status_code"] == 200 and by_cache["exact"]["plan"] == "MEGA"
+        assert "slow.png" not in json.dumps(report)
@@ -0,0 +1,81 @@
+"""
+Tests pour la lecture des uploads sans copie (hash, mmap du fichier temporaire de Starlette)
+"""
+
+import pytest
+import io
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+from PIL import Image
+from starlette.datastructures import UploadFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_spool import open_buffer, spool_upload
+from main import get_file_hash
+
+
+def _upload(data: bytes, max_size: int = 1024 * 1024) -> UploadFile:
+    """Upload tel que Starlette le reçoit : fichier temporaire en mémoire puis sur disque au-delà de max_size"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="facture.pdf")
+
+
+class TestSpoolUpload:
+    """Tests pour spool_upload"""
+
+    @pytest.mark.asyncio
+    async def test_small_upload_stays_in_memory(self):
+        """Test un petit fichier reste en mémoire avec le même hash"""
+        data = b"FACTURE" * 100
+        upload = await spool_upload(_upload(data))
+
+        assert upload.file_hash == get_file_hash(data)
+        assert not upload.on_disk
+        assert upload.data == data
+        upload.close()
+
+    @pytest.mark.asyncio
+    async def test_large_upload_is_mapped_in_place(self):
+        """Test un gros fichier est mappé depuis le fichier de Starlette, sans second fichier temporaire"""
+        data = os.urandom(300 * 1024)
+        upload_file = _upload(data, max_size=100 * 1024)  # Déjà sur disque, comme chez Starlette
+
+        with patch("tempfile.TemporaryFile", side_effect=AssertionError("seconde copie sur disque")):
+            with await spool_upload(upload_file, max_memory=100 * 1024) as upload:
+                assert upload.on_disk
+                assert upload.size == len(data)
+                assert upload.file_hash == get_file_hash(data)
+                assert isinstance(upload.data, memoryview)
+                assert upload.data.tobytes() == data
+
+    @pytest.mark.asyncio
+    async def test_mapped_image_opened_without_copy(self):
+        """Test PIL lit une image directement depuis le fichier mappé"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 300), "white").save(buffer, format="BMP")  # Non compressé : > max_memory
+        data = buffer.getvalue()
+
+        with await spool_upload(_upload(data, max_size=1024), max_memory=1024) as upload:
+            assert upload.on_disk
+            image = Image.open(open_buffer(upload.data))
+            image.load()
+            assert image.size == (400, 300)
+
+    @pytest.mark.asyncio
+    async def test_mapped_pdf_is_readable_by_renderer(self):
+        """Test PyMuPDF ouvre le PDF directement depuis le fichier mappé"""
+        fitz = pytest.importorskip("fitz")
+        pdf = fitz.open()
+        for _ in range(3):
+            pdf.new_page().insert_text((72, 72), "FACTURE N 2024-001")
+        data = pdf.tobytes()
+
+        with await spool_upload(_upload(data, max_size=1024), max_memory=1024) as upload:
+            with fitz.open(stream=upload.data, filetype="pdf") as document:
+                assert len(document) == 3
+                assert "FACTURE" in document[0].get_text()
@@ -0,0 +1,120 @@
+"""
+Accès aux uploads sans copie : SHA256 et fichier mappé en mémoire
+
+Starlette a déjà écrit le corps de l'upload dans UploadFile.file (fichier
+temporaire « spooled », sur disque au-delà de 1 Mo). Le contenu est lu sur
+place : un petit upload en un seul bytes, un gros mappé (mmap) depuis ce même
+fichier et haché dans un thread. Un PDF de plusieurs dizaines de Mo n'est ni
+recopié sur disque ni chargé en un seul objet bytes : le rendu PDF et l'OCR
+lisent le mapping.
+"""
+
+import asyncio
+import hashlib
+import io
+import mmap
+import os
+from typing import BinaryIO, Optional, Union
+
+from fastapi import UploadFile
+
+UPLOAD_SPOOL_MAX_MEMORY = 1024 * 1024  # Au-delà, l'upload est mappé depuis le fichier temporaire de Starlette
+
+
+class SpooledUpload:
+    """Contenu d'un upload : hash SHA256 et accès en lecture sans copie"""
+
+    def __init__(self, data: Union[bytes, memoryview], file_hash: str, mapping: Optional[mmap.mmap] = None):
+        self.size = len(data)
+        self.file_hash = file_hash  # Même valeur que get_file_hash
+        self._data = data
+        self._mmap = mapping
+
+    @property
+    def data(self) -> Union[bytes, memoryview]:
+        """
+        Contenu en lecture seule : bytes pour un petit upload, sinon vue sur le
+        fichier temporaire mappé en mémoire (acceptée par PyMuPDF, et par PIL via open_buffer)
+        """
+        return self._data
+
+    @property
+    def on_disk(self) -> bool:
+        return self._mmap is not None
+
+    def close(self):
+        """
+        Lâche le contenu ; le mapping est libéré avec sa dernière référence
+        (un OCR partagé via single-flight peut encore le lire)
+        """
+        self._data = b""
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _BufferReader(io.RawIOBase):
+    """Fichier en lecture seule sur une vue mémoire (io.BytesIO recopierait la vue)"""
+
+    def __init__(self, data: Union[bytes, memoryview]):
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = max(0, min(len(buffer), len(self._view) - self._position))
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def open_buffer(data: Union[bytes, memoryview]) -> BinaryIO:
+    """Fichier en lecture sur un contenu (bytes ou vue mappée), sans le recopier"""
+    if isinstance(data, bytes):
+        return io.BytesIO(data)  # Partage le bytes tant qu'il n'est pas modifié
+    return _BufferReader(data)
+
+
+async def spool_upload(file: UploadFile, max_memory: int = UPLOAD_SPOOL_MAX_MEMORY) -> SpooledUpload:
+    """
+    Hache l'upload reçu par Starlette et le rend lisible sans copie
+
+    Returns:
+        SpooledUpload à fermer après usage (utilisable comme context manager)
+    """
+    raw = file.file
+    raw.seek(0, os.SEEK_END)
+    size = raw.tell()
+    raw.seek(0)
+
+    if size > max_memory:
+        try:
+            raw.flush()
+            fileno = raw.fileno()  # Fichier temporaire de Starlette (bascule sur disque si encore en mémoire)
+        except (OSError, io.UnsupportedOperation):
+            fileno = None
+        if fileno is not None:
+            mapping = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            view = memoryview(mapping)
+            sha256 = await asyncio.to_thread(hashlib.sha256, view)  # hashlib libère le GIL
+            return SpooledUpload(view, sha256.hexdigest(), mapping)
+
+    data = await file.read()
+    return SpooledUpload(data, hashlib.sha256(data).hexdigest())